@@ -1,29 +1,91 @@
+import asyncio
+import contextlib
+import hashlib
+import heapq
 import json
 import logging
+import re
+from collections import Counter
 from datetime import datetime, timedelta
-from openai import AsyncOpenAI
-from config import OPENAI_API_KEY, INTELLIGENCE_MAX_INPUT_ITEMS, INTELLIGENCE_LOOKBACK_DAYS, INTELLIGENCE_MAX_TOKENS
+from openai import AsyncOpenAI, RateLimitError
+import db
+import llm_batch
+import llm_router
+import triage
+import clustering
+import costs
+import ranking
+from scrapers import images
+from config import (
+    OPENAI_API_KEY, INTELLIGENCE_MAX_INPUT_ITEMS, INTELLIGENCE_LOOKBACK_DAYS, INTELLIGENCE_MAX_TOKENS,
+    ANALYSIS_BATCH_INPUT_TOKENS, ANALYSIS_OUTPUT_TOKENS_PER_ITEM, ANALYSIS_MAX_OUTPUT_TOKENS,
+    OPENAI_BATCH_MODE, ANALYSIS_RETRY_DEPTH, IMAGE_HASH_MAX_DISTANCE, NARRATIVE_STALE_DAYS,
+    INTELLIGENCE_CLUSTER_THRESHOLD, INTELLIGENCE_CANDIDATE_ITEMS, INTELLIGENCE_DIGEST_TOKENS, ALERT_INPUT_TOKENS,
+)
+from llm_governor import governor, estimate_messages, estimate_tokens
 
 log = logging.getLogger("agentradar")
 
 client = AsyncOpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
 
-SYSTEM_PROMPT_TEMPLATE = """Eres un analista OSINT especializado en futbol profesional.
-Estas analizando contenido sobre el jugador: {player_name} (club: {club}).
 
-Analiza los siguientes items y para CADA UNO devuelve un JSON con:
+async def _chat(task, **kwargs):
+    """Every GPT call goes through here: the model comes from the task's route
+    (llm_router) unless given, and the call is queued on the Batch API inside
+    a scheduled_batch() block, otherwise sent directly."""
+    kwargs.setdefault("model", llm_router.model_for(task))
+    kwargs["model"] = await costs.admit(task, kwargs["model"])  # may downgrade or raise BudgetExceeded
+    collector = llm_batch.current()
+    with llm_router.timed(task, kwargs["model"]) as t:
+        if collector is not None:
+            response = await collector.submit(kwargs)
+        else:
+            response = await _chat_direct(**kwargs)
+        t.usage = response.usage
+    await costs.record_llm(task, kwargs["model"], response.usage, batch=collector is not None)
+    return response
+
+
+def scheduled_batch(label):
+    """Batch API block for a scheduled job (a no-op unless OPENAI_BATCH_MODE)."""
+    if OPENAI_BATCH_MODE and client:
+        return llm_batch.batch_mode(client, _chat_direct, label)
+    return contextlib.nullcontext()
+
+
+async def _chat_direct(**kwargs):
+    """client.chat.completions.create() under the shared rate governor."""
+    estimate = estimate_messages(kwargs["messages"]) + kwargs.get("max_tokens", 1000)
+    async with governor.lease(estimate) as lease:
+        try:
+            response = await client.chat.completions.create(**kwargs)
+        except RateLimitError as e:
+            retry_after = e.response.headers.get("retry-after", "") if e.response is not None else ""
+            governor.backoff(float(retry_after) if retry_after.replace(".", "", 1).isdigit() else 20)
+            raise
+        if response.usage:
+            lease.used = response.usage.total_tokens
+    return response
+
+# Static on purpose: the player, club and items go in the user message, so
+# every call shares this prefix and OpenAI's prompt cache can serve it
+SYSTEM_PROMPT = """Eres un analista OSINT especializado en futbol profesional.
+El mensaje del usuario indica el JUGADOR analizado (nombre exacto y club) y despues los ITEMS numerados.
+
+Analiza los items y para CADA UNO devuelve un JSON con:
 - relevant: true si el item trata sobre ESTE jugador especifico, false si es sobre otra persona con nombre similar o no tiene relacion
 - sentiment: numero de -1.0 (muy negativo) a 1.0 (muy positivo). Pon 0 si relevant es false.
 - sentiment_label: "positivo", "neutro", o "negativo"
 - topics: lista de temas detectados. Usa SOLO estos valores:
   fichaje, rendimiento, lesion, vida_personal, polemica, sponsors, aficion, entrenador, seleccion, tactica, cantera, economia, otro
 - brands: lista de marcas/sponsors mencionados (Nike, Adidas, Puma, etc). Array vacio si no hay ninguna.
+- confidence: numero de 0.0 a 1.0, tu seguridad en relevant y sentiment_label (baja si el item es ambiguo, ironico o le falta contexto)
 
 REGLAS DE RELEVANCIA (SE ESTRICTO):
-- El item DEBE mencionar a {player_name} de forma clara y directa para ser relevant
-- Si el item es sobre el CLUB ({club}) en general sin mencionar al jugador por nombre = NOT relevant
+- El item DEBE mencionar al JUGADOR de forma clara y directa para ser relevant
+- Si el item es sobre el CLUB del jugador en general sin mencionar al jugador por nombre = NOT relevant
 - Jugadores con nombre similar pero de otro equipo = NOT relevant (ej: "Juan Antonio Casas" != "Antonio Casas")
-- NOMBRE EXACTO: El jugador se llama "{player_name}". Si un articulo menciona a una persona con nombre SIMILAR pero diferente (ej: "Juan Antonio Casas" cuando buscas "Antonio Casas"), marca relevance: "no".
+- NOMBRE EXACTO: Usa el nombre exacto indicado en JUGADOR. Si un articulo menciona a una persona con nombre SIMILAR pero diferente (ej: "Juan Antonio Casas" cuando buscas "Antonio Casas"), marca relevance: "no".
 - Noticias genericas del equipo (resultados, fichajes de OTROS jugadores, ruedas de prensa genericas) = NOT relevant
 - Videos/posts de highlights del equipo que no mencionan al jugador = NOT relevant
 - MULTI-IDIOMA: Los items pueden estar en espanol, ingles, italiano, arabe, frances o aleman. Analiza el contenido en SU idioma original pero responde siempre en espanol.
@@ -39,85 +101,262 @@ REGLAS DE SENTIMIENTO:
 - Victorias, goles, buenas actuaciones = "positivo"
 
 Responde UNICAMENTE con un JSON array. Sin texto extra. Ejemplo:
-[{{"relevant": true, "sentiment": 0.3, "sentiment_label": "positivo", "topics": ["rendimiento"], "brands": []}}, {{"relevant": false, "sentiment": 0, "sentiment_label": "neutro", "topics": [], "brands": []}}]"""
+[{"relevant": true, "sentiment": 0.3, "sentiment_label": "positivo", "topics": ["rendimiento"], "brands": [], "confidence": 0.9}, {"relevant": false, "sentiment": 0, "sentiment_label": "neutro", "topics": [], "brands": [], "confidence": 0.8}]"""
 
 
-async def analyze_batch(items, batch_size=30, player_name="", club=""):
-    if not client or not items:
-        for item in items:
-            item["sentiment"] = 0
-            item["sentiment_label"] = "neutro"
-            item["topics"] = []
-            item["brands"] = []
-        return items
+# Bump when SYSTEM_PROMPT or the item format in analyze_batch changes,
+# so cached analyses made with the old prompt are no longer served
+PROMPT_VERSION = "batch-v3"
+# Cached verdicts come from the small -> large cascade (llm_router)
+ANALYSIS_MODEL = f"{llm_router.model_for('sentiment')}>{llm_router.model_for('sentiment_escalation')}"
 
-    system_prompt = SYSTEM_PROMPT_TEMPLATE.format(
-        player_name=player_name or "desconocido",
-        club=club or "desconocido",
-    )
+# Process-lifetime analysis cache counters (GET /api/analysis/cache)
+analysis_cache_stats = {"items": 0, "hits": 0, "deduped": 0, "analyzed": 0, "saved": 0,
+                        "salvaged": 0, "retried": 0, "escalated": 0,
+                        "images": 0, "image_hits": 0, "image_deduped": 0, "images_analyzed": 0}
 
-    results = []
-    filtered_out = 0
+# Same for the Vision prompt in analyze_images (image_analysis_cache)
+IMAGE_PROMPT_VERSION = "vision-v2"
+VISION_SYSTEM_PROMPT = """Analiza esta imagen relacionada con el futbolista indicado en el contexto. Responde en JSON con: {"brands": [marcas visibles], "context": "descripcion breve del contexto (entrenamiento, fiesta, evento, etc)", "people_count": N, "mood": "positivo/neutro/negativo", "risk_flag": "none/low/medium/high", "risk_detail": "detalle si hay riesgo"}. Si no puedes analizar la imagen, devuelve {"error": "no disponible"}."""
 
-    for i in range(0, len(items), batch_size):
-        batch = items[i : i + batch_size]
+_RT_RE = re.compile(r"^rt @\w+:\s*")
+_URL_RE = re.compile(r"https?://\S+")
 
-        texts = []
-        for j, item in enumerate(batch):
-            text = item.get("title") or item.get("text") or ""
-            source = item.get("source") or item.get("platform") or ""
-            full_text = item.get("full_text", "")
-            if full_text:
-                texts.append(f"[{j}] ({source}) {text[:200]}\n{full_text[:500]}")
-            else:
-                texts.append(f"[{j}] ({source}) {text[:300]}")
 
-        prompt = "\n".join(texts)
+class JsonArrayStream:
+    """Incremental, tolerant parser for a JSON array of objects.
 
+    feed() text as it arrives and get back the elements completed so far. An
+    element that does not parse yields None in its slot (so positions stay
+    aligned with the prompt items) and parsing resumes at the next object. A
+    truncated tail simply never completes.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = None  # index after "[" once found
+        self._decoder = json.JSONDecoder()
+        self.done = False
+
+    def feed(self, chunk):
+        self._buf += chunk
+        out = []
+        if self._pos is None:
+            start = self._buf.find("[")
+            if start < 0:
+                return out
+            self._pos = start + 1
+        buf = self._buf
+        while not self.done:
+            pos = self._pos
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buf):
+                break
+            if buf[pos] == "]":
+                self.done = True
+                break
+            try:
+                value, end = self._decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # Either incomplete (wait for more) or malformed (skip to the next object)
+                next_obj = buf.find("{", pos + 1)
+                if next_obj < 0 or "}" not in buf[pos:next_obj]:
+                    break
+                out.append(None)
+                self._pos = next_obj
+                continue
+            out.append(value)
+            self._pos = end
+        return out
+
+
+def salvage_json_array(text):
+    """Every complete element of a possibly fenced, truncated or damaged JSON array."""
+    return JsonArrayStream().feed(text)
+
+
+def _normalize(text):
+    text = _URL_RE.sub(" ", text.lower())
+    return " ".join(_RT_RE.sub("", text.strip()).split())
+
+
+def content_hash(item):
+    """Hash of the text analyze_batch sends for an item, normalized so reposts,
+    retweets and the same article found by two sources share it."""
+    text = item.get("title") or item.get("text") or ""
+    full_text = item.get("full_text", "")
+    normalized = _normalize(text[:300]) + "\n" + _normalize(full_text[:500])
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def _neutral(item):
+    item["sentiment"] = 0
+    item["sentiment_label"] = "neutro"
+    item["topics"] = []
+    item["brands"] = []
+
+
+def _item_prompt_line(item):
+    text = item.get("title") or item.get("text") or ""
+    source = item.get("source") or item.get("platform") or ""
+    full_text = item.get("full_text", "")
+    if full_text:
+        return f"({source}) {text[:200]}\n{full_text[:500]}"
+    return f"({source}) {text[:300]}"
+
+
+def plan_batches(lines, max_items=60, input_budget=ANALYSIS_BATCH_INPUT_TOKENS):
+    """Pack prompt lines into batches of indexes, each within input_budget
+    estimated tokens, max_items items and the output allowance of
+    ANALYSIS_MAX_OUTPUT_TOKENS. Keeps the input order."""
+    max_items = min(max_items, (ANALYSIS_MAX_OUTPUT_TOKENS - 100) // ANALYSIS_OUTPUT_TOKENS_PER_ITEM)
+    batches = []
+    current, used = [], 0
+    for i, line in enumerate(lines):
+        cost = estimate_tokens(line) + 4  # "[j] " prefix and newline
+        if current and (used + cost > input_budget or len(current) >= max_items):
+            batches.append(current)
+            current, used = [], 0
+        current.append(i)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def analyze_batch(items, batch_size=60, player_name="", club=""):
+    """Sentiment/topics/brands for items; irrelevant items are dropped.
+
+    Analyses are cached per (content hash, player, PROMPT_VERSION, model), so
+    content already analyzed for this player - in another scan, a failed scan
+    or earlier in this same list - is not sent to GPT again. The local triage
+    model then settles confident irrelevant/neutral items. The rest is packed
+    into token-budgeted batches (plan_batches) that run concurrently under the
+    shared rate governor, first on the small model; unsure or high-stakes
+    verdicts are escalated to the large one (llm_router).
+    """
+    if not client or not items:
+        for item in items:
+            _neutral(item)
+        return items
+
+    player_header = f'JUGADOR: "{player_name or "desconocido"}" (club: {club or "desconocido"})\n\nITEMS:\n'
+    player_key = f"{player_name}|{club}"
+
+    hashes = [content_hash(item) for item in items]
+    analyses = await db.get_cached_analyses(hashes, player_key, PROMPT_VERSION, ANALYSIS_MODEL)
+    # One GPT slot per distinct uncached content
+    pending = {}
+    for h, item in zip(hashes, items):
+        if h not in analyses:
+            pending.setdefault(h, item)
+    lines = {h: _item_prompt_line(item) for h, item in pending.items()}
+
+    # Local triage: confident irrelevant / neutral items never reach GPT
+    local = triage.classify(lines, player_name, club)
+    analyses.update(local)
+    pending_hashes = [h for h in pending if h not in local]
+
+    hits = sum(1 for h in hashes if h in analyses and h not in local)
+    analysis_cache_stats["items"] += len(items)
+    analysis_cache_stats["hits"] += hits
+    analysis_cache_stats["deduped"] += len(items) - hits - len(pending)
+    analysis_cache_stats["analyzed"] += len(pending_hashes)
+    if hits:
+        log.info(f"[analyzer] Cache: {hits}/{len(items)} items already analyzed for {player_name}")
+
+    batches = plan_batches([lines[h] for h in pending_hashes], max_items=batch_size)
+    if len(batches) > 1:
+        log.info(f"[analyzer] {len(pending_hashes)} items for {player_name} in {len(batches)} concurrent batches")
+
+    async def run(batch_hashes, depth=0, task="sentiment"):
+        prompt = player_header + "\n".join(
+            f"[{j}] {lines[h]}" for j, h in enumerate(batch_hashes)
+        )
+        model = llm_router.model_for(task)
         try:
-            response = await client.chat.completions.create(
-                model="gpt-4o",
+            response = await _chat(
+                task,
                 messages=[
-                    {"role": "system", "content": system_prompt},
+                    {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": prompt},
                 ],
                 temperature=0.1,
-                max_tokens=4000,
+                max_tokens=min(ANALYSIS_MAX_OUTPUT_TOKENS, 100 + ANALYSIS_OUTPUT_TOKENS_PER_ITEM * len(batch_hashes)),
             )
-
-            content = response.choices[0].message.content.strip()
-            if content.startswith("```"):
-                content = content.split("\n", 1)[1]
-                content = content.rsplit("```", 1)[0]
-
-            analysis = json.loads(content)
-
-            for j, item in enumerate(batch):
-                if j < len(analysis):
-                    a = analysis[j]
-                    # Filter out irrelevant items
-                    if not a.get("relevant", True):
-                        filtered_out += 1
-                        continue
-                    item["sentiment"] = a.get("sentiment", 0)
-                    item["sentiment_label"] = a.get("sentiment_label", "neutro")
-                    item["topics"] = a.get("topics", [])
-                    item["brands"] = a.get("brands", [])
-                else:
-                    item["sentiment"] = 0
-                    item["sentiment_label"] = "neutro"
-                    item["topics"] = []
-                    item["brands"] = []
-                results.append(item)
-
         except Exception as e:
-            print(f"[analyzer] GPT-4o batch error: {e}")
-            for item in batch:
-                item["sentiment"] = 0
-                item["sentiment_label"] = "neutro"
-                item["topics"] = []
-                item["brands"] = []
-                results.append(item)
+            # Not cached: these items are analyzed again on the next scan
+            print(f"[analyzer] {model} batch error: {e}")
+            return
+
+        # Keep every complete element even if the array is cut short or has a bad one
+        choice = response.choices[0]
+        analysis = salvage_json_array(choice.message.content or "")
+        fresh = {
+            h: {
+                "relevant": bool(a.get("relevant", True)),
+                "sentiment": a.get("sentiment", 0),
+                "sentiment_label": a.get("sentiment_label", "neutro"),
+                "topics": a.get("topics", []),
+                "brands": a.get("brands", []),
+                "confidence": a.get("confidence"),
+                "model": model,
+            }
+            for h, a in zip(batch_hashes, analysis) if isinstance(a, dict)
+        }
+        # Cascade: unsure or high-stakes small-model verdicts are asked again on
+        # the large model; until then (or if that fails) they stand uncached
+        escalate = [h for h in fresh if task == "sentiment" and llm_router.needs_escalation(fresh[h])]
+        llm_router.record_items(task, model, len(fresh), len(escalate))
+        settled = {h: a for h, a in fresh.items() if h not in escalate}
+        if settled:
+            await db.save_analyses(settled, player_key, PROMPT_VERSION, ANALYSIS_MODEL,
+                                   texts={h: lines[h] for h in settled})
+            analysis_cache_stats["saved"] += len(settled)
+        analyses.update(fresh)
+        if escalate:
+            analysis_cache_stats["escalated"] += len(escalate)
+            await asyncio.gather(*[
+                run([escalate[k] for k in b], depth, "sentiment_escalation")
+                for b in plan_batches([lines[h] for h in escalate], max_items=batch_size)
+            ])
+
+        missing = [h for h in batch_hashes if h not in fresh]
+        if not missing:
+            return
+        analysis_cache_stats["salvaged"] += len(fresh)
+        if depth >= ANALYSIS_RETRY_DEPTH:
+            log.warning(f"[analyzer] {len(missing)} items unanalyzed after {depth} retries")
+            return
+        log.warning(f"[analyzer] Batch of {len(batch_hashes)}: {len(fresh)} parsed, retrying {len(missing)} "
+                    f"(finish_reason={choice.finish_reason})")
+        analysis_cache_stats["retried"] += len(missing)
+        if fresh or len(missing) == 1:
+            await run(missing, depth + 1, task)
+        else:
+            # Nothing usable came back: split so one bad item can't sink the rest
+            half = len(missing) // 2
+            await asyncio.gather(run(missing[:half], depth + 1, task), run(missing[half:], depth + 1, task))
+
+    await asyncio.gather(*[run([pending_hashes[k] for k in b]) for b in batches])
+
+    results = []
+    filtered_out = 0
+    for h, item in zip(hashes, items):
+        a = analyses.get(h)
+        if a is None:
+            _neutral(item)
+        elif not a.get("relevant", True):
+            # Filter out irrelevant items
+            filtered_out += 1
+            continue
+        else:
+            item["sentiment"] = a.get("sentiment", 0)
+            item["sentiment_label"] = a.get("sentiment_label", "neutro")
+            item["topics"] = a.get("topics", [])
+            item["brands"] = a.get("brands", [])
+        results.append(item)
 
     if filtered_out:
         print(f"[analyzer] Filtered {filtered_out} irrelevant items (kept {len(results)})")
@@ -167,8 +406,8 @@ Datos del escaneo:
 Responde en espanol, tono profesional y directo. Si hay comparacion con escaneo anterior, menciona los cambios relevantes."""
 
     try:
-        response = await client.chat.completions.create(
-            model="gpt-4o",
+        response = await _chat(
+            "executive_summary",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.3,
             max_tokens=400,
@@ -224,8 +463,8 @@ Responde en JSON con esta estructura exacta:
 Tono profesional de agencia de representacion deportiva. En espanol."""
 
     try:
-        response = await client.chat.completions.create(
-            model="gpt-4o",
+        response = await _chat(
+            "weekly_report",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.3,
             max_tokens=800,
@@ -258,6 +497,12 @@ async def analyze_images(items, player_name="", max_images=10):
     """Analyze images from player posts and high-engagement mentions with GPT-4o Vision.
     Extracts: visible brands, context/location, people, mood, potential risks.
     Only processes items that have image URLs.
+
+    Images are downloaded and downscaled locally first (scrapers/images.py).
+    Reposts of the same photo, in this scan or any earlier one, share one
+    analysis: near-identical perceptual hashes are looked up in
+    image_analysis_cache and deduplicated within the scan, and only the
+    remaining images go to Vision, concurrently under the rate governor.
     """
     if not client or not items:
         return items
@@ -276,16 +521,39 @@ async def analyze_images(items, player_name="", max_images=10):
     image_items.sort(key=lambda x: (x[0].get("likes", 0) or 0) + (x[0].get("views", 0) or 0), reverse=True)
     image_items = image_items[:max_images]
 
-    log.info(f"[analyzer] Analyzing {len(image_items)} images with GPT-4o Vision")
+    prepared = await images.fetch_and_prepare(list(dict.fromkeys(url for _, url in image_items)))
+    cached = await db.find_image_analyses(
+        [h for h, _ in prepared.values()], IMAGE_PROMPT_VERSION, IMAGE_HASH_MAX_DISTANCE,
+    )
 
-    for item, img_url in image_items:
+    # Group items by image: same hash or within IMAGE_HASH_MAX_DISTANCE of a
+    # group already seen; images that could not be fetched are keyed by URL
+    groups = {}  # key -> [(item, url)]
+    for item, url in image_items:
+        image_hash = prepared[url][0] if url in prepared else None
+        key = image_hash or f"url:{url}"
+        if image_hash and key not in groups and not image_hash.startswith("sha1:"):
+            key = next((k for k in groups if not k.startswith(("url:", "sha1:"))
+                        and images.hamming(k, image_hash) <= IMAGE_HASH_MAX_DISTANCE), key)
+        groups.setdefault(key, []).append((item, url))
+
+    pending = {k: g for k, g in groups.items() if k not in cached}
+    analysis_cache_stats["images"] += len(image_items)
+    analysis_cache_stats["image_hits"] += sum(len(g) for k, g in groups.items() if k in cached)
+    analysis_cache_stats["image_deduped"] += sum(len(g) - 1 for g in pending.values())
+    analysis_cache_stats["images_analyzed"] += len(pending)
+    log.info(f"[analyzer] Analyzing {len(pending)} images with GPT-4o Vision "
+             f"({len(image_items) - len(pending)} reused)")
+
+    async def vision(item, url):
+        data_url = prepared.get(url, (None, None))[1]
         try:
-            response = await client.chat.completions.create(
-                model="gpt-4o",
+            response = await _chat(
+                "vision",
                 messages=[
-                    {"role": "system", "content": f"Analiza esta imagen relacionada con el futbolista {player_name}. Responde en JSON con: {{\"brands\": [marcas visibles], \"context\": \"descripcion breve del contexto (entrenamiento, fiesta, evento, etc)\", \"people_count\": N, \"mood\": \"positivo/neutro/negativo\", \"risk_flag\": \"none/low/medium/high\", \"risk_detail\": \"detalle si hay riesgo\"}}. Si no puedes analizar la imagen, devuelve {{\"error\": \"no disponible\"}}."},
+                    {"role": "system", "content": VISION_SYSTEM_PROMPT},
                     {"role": "user", "content": [
-                        {"type": "image_url", "image_url": {"url": img_url, "detail": "low"}},
+                        {"type": "image_url", "image_url": {"url": data_url or url, "detail": "low"}},
                         {"type": "text", "text": f"Contexto: Post de {player_name}. Texto: {(item.get('text', '') or '')[:200]}"},
                     ]},
                 ],
@@ -298,14 +566,28 @@ async def analyze_images(items, player_name="", max_images=10):
                 content = content.rsplit("```", 1)[0]
             analysis = json.loads(content)
             if "error" not in analysis:
-                item["image_analysis"] = analysis
-                # Merge detected brands into item brands
-                if analysis.get("brands"):
-                    existing_brands = item.get("brands", [])
-                    item["brands"] = list(set(existing_brands + analysis["brands"]))
                 log.info(f"[analyzer] Image analysis: {analysis.get('context', '?')}, brands={analysis.get('brands', [])}")
+                return analysis
         except Exception as e:
             log.warning(f"[analyzer] Image analysis error: {e}")
+        return None
+
+    keys = list(pending)
+    fresh = dict(zip(keys, await asyncio.gather(*[vision(*pending[k][0]) for k in keys])))
+    fresh = {k: a for k, a in fresh.items() if a is not None}
+    await db.save_image_analyses({k: a for k, a in fresh.items() if not k.startswith("url:")},
+                                 IMAGE_PROMPT_VERSION)
+
+    for key, group in groups.items():
+        analysis = cached.get(key) or fresh.get(key)
+        if not analysis:
+            continue
+        for item, _ in group:
+            item["image_analysis"] = analysis
+            # Merge detected brands into item brands
+            if analysis.get("brands"):
+                existing_brands = item.get("brands", [])
+                item["brands"] = list(set(existing_brands + analysis["brands"]))
 
     return items
 
@@ -314,12 +596,17 @@ async def analyze_alert_content(alert_type, items, player_name, max_items=5):
     """Generate a brief GPT analysis of WHY this alert matters — reads actual article content."""
     if not client or not items:
         return None
-    texts = []
-    for item in items[:max_items]:
+
+    def source_text(item):
         title = item.get("title", "") or item.get("text", "")
         content = item.get("full_text", "") or item.get("summary", "") or ""
         source = item.get("source", "") or item.get("platform", "")
-        texts.append(f"[{source}] {title[:200]}\n{content[:600]}")
+        return f"[{source}] {title[:200]}\n{content[:600]}"
+
+    # Most informative sources first (ranking.py), within ALERT_INPUT_TOKENS
+    items = ranking.select(items, ALERT_INPUT_TOKENS, cost=lambda i: estimate_tokens(source_text(i)),
+                           max_items=max_items)
+    texts = [source_text(item) for item in items]
 
     prompt = f"""Analiza brevemente estas {len(texts)} fuentes sobre {player_name} y explica en 2-3 frases:
 1. De que tratan exactamente (tema principal)
@@ -332,8 +619,8 @@ Fuentes:
 Responde en espanol, tono directo y profesional. Solo 2-3 frases, sin bullet points."""
 
     try:
-        response = await client.chat.completions.create(
-            model="gpt-4o",
+        response = await _chat(
+            "alert",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.2,
             max_tokens=350,
@@ -380,8 +667,10 @@ def extract_topics_and_brands(all_items):
 
 # ── Intelligence / Early Detection ──
 
-INTELLIGENCE_SYSTEM_PROMPT = """Eres un analista de inteligencia deportiva SENIOR para la agencia de representacion Niagara Sur.
-Tu trabajo: analizar el digest mediatico de {player_name} ({club}) y producir un informe de inteligencia PRECISO y DIFERENCIADO.
+# Static like SYSTEM_PROMPT: player, performance, previous context and the
+# digest all go in the user message
+INTELLIGENCE_RULES = """Eres un analista de inteligencia deportiva SENIOR para la agencia de representacion Niagara Sur.
+Tu trabajo: analizar el digest mediatico del JUGADOR indicado en el mensaje del usuario y producir un informe de inteligencia PRECISO y DIFERENCIADO.
 
 CATEGORIAS DE RIESGO (usa exactamente estos valores):
 - reputacion_personal: Vida privada, escandalos, relaciones, reality TV, redes sociales polemicas
@@ -440,7 +729,7 @@ CRUCE DE FUENTES - Para cada narrativa, compara:
 CONTEXTO TEMPORAL - Para cada narrativa, indica:
 - Cuando empezo (primer item detectado)
 - Velocidad: si algo aparece en 1 fuente = rumor, en 3+ = narrativa, en 5+ = tendencia
-{performance_context}
+
 REGLAS:
 1. Agrupa items del MISMO tema/historia en una narrativa (minimo 2 items para formar narrativa)
 2. TODA narrativa debe incluir items especificos (P12, S45, etc.)
@@ -448,68 +737,195 @@ REGLAS:
 4. Las recomendaciones deben ser ACCIONABLES: "Preparar comunicado", "Contactar club", "Monitorizar 48h"
 5. Si hay items sobre fichaje + rendimiento, evalua si son oportunidad o riesgo
 6. Incluye narrativas POSITIVAS tambien (severidad "bajo"), no solo negativas
-7. MULTI-IDIOMA: Los items pueden estar en ES, EN, IT, AR, FR, DE. Analiza en su idioma original, responde siempre en ESPANOL. Indica el idioma de las fuentes cuando sea relevante (ej: "Prensa italiana reporta...")
-{previous_context}
+7. Lineas con "HISTORIA xN" agrupan N items de la misma historia: la linea es el item representativo, siguen los IDs de los demas (todos validos en items/evidencia), sus fuentes y su sentimiento (+ positivos, - negativos, = neutros). Cuenta los N items para volumen y severidad
+8. MULTI-IDIOMA: Los items pueden estar en ES, EN, IT, AR, FR, DE. Analiza en su idioma original, responde siempre en ESPANOL. Indica el idioma de las fuentes cuando sea relevante (ej: "Prensa italiana reporta...")
+
+"""
+
+INTELLIGENCE_SYSTEM_PROMPT = INTELLIGENCE_RULES + """Responde UNICAMENTE con JSON valido, sin texto extra:
+{"narrativas":[{"titulo":"string corto","descripcion":"2-3 frases resumen","categoria":"reputacion_personal","severidad":"medio","tendencia":"estable","items":["P12","S45"],"fuentes":["prensa","twitter"],"recomendacion":"Accion concreta"}],"senales_tempranas":[{"descripcion":"string","categoria":"rendimiento","evidencia":["S78"],"probabilidad":"media","accion_sugerida":"string"}],"riesgo_global":45,"resumen_inteligencia":"2-3 frases situacion general","recomendacion_principal":"Una frase accionable"}"""
+
+# Incremental pass: the model sees the living narrativas (stable IDs) and only
+# the items added since the previous pass, and answers with patches
+INTELLIGENCE_DELTA_PROMPT = INTELLIGENCE_RULES + """MODO INCREMENTAL:
+El usuario te envia NARRATIVAS ACTIVAS (con ID estable N<numero>) y solo los ITEMS NUEVOS desde el ultimo analisis.
+- Asigna cada item nuevo a una narrativa existente ("actualizadas", con sus IDs en items_nuevos) o crea una nueva ("nuevas", minimo 2 items nuevos)
+- En "actualizadas" incluye solo los campos que cambian (severidad, tendencia, descripcion, recomendacion...)
+- Marca como "resueltas" las narrativas que ya no son relevantes (tema cerrado, desmentido, sin recorrido)
+- No repitas las narrativas que no cambian
+- senales_tempranas: lista COMPLETA vigente (maximo 5), riesgo_global: valor actualizado considerando todas las narrativas activas
+
 Responde UNICAMENTE con JSON valido, sin texto extra:
-{{"narrativas":[{{"titulo":"string corto","descripcion":"2-3 frases resumen","categoria":"reputacion_personal","severidad":"medio","tendencia":"estable","items":["P12","S45"],"fuentes":["prensa","twitter"],"recomendacion":"Accion concreta"}}],"senales_tempranas":[{{"descripcion":"string","categoria":"rendimiento","evidencia":["S78"],"probabilidad":"media","accion_sugerida":"string"}}],"riesgo_global":45,"resumen_inteligencia":"2-3 frases situacion general","recomendacion_principal":"Una frase accionable"}}"""
+{"nuevas":[{"titulo":"string corto","descripcion":"2-3 frases resumen","categoria":"fichaje","severidad":"medio","tendencia":"escalando","items":["P12","S45"],"fuentes":["prensa","twitter"],"recomendacion":"Accion concreta"}],"actualizadas":[{"id":"N3","severidad":"alto","tendencia":"escalando","descripcion":"string","items_nuevos":["S78"]}],"resueltas":["N5"],"senales_tempranas":[{"descripcion":"string","categoria":"rendimiento","evidencia":["S78"],"probabilidad":"media","accion_sugerida":"string"}],"riesgo_global":45,"resumen_inteligencia":"2-3 frases situacion general","recomendacion_principal":"Una frase accionable"}"""
+
+
+def _intel_entry(kind, item):
+    """(ref, digest line, text, source, sentiment) of a press ("P"), social ("S") or post ("A") item."""
+    if kind == "P":
+        title = (item.get('title', '') or '')[:120]
+        summary = (item.get('summary', '') or '').replace('\n', ' ')[:200]
+        url_short = (item.get('url', '') or '')[:80]
+        return (
+            f"P{item['id']}",
+            f"P{item['id']}|prensa|{item.get('source', '')}|{item.get('sentiment_label', 'neutro')}|{title}|{summary}|{url_short}",
+            f"{title} {summary}", item.get('source', '') or 'prensa', item.get('sentiment_label'),
+        )
+    text = (item.get("text", "") or "").replace("\n", " ")[:120]
+    if kind == "S":
+        return (
+            f"S{item['id']}",
+            f"S{item['id']}|{item.get('platform', '')}|{(item.get('author', '') or '')[:20]}|{item.get('sentiment_label', 'neutro')}|{text}",
+            text, item.get('platform', '') or 'social', item.get('sentiment_label'),
+        )
+    eng = item.get("engagement_rate", 0) or 0
+    likes = item.get("likes", 0) or 0
+    return (
+        f"A{item['id']}",
+        f"A{item['id']}|{item.get('platform', '')}|{item.get('sentiment_label', 'neutro')}|eng:{eng:.3f}|likes:{likes}|{text}",
+        text, f"jugador/{item.get('platform', '')}", item.get('sentiment_label'),
+    )
+
+
+def _intel_digest_lines(press, social, posts):
+    """Token-efficient digest: 1 line per story, keyed P/S/A + item id.
+
+    Items are pre-clustered locally (clustering.py); a story with several
+    items is one representative line plus the IDs, sources and sentiment of
+    the rest, so every item reference stays available to the model.
+    """
+    entries = [_intel_entry("P", i) for i in press] + [_intel_entry("S", i) for i in social] \
+        + [_intel_entry("A", i) for i in posts]
+
+    digest_lines = []
+    for group in clustering.cluster([e[2] for e in entries], INTELLIGENCE_CLUSTER_THRESHOLD):
+        rep = entries[group[0]]
+        if len(group) == 1:
+            digest_lines.append(rep[1])
+            continue
+        members = [entries[i] for i in group]
+        sources = Counter(e[3] for e in members)
+        sentiment = Counter(e[4] or "neutro" for e in members)
+        digest_lines.append(
+            f"{rep[1]}|HISTORIA x{len(group)}: {','.join(e[0] for e in members[1:])}"
+            f"|fuentes: {', '.join(f'{s}({n})' for s, n in sources.most_common(6))}"
+            f"|sent: {sentiment['positivo']}+ {sentiment['negativo']}- {sentiment['neutro']}="
+        )
+    if len(digest_lines) < len(entries):
+        log.info(f"[intelligence] Digest: {len(entries)} items in {len(digest_lines)} stories")
+    return digest_lines
+
+
+def _intel_state_block(state):
+    """Compact view of the narrative store for an incremental pass."""
+    lines = ["NARRATIVAS ACTIVAS:"]
+    for n in state["narrativas"]:
+        desc = (n["descripcion"] or "").replace("\n", " ")[:160]
+        lines.append(f"{n['id']}|{n['categoria']}|{n['severidad']}|{n['tendencia']}|items:{len(n['items'])}|"
+                     f"desde:{(n['first_seen'] or '')[:10]}|{n['titulo']}|{desc}")
+    if len(lines) == 1:
+        lines.append("(ninguna)")
+    if state.get("signals"):
+        lines.append("SENALES TEMPRANAS VIGENTES:")
+        lines += [f"- {(s.get('descripcion') or '')[:120]} ({s.get('categoria', '?')})" for s in state["signals"][:5]]
+    lines.append(f"Riesgo global anterior: {state.get('risk_score') if state.get('risk_score') is not None else 'N/A'}/100")
+    return "\n".join(lines)
 
 
 async def generate_intelligence_report(player_id, player_name, club, scan_log_id, stats=None, trends=None):
-    """Second-pass GPT-4o analysis: group items into narrativas, assess risk, detect signals."""
+    """Second-pass GPT-4o analysis: group items into narrativas, assess risk, detect signals.
+
+    Narrativas live in db.narrative_state with stable IDs. The first pass for a
+    player reads the lookback window and seeds the store; later passes send
+    only the items added since the previous pass (db.intelligence_state
+    watermarks) plus a compact view of the active narrativas, and apply the
+    model's patches (nuevas / actualizadas / resueltas). The returned report
+    always carries the full list of active narrativas.
+    """
     if not client:
         return None
 
     import db
 
-    # First check if there's already an intelligence report - if so, use standard lookback
-    # If no prior report exists, use all available items (wider window) for first analysis
-    prev_intel = await db.get_last_intelligence_report(player_id)
-    if prev_intel:
-        lookback = (datetime.now() - timedelta(days=INTELLIGENCE_LOOKBACK_DAYS)).strftime("%Y-%m-%dT00:00:00")
+    state = await db.get_intelligence_state(player_id)
+    prev_intel = None
+
+    pool = INTELLIGENCE_CANDIDATE_ITEMS // 2
+    if state is None:
+        # Read before the fetch: rows inserted meanwhile land above it and are picked up next pass
+        base_marks = await db.get_item_watermarks(player_id)
+        # First check if there's already an intelligence report - if so, use standard lookback
+        # If no prior report exists, use all available items (wider window) for first analysis
+        prev_intel = await db.get_last_intelligence_report(player_id)
+        if prev_intel:
+            lookback = (datetime.now() - timedelta(days=INTELLIGENCE_LOOKBACK_DAYS)).strftime("%Y-%m-%dT00:00:00")
+        else:
+            lookback = None  # No date filter - use all items for first intelligence report
+
+        press = await db.get_press(player_id, limit=pool, date_from=lookback)
+        social = await db.get_social(player_id, limit=pool, date_from=lookback)
+        posts = await db.get_player_posts_db(player_id, limit=50, date_from=lookback)
+
+        total_items = len(press) + len(social) + len(posts)
+        if total_items < 5:
+            log.info(f"[intelligence] Skipping {player_name}: only {total_items} items")
+            return None
     else:
-        lookback = None  # No date filter - use all items for first intelligence report
-
-    half = INTELLIGENCE_MAX_INPUT_ITEMS // 2
-
-    press = await db.get_press(player_id, limit=half, date_from=lookback)
-    social = await db.get_social(player_id, limit=half, date_from=lookback)
-    posts = await db.get_player_posts_db(player_id, limit=50, date_from=lookback)
-
-    total_items = len(press) + len(social) + len(posts)
-    if total_items < 5:
-        log.info(f"[intelligence] Skipping {player_name}: only {total_items} items")
-        return None
+        base_marks = {k: state[k] or 0 for k in ("press_id", "social_id", "post_id")}
+        # Oldest first: a backlog larger than the pool is drained over the next passes
+        press = await db.get_press(player_id, limit=pool, after_id=base_marks["press_id"])
+        social = await db.get_social(player_id, limit=pool, after_id=base_marks["social_id"])
+        posts = await db.get_player_posts_db(player_id, limit=50, after_id=base_marks["post_id"])
+
+        total_items = len(press) + len(social) + len(posts)
+        if not total_items:
+            log.info(f"[intelligence] {player_name}: no new items since the last pass")
+            return None
+
+    lines = {id(i): _intel_entry(kind, i)[1] for kind, group in (("P", press), ("S", social), ("A", posts))
+             for i in group}
+    digest_cost = {"cost": lambda i: estimate_tokens(lines[id(i)]), "member_cost": lambda i: 3,
+                   "max_items": INTELLIGENCE_MAX_INPUT_ITEMS}
+    if state is not None:
+        # Every item the model does not see stays above the watermark: digest the
+        # oldest items that fit the budget (duplicates cost one line per story)
+        # and leave the rest of the backlog for the next passes
+        read = list(heapq.merge(press, social, posts, key=lambda i: i.get("scraped_at") or ""))
+        keep = {id(i) for i in ranking.fit_prefix(read, INTELLIGENCE_DIGEST_TOKENS, **digest_cost)}
+        if len(keep) < total_items or len(press) >= pool or len(social) >= pool or len(posts) >= 50:
+            log.info(f"[intelligence] {player_name}: digesting the oldest {len(keep)} of {total_items} items read, "
+                     f"backlog continues on the next pass")
+        press, social, posts = ([i for i in group if id(i) in keep] for group in (press, social, posts))
+        total_items = len(keep)
+        # Advance only past what the model is shown
+        watermarks = {
+            key: max([base_marks[key]] + [i["id"] for i in items])
+            for key, items in (("press_id", press), ("social_id", social), ("post_id", posts))
+        }
+    else:
+        watermarks = base_marks
 
     # Count sentiment distribution for better calibration
     neg_count = sum(1 for i in press + social if i.get('sentiment_label') == 'negativo')
     pos_count = sum(1 for i in press + social if i.get('sentiment_label') == 'positivo')
     total_analyzed = len(press) + len(social)
 
-    # Build token-efficient digest: 1 line per item
-    digest_lines = []
-    for item in press:
-        title = (item.get('title', '') or '')[:120]
-        summary = (item.get('summary', '') or '').replace('\n', ' ')[:200]
-        url_short = (item.get('url', '') or '')[:80]
-        digest_lines.append(
-            f"P{item['id']}|prensa|{item.get('source', '')}|{item.get('sentiment_label', 'neutro')}|{title}|{summary}|{url_short}"
-        )
-    for item in social:
-        text = (item.get("text", "") or "").replace("\n", " ")[:120]
-        digest_lines.append(
-            f"S{item['id']}|{item.get('platform', '')}|{(item.get('author', '') or '')[:20]}|{item.get('sentiment_label', 'neutro')}|{text}"
-        )
-    for item in posts:
-        text = (item.get("text", "") or "").replace("\n", " ")[:120]
-        eng = item.get("engagement_rate", 0) or 0
-        likes = item.get("likes", 0) or 0
-        digest_lines.append(
-            f"A{item['id']}|{item.get('platform', '')}|{item.get('sentiment_label', 'neutro')}|eng:{eng:.3f}|likes:{likes}|{text}"
-        )
+    if state is None:
+        # Keep the most informative items (ranking.py) within the digest token budget
+        known = [f"{n.get('titulo', '')} {n.get('descripcion', '')}" for n in (prev_intel or {}).get("narrativas", [])]
+        chosen = {id(i) for i in ranking.select(press + social + posts, INTELLIGENCE_DIGEST_TOKENS,
+                                                known_texts=known, **digest_cost)}
+    else:
+        chosen = {id(i) for i in press + social + posts}  # already cut to the budget above
+    digest_lines = _intel_digest_lines(
+        [i for i in press if id(i) in chosen], [i for i in social if id(i) in chosen],
+        [i for i in posts if id(i) in chosen],
+    )
 
     # Add sentiment summary at the top of digest
-    digest_header = f"RESUMEN: {total_items} items totales. Sentimiento: {pos_count} positivos, {neg_count} negativos, {total_analyzed - pos_count - neg_count} neutros."
+    digest_header = f"RESUMEN: {total_items} items {'totales' if state is None else 'nuevos'} ({len(chosen)} seleccionados por relevancia). Sentimiento: {pos_count} positivos, {neg_count} negativos, {total_analyzed - pos_count - neg_count} neutros."
     digest = digest_header + "\n" + "\n".join(digest_lines[:INTELLIGENCE_MAX_INPUT_ITEMS])
+    if state is not None:
+        digest = _intel_state_block(state) + "\n\nITEMS NUEVOS:\n" + digest
 
     # Build performance context
     performance_context = ""
@@ -521,22 +937,20 @@ async def generate_intelligence_report(player_id, player_name, club, scan_log_id
             perf_lines.append(f"GOOGLE TRENDS (30 dias): interes medio={trends.get('average_interest', 0)}/100, pico={trends.get('peak_interest', 0)}/100, tendencia={'subiendo' if trends.get('trend_direction') == 'up' else 'bajando' if trends.get('trend_direction') == 'down' else 'estable'}")
         performance_context = "\n" + "\n".join(perf_lines) + "\n"
 
-    # Build trend context from previous intelligence report (already fetched above)
+    # Build trend context from previous intelligence report (full pass only; the
+    # incremental pass carries the narrative store in the digest)
     previous_context = ""
     if prev_intel and prev_intel.get("narrativas"):
         prev_narr = prev_intel["narrativas"][:5]
         summaries = [f"- {n['titulo']} ({n.get('categoria', '?')}, {n.get('severidad', '?')}, {n.get('tendencia', '?')})" for n in prev_narr]
         previous_context = f"\nCONTEXTO PREVIO (escaneo anterior, usa para detectar tendencias):\n" + "\n".join(summaries) + f"\nRiesgo global anterior: {prev_intel.get('risk_score', 'N/A')}/100\n"
 
-    system = INTELLIGENCE_SYSTEM_PROMPT.format(
-        player_name=player_name, club=club or "desconocido",
-        previous_context=previous_context,
-        performance_context=performance_context,
-    )
+    system = INTELLIGENCE_SYSTEM_PROMPT if state is None else INTELLIGENCE_DELTA_PROMPT
+    digest = f"JUGADOR: {player_name} ({club or 'desconocido'})\n{performance_context}{previous_context}\n{digest}"
 
     try:
-        response = await client.chat.completions.create(
-            model="gpt-4o",
+        response = await _chat(
+            "intelligence",
             messages=[
                 {"role": "system", "content": system},
                 {"role": "user", "content": digest},
@@ -552,10 +966,31 @@ async def generate_intelligence_report(player_id, player_name, club, scan_log_id
 
         data = json.loads(content)
         data["tokens_used"] = response.usage.total_tokens if response.usage else 0
-        log.info(f"[intelligence] {player_name}: risk={data.get('riesgo_global', '?')}/100, "
-                 f"{len(data.get('narrativas', []))} narrativas, {data['tokens_used']} tokens")
+
+        if state is None:
+            data["modo"] = "completo"
+            nuevas, actualizadas, resueltas = data.get("narrativas", []), [], []
+        else:
+            data["modo"] = "incremental"
+            known = {n["id"] for n in state["narrativas"]}
+            nuevas = data.get("nuevas", [])
+            actualizadas = [p for p in data.get("actualizadas", []) if p.get("id") in known]
+            resueltas = [i for i in data.get("resueltas", []) if i in known]
+            data.setdefault("riesgo_global", state.get("risk_score") or 0)
+        data["items_analizados"] = total_items
+        data["narrativas"] = await db.apply_narrative_patches(
+            player_id, nuevas, actualizadas, resueltas, watermarks,
+            data.get("riesgo_global"), data.get("senales_tempranas", []),
+            data.get("resumen_inteligencia", ""), NARRATIVE_STALE_DAYS,
+        )
+        log.info(f"[intelligence] {player_name} ({data['modo']}, {total_items} items): "
+                 f"risk={data.get('riesgo_global', '?')}/100, {len(nuevas)} nuevas, {len(actualizadas)} actualizadas, "
+                 f"{len(resueltas)} resueltas, {len(data['narrativas'])} activas, {data['tokens_used']} tokens")
         return data
 
+    except costs.BudgetExceeded as e:
+        log.info(f"[intelligence] {player_name}: {e}")
+        return None
     except json.JSONDecodeError as e:
         log.error(f"[intelligence] JSON parse error for {player_name}: {e}")
         log.error(f"[intelligence] Raw response: {content[:500]}")
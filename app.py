@@ -41,6 +41,9 @@ import db
 from scan_engine import run_scan, scan_status, scan_lock
 from scheduler import start_scheduler, stop_scheduler, get_scheduler_status
 from analyzer import generate_weekly_report
+from scrapers import parsing
+from scrapers.transfermarkt import close_session as close_transfermarkt_session
+from scrapers.trends import close_session as close_trends_session
 
 # -- Auth config --
 DASHBOARD_PASS = os.getenv("DASHBOARD_PASS", "")
@@ -67,7 +70,8 @@ class AuthMiddleware(BaseHTTPMiddleware):
 
         path = request.url.path
         # Allow public paths
-        if path == "/health" or path == "/login" or path.startswith("/static"):
+        # Apify webhook is authenticated by its own shared secret
+        if path == "/health" or path == "/login" or path.startswith("/static") or path == "/api/apify/webhook":
             return await call_next(request)
 
         # Check auth cookie
@@ -91,6 +95,9 @@ async def lifespan(app: FastAPI):
         log.info("[auth] No DASHBOARD_PASS set - auth disabled")
     yield
     stop_scheduler()
+    parsing.shutdown()
+    await close_transfermarkt_session()
+    await close_trends_session()
 
 
 app = FastAPI(title="AgentRadar", lifespan=lifespan)
@@ -336,6 +343,33 @@ async def scheduler_status():
     return get_scheduler_status()
 
 
+@app.get("/api/sources/health")
+async def sources_health():
+    """Success rate, latency percentiles, last error and circuit state per source."""
+    from scrapers import health
+    sources = health.snapshot()
+    return {
+        "sources": sources,
+        "open_circuits": sum(1 for s in sources if s["state"] == "open"),
+    }
+
+
+# -- Apify webhook --
+
+
+@app.post("/api/apify/webhook")
+async def apify_webhook(request: Request, secret: str = ""):
+    """Run-finished callback registered by scrapers.apify (APIFY_WEBHOOK_URL + APIFY_WEBHOOK_SECRET).
+    Only wakes up the waiting run, which is then re-read from the Apify API."""
+    from config import APIFY_WEBHOOK_SECRET
+    from scrapers.apify import resolve_webhook
+    # Exempt from AuthMiddleware, so the shared secret is mandatory
+    if not APIFY_WEBHOOK_SECRET or not hmac.compare_digest(secret, APIFY_WEBHOOK_SECRET):
+        raise HTTPException(403, "Invalid webhook secret")
+    payload = await request.json()
+    return {"ok": True, "resolved": resolve_webhook(payload)}
+
+
 @app.post("/api/telegram/test-summary")
 async def test_telegram_summary():
     """Send a test Telegram daily summary with current data."""
@@ -360,8 +394,42 @@ async def test_telegram_summary():
 
 @app.get("/api/costs")
 async def get_costs():
-    """Get estimated API cost breakdown."""
-    return await db.get_cost_estimate()
+    """Real OpenAI/Apify spend from the usage ledger, plus the budget governor state."""
+    import costs
+    report = await db.get_cost_report()
+    report["budget"] = await costs.budget_status()
+    return report
+
+
+@app.get("/api/analysis/cache")
+async def analysis_cache():
+    """Hit rate of the GPT analysis cache since startup, plus stored entries."""
+    from analyzer import analysis_cache_stats, PROMPT_VERSION
+    from triage import triage_stats, get_model
+    stats = dict(analysis_cache_stats)
+    model = get_model()
+    reused = stats["hits"] + stats["deduped"]
+    return {
+        "prompt_version": PROMPT_VERSION,
+        "since_startup": stats,
+        "hit_rate": round(reused / stats["items"], 3) if stats["items"] else None,
+        "stored": await db.get_analysis_cache_stats(),
+        "triage": {"since_startup": dict(triage_stats), "model": model.meta if model else None},
+    }
+
+
+@app.get("/api/llm/governor")
+async def llm_governor_status():
+    """Shared OpenAI TPM/RPM governor: limits, in-flight calls, queueing time."""
+    from llm_governor import governor
+    return governor.snapshot()
+
+
+@app.get("/api/llm/models")
+async def llm_models():
+    """Model route per analyzer task, with latency, tokens and cascade escalation rates."""
+    import llm_router
+    return llm_router.snapshot()
 
 
 # -- CSV Export --
@@ -0,0 +1,122 @@
+"""Prompt layout benchmark: player-specific system prompts vs static prefixes.
+
+Sends the same synthetic item batches and intelligence digests for several
+players twice: once in the old layout (player name and club in the first
+lines of the system prompt, so every player has its own prefix) and once in
+the current one (static system prompt, player and items in the user
+message). For each layout and task it reports calls, median / p90 latency,
+prompt tokens, cached tokens, cache hit rate and USD priced like the usage
+ledger (costs.llm_cost).
+
+    OPENAI_API_KEY=... python benchmarks/bench_prompts.py [--players 4] [--batches 3] [--items 40]
+
+or offline against benchmarks/mock_openai.py, which imitates the prompt cache:
+
+    OPENAI_API_KEY=mock OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python benchmarks/bench_prompts.py
+
+OpenAI only caches prompts of 1024+ tokens, so a layout with a shorter
+static prefix shows no hits however it is arranged.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analyzer  # noqa: E402
+import costs  # noqa: E402
+import llm_router  # noqa: E402
+
+PLAYERS = [("Isco", "Real Betis"), ("Antonio Casas", "Racing Club Ferrol"), ("Pedri", "FC Barcelona"),
+           ("Nico Williams", "Athletic Club"), ("Alex Baena", "Villarreal CF"), ("Fermin Lopez", "FC Barcelona")]
+WORDS = ["gol", "fichaje", "lesion", "victoria", "derbi", "entrenador", "contrato", "renovacion", "cantera",
+         "aficion", "polemica", "seleccion", "rendimiento", "sponsor", "vestuario", "clausula"]
+SOURCES = ["Marca", "AS", "Relevo", "twitter", "reddit", "Mundo Deportivo", "youtube"]
+
+
+def _text(rnd, name, n):
+    words = [rnd.choice(WORDS) for _ in range(n)]
+    words.insert(rnd.randrange(len(words)), name)
+    return " ".join(words)
+
+
+def sentiment_messages(layout, name, club, rnd, items):
+    lines = "\n".join(f"[{j}] ({rnd.choice(SOURCES)}) {_text(rnd, name, 30)}" for j in range(items))
+    if layout == "legacy":
+        prompt = analyzer.SYSTEM_PROMPT.split("\n")
+        system = "\n".join([prompt[0], f"Estas analizando contenido sobre el jugador: {name} (club: {club})."]
+                           + prompt[2:])
+        return [{"role": "system", "content": system}, {"role": "user", "content": lines}]
+    return [{"role": "system", "content": analyzer.SYSTEM_PROMPT},
+            {"role": "user", "content": f'JUGADOR: "{name}" (club: {club})\n\nITEMS:\n{lines}'}]
+
+
+def intelligence_messages(layout, name, club, rnd, items):
+    digest = "RESUMEN: sintetico\n" + "\n".join(
+        f"P{k}|prensa|{rnd.choice(SOURCES)}|neutro|{_text(rnd, name, 12)}|{_text(rnd, name, 25)}|https://x.es/{k}"
+        for k in range(items))
+    perf = f"\nRENDIMIENTO DEPORTIVO (temporada actual): {rnd.randint(5, 30)} partidos, {rnd.randint(0, 10)} goles\n"
+    if layout == "legacy":
+        system = (f"Eres un analista de inteligencia deportiva SENIOR. Jugador: {name} ({club}).{perf}\n"
+                  + analyzer.INTELLIGENCE_SYSTEM_PROMPT)
+        return [{"role": "system", "content": system}, {"role": "user", "content": digest}]
+    return [{"role": "system", "content": analyzer.INTELLIGENCE_SYSTEM_PROMPT},
+            {"role": "user", "content": f"JUGADOR: {name} ({club})\n{perf}\n{digest}"}]
+
+
+TASKS = {
+    "sentiment": (sentiment_messages, 300),
+    "intelligence": (intelligence_messages, 400),
+}
+
+
+async def run_layout(layout, task, players, batches, items, seed):
+    build, max_tokens = TASKS[task]
+    model = llm_router.model_for(task)
+    rnd = random.Random(seed)
+    rows = []
+    for name, club in players:
+        for _ in range(batches):
+            messages = build(layout, name, club, rnd, items)
+            started = time.perf_counter()
+            response = await analyzer.client.chat.completions.create(
+                model=model, messages=messages, temperature=0.1, max_tokens=max_tokens)
+            usage = response.usage
+            rows.append((time.perf_counter() - started, usage.prompt_tokens, usage.completion_tokens,
+                         llm_router.cached_tokens(usage)))
+    latencies = sorted(r[0] for r in rows)
+    prompt, completion, cached = (sum(r[k] for r in rows) for k in (1, 2, 3))
+    usd = sum(costs.llm_cost(model, r[1], r[2], r[3]) for r in rows)
+    return {
+        "layout": layout, "task": task, "model": model, "calls": len(rows),
+        "median_s": statistics.median(latencies), "p90_s": latencies[int(0.9 * (len(latencies) - 1))],
+        "prompt": prompt, "cached": cached, "hit": cached / prompt if prompt else 0, "usd": usd,
+    }
+
+
+async def main(args):
+    if analyzer.client is None:
+        sys.exit("OPENAI_API_KEY is not set (use OPENAI_BASE_URL for benchmarks/mock_openai.py)")
+    players = PLAYERS[:args.players]
+    print(f"{'layout':8} {'task':13} {'model':12} {'calls':>5} {'median s':>9} {'p90 s':>7} "
+          f"{'prompt':>8} {'cached':>8} {'hit':>6} {'USD':>9}")
+    for task in args.tasks:
+        # Same seed, so both layouts send identical items
+        for layout in ("legacy", "static"):
+            r = await run_layout(layout, task, players, args.batches, args.items, args.seed)
+            print(f"{r['layout']:8} {r['task']:13} {r['model'][:12]:12} {r['calls']:>5} {r['median_s']:>9.2f} "
+                  f"{r['p90_s']:>7.2f} {r['prompt']:>8} {r['cached']:>8} {r['hit']:>6.1%} {r['usd']:>9.5f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--batches", type=int, default=3, help="calls per player and task")
+    parser.add_argument("--items", type=int, default=40, help="items per batch / digest")
+    parser.add_argument("--tasks", nargs="+", choices=list(TASKS), default=list(TASKS))
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,241 @@
+"""Offline scraper benchmarks on recorded HTTP cassettes.
+
+Record once (needs network; Apify scrapers also need APIFY_TOKEN):
+
+    python benchmarks/bench_scrapers.py record --player "Isco" --club "Real Betis" \\
+        --twitter isco_alarcon --instagram iscoalarcon --tm-id 51798 \\
+        --sofascore https://www.sofascore.com/player/isco/103417
+
+then replay on any machine without network:
+
+    python benchmarks/bench_scrapers.py replay [--rounds 5] [--latency 0]
+
+The cassette keeps the player spec, so replay runs the same calls. For every
+scraper the replay reports wall time (median / max over rounds), items
+returned and items/s, plus the peak traced memory and allocated blocks of one
+extra tracemalloc round. "scan" runs all of them concurrently like the scrape
+stage of run_scan(). The parser table times the pure parse functions over the
+recorded bodies. --latency 1 replays with the recorded response times for
+network-bound end-to-end numbers; the default 0 isolates our own CPU time.
+"""
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_CASSETTE = os.path.join(ROOT, "data", "cassettes", "scrapers.json.gz")
+
+
+def scraper_calls(spec):
+    """name -> zero-arg coroutine factory for every scraper the spec enables."""
+    from config import TELEGRAM_CHANNELS
+    from scrapers.press import scrape_all_press
+    from scrapers.social import scrape_all_social
+    from scrapers.youtube import scrape_youtube
+    from scrapers.telegram import scrape_all_telegram
+    from scrapers.player import scrape_all_player_posts
+    from scrapers.transfermarkt import scrape_transfermarkt_profile, scrape_transfermarkt_stats
+    from scrapers.sofascore import scrape_sofascore_ratings
+    from scrapers.trends import scrape_google_trends
+
+    name, club = spec["player"], spec.get("club")
+    calls = {
+        "press": lambda: scrape_all_press(name, club),
+        "social": lambda: scrape_all_social(name, spec.get("twitter"), club,
+                                            instagram_handle=spec.get("instagram")),
+        "youtube": lambda: scrape_youtube(name),
+        "telegram": lambda: scrape_all_telegram(name, TELEGRAM_CHANNELS),
+        "trends": lambda: scrape_google_trends(name),
+    }
+    if spec.get("twitter") or spec.get("instagram"):
+        calls["player"] = lambda: scrape_all_player_posts(spec.get("twitter"), spec.get("instagram"))
+    if spec.get("tm_id"):
+        async def transfermarkt():
+            return [await scrape_transfermarkt_profile(spec["tm_id"], force=True),
+                    await scrape_transfermarkt_stats(spec["tm_id"], force=True)]
+        calls["transfermarkt"] = transfermarkt
+    if spec.get("sofascore"):
+        calls["sofascore"] = lambda: scrape_sofascore_ratings(spec["sofascore"])
+    return calls
+
+
+def count_items(result):
+    if result is None:
+        return 0
+    if isinstance(result, list):
+        return sum(1 for r in result if r)
+    return 1
+
+
+async def reset_state(db_dir):
+    """Fresh DB and in-memory caches so every round does the same work."""
+    import db
+    from scrapers import google_news, health, trends, transfermarkt
+    db.DB_PATH = os.path.join(db_dir, f"bench-{time.monotonic_ns()}.db")
+    await db.init_db()
+    google_news._recent.clear()
+    health._registry.clear()
+    await trends.close_session()
+    await transfermarkt.close_session()
+
+
+async def run_round(calls, db_dir):
+    """Run each scraper alone, then all of them at once. Returns {name: (seconds, items)}."""
+    results = {}
+    for name, call in calls.items():
+        await reset_state(db_dir)
+        started = time.perf_counter()
+        out = await call()
+        results[name] = (time.perf_counter() - started, count_items(out))
+
+    await reset_state(db_dir)
+    started = time.perf_counter()
+    outs = await asyncio.gather(*[call() for call in calls.values()])
+    results["scan"] = (time.perf_counter() - started, sum(map(count_items, outs)))
+    return results
+
+
+async def traced_round(calls, db_dir):
+    """Peak traced memory (MB) and allocated blocks per scraper."""
+    stats = {}
+    for name, call in calls.items():
+        await reset_state(db_dir)
+        tracemalloc.start()
+        await call()
+        _, peak = tracemalloc.get_traced_memory()
+        blocks = sum(s.count for s in tracemalloc.take_snapshot().statistics("filename"))
+        tracemalloc.stop()
+        stats[name] = (peak / 1e6, blocks)
+    return stats
+
+
+# ── Parsers over recorded bodies ──
+
+def parser_cases(cassette):
+    """(parser name, fn, body) for every recorded response a known parser handles."""
+    from scrapers import parsing, telegram, transfermarkt, youtube
+    from scrapers.articles import extract_article_text
+
+    rules = [
+        ("feed", re.compile(r"news\.google\.com/rss|/rss|/feed|\.xml"), lambda b: parsing.parse_feed_text(b)),
+        ("transfermarkt-profile", re.compile(r"transfermarkt\.[a-z.]+/x/profil/"),
+         transfermarkt._parse_profile_html),
+        ("transfermarkt-stats", re.compile(r"transfermarkt\.[a-z.]+/x/leistungsdatendetails/"),
+         lambda b: transfermarkt._parse_stats_html(b, "bench")),
+        ("telegram", re.compile(r"t\.me/s/"), lambda b: telegram._parse_channel_html(b, "bench", "bench")),
+        ("youtube", re.compile(r"youtube\.com/results"), youtube._parse_youtube_html),
+    ]
+    cases = []
+    for key, responses in cassette.interactions.items():
+        method, url = key.split(" ")[:2]
+        for entry in responses:
+            body = entry.get("text")
+            if method != "GET" or entry.get("status") != 200 or not body:
+                continue
+            for name, pattern, fn in rules:
+                if pattern.search(url):
+                    cases.append((name, fn, body))
+                    break
+            else:
+                if "text/html" in entry.get("headers", {}).get("Content-Type", ""):
+                    cases.append(("article", extract_article_text, body))
+    return cases
+
+
+def bench_parsers(cassette, repeat):
+    import logging
+    logging.getLogger("agentradar").setLevel(logging.CRITICAL)  # parsers log every miss
+    by_parser = {}
+    for name, fn, body in parser_cases(cassette):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            fn(body)
+        elapsed = (time.perf_counter() - started) / repeat
+        count, size, total = by_parser.get(name, (0, 0, 0.0))
+        by_parser[name] = (count + 1, size + len(body), total + elapsed)
+    return by_parser
+
+
+# ── Commands ──
+
+async def record(args):
+    from scrapers import http, parsing
+    spec = {k: v for k, v in {
+        "player": args.player, "club": args.club, "twitter": args.twitter, "instagram": args.instagram,
+        "tm_id": args.tm_id, "sofascore": args.sofascore,
+    }.items() if v}
+    with tempfile.TemporaryDirectory() as db_dir, http.use_cassette(args.cassette, "record") as cassette:
+        cassette.meta["spec"] = spec
+        results = await run_round(scraper_calls(spec), db_dir)
+        await reset_state(db_dir)
+    parsing.shutdown()
+    for name, (seconds, items) in results.items():
+        print(f"{name:>14}: {items:5d} items in {seconds:6.2f}s (live)")
+    print(f"Recorded {sum(map(len, cassette.interactions.values()))} responses -> {args.cassette}")
+
+
+async def replay(args):
+    from scrapers import http, parsing
+    with tempfile.TemporaryDirectory() as db_dir, \
+            http.use_cassette(args.cassette, "replay", args.latency) as cassette:
+        spec = cassette.meta["spec"]
+        calls = scraper_calls(spec)
+        print(f"Cassette: {args.cassette} ({sum(map(len, cassette.interactions.values()))} responses, "
+              f"player {spec['player']!r}, latency x{args.latency})")
+
+        await run_round(calls, db_dir)  # warm-up: pools, imports, lazy compiles
+        rounds = [await run_round(calls, db_dir) for _ in range(args.rounds)]
+        traced = await traced_round(calls, db_dir)
+        await reset_state(db_dir)
+
+    print(f"\n{'scraper':>14} {'median':>9} {'max':>9} {'items':>6} {'items/s':>9} {'peak MB':>8} {'blocks':>9}")
+    for name in rounds[0]:
+        times = [r[name][0] for r in rounds]
+        items = rounds[-1][name][1]
+        median = statistics.median(times)
+        peak, blocks = traced.get(name, (None, None))
+        print(f"{name:>14} {median * 1000:8.1f}ms {max(times) * 1000:8.1f}ms {items:6d} "
+              f"{items / median if median else 0:9.0f} "
+              f"{f'{peak:.1f}' if peak is not None else '-':>8} {blocks if blocks is not None else '-':>9}")
+    print(f"cassette hits {cassette.hits}, misses {cassette.misses}")
+
+    print(f"\n{'parser':>22} {'bodies':>7} {'MB':>7} {'mean':>9} {'MB/s':>8}")
+    for name, (count, size, total) in sorted(bench_parsers(cassette, args.parse_repeat).items()):
+        print(f"{name:>22} {count:7d} {size / 1e6:7.2f} {total / count * 1000:8.2f}ms {size / 1e6 / total:8.1f}")
+    parsing.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record", help="run the scrapers live and record a cassette")
+    rec.add_argument("--player", required=True)
+    rec.add_argument("--club")
+    rec.add_argument("--twitter")
+    rec.add_argument("--instagram")
+    rec.add_argument("--tm-id")
+    rec.add_argument("--sofascore")
+    rec.add_argument("--cassette", default=DEFAULT_CASSETTE)
+
+    rep = sub.add_parser("replay", help="benchmark the scrapers offline against a cassette")
+    rep.add_argument("--cassette", default=DEFAULT_CASSETTE)
+    rep.add_argument("--rounds", type=int, default=5)
+    rep.add_argument("--latency", type=float, default=0.0, help="multiplier on recorded response times")
+    rep.add_argument("--parse-repeat", type=int, default=5)
+
+    args = parser.parse_args()
+    if args.command == "replay":
+        # Apify scrapers bail out early without a token; the cassette never stores it
+        os.environ.setdefault("APIFY_TOKEN", "cassette")
+        if not args.latency:
+            os.environ.setdefault("TRANSFERMARKT_MIN_INTERVAL", "0")  # host pacing is wall time, not ours
+    asyncio.run(record(args) if args.command == "record" else replay(args))
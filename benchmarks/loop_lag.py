@@ -0,0 +1,104 @@
+"""Event-loop lag during a simulated scan: inline parsing vs scrapers.parsing.
+
+Fires the same burst of Google News style feed "responses" a scan does (45+
+queries landing at roughly the same time), parses them either on the loop
+(old behaviour) or through the parsing executors, and measures how late a
+5 ms heartbeat task wakes up meanwhile. Heartbeat lag is what an /api/*
+request waiting on the same loop would see.
+
+    python benchmarks/loop_lag.py [--feeds 45] [--items 100] [--rounds 3]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scrapers import parsing  # noqa: E402
+
+HEARTBEAT = 0.005
+
+
+def make_feed(n_items, seed):
+    rnd = random.Random(seed)
+    items = []
+    for i in range(n_items):
+        words = " ".join(rnd.choice(["gol", "fichaje", "lesion", "victoria", "derbi", "entrenador",
+                                     "contrato", "renovacion", "cantera", "aficion"]) for _ in range(60))
+        items.append(f"""<item>
+<title>Noticia {seed}-{i}: Jugador Ejemplo {words[:80]}</title>
+<link>https://news.google.com/rss/articles/{seed}x{i}?oc=5</link>
+<guid isPermaLink="false">{seed}x{i}</guid>
+<pubDate>Mon, 0{1 + i % 9} Sep 2025 1{i % 10}:00:00 GMT</pubDate>
+<description>&lt;a href="https://example.com/{i}"&gt;{words}&lt;/a&gt;</description>
+<source url="https://www.marca.com">Marca</source>
+</item>""")
+    return ('<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+            "<title>Google News</title>" + "".join(items) + "</channel></rss>")
+
+
+async def heartbeat(lags, stop):
+    while not stop.is_set():
+        t = time.perf_counter()
+        await asyncio.sleep(HEARTBEAT)
+        lags.append(time.perf_counter() - t - HEARTBEAT)
+
+
+async def simulated_scan(bodies, offload):
+    async def one(body):
+        await asyncio.sleep(random.uniform(0.05, 0.3))  # network latency
+        if offload:
+            feed = await parsing.parse_feed(body, 100)
+        else:
+            feed = parsing.parse_feed_text(body, 100)
+        return len(feed["entries"])
+
+    return sum(await asyncio.gather(*[one(b) for b in bodies]))
+
+
+async def measure(bodies, offload):
+    lags = []
+    stop = asyncio.Event()
+    hb = asyncio.create_task(heartbeat(lags, stop))
+    started = time.perf_counter()
+    entries = await simulated_scan(bodies, offload)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await hb
+    lags_ms = sorted(lag * 1000 for lag in lags)
+    return {
+        "entries": entries,
+        "wall_s": elapsed,
+        "lag_p50_ms": statistics.median(lags_ms),
+        "lag_p99_ms": lags_ms[min(len(lags_ms) - 1, int(len(lags_ms) * 0.99))],
+        "lag_max_ms": lags_ms[-1],
+    }
+
+
+async def main(args):
+    bodies = [make_feed(args.items, seed) for seed in range(args.feeds)]
+    print(f"{args.feeds} feeds x {args.items} items ({sum(map(len, bodies)) / 1e6:.1f} MB)")
+
+    # Warm the pools so worker start-up is not billed to the first round
+    await parsing.parse_feed(bodies[0], 1)
+
+    for label, offload in (("inline", False), ("executor", True)):
+        runs = [await measure(bodies, offload) for _ in range(args.rounds)]
+        print(f"{label:>9}: "
+              f"wall {statistics.mean(r['wall_s'] for r in runs):.2f}s  "
+              f"lag p50 {statistics.mean(r['lag_p50_ms'] for r in runs):.1f}ms  "
+              f"p99 {statistics.mean(r['lag_p99_ms'] for r in runs):.1f}ms  "
+              f"max {max(r['lag_max_ms'] for r in runs):.1f}ms")
+    parsing.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--feeds", type=int, default=45)
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=3)
+    asyncio.run(main(parser.parse_args()))
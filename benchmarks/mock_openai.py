@@ -0,0 +1,165 @@
+"""Local stand-in for the OpenAI endpoints the analyzer uses.
+
+Serves chat completions (sync) and the Batch API flow (file upload, batch
+create/retrieve/cancel, output file download) with canned answers shaped
+like the real prompts: a JSON array with one object per "[j]" item for
+analyze_batch, a small JSON object for prompts that ask for JSON, plain
+text otherwise. Batches complete --batch-delay seconds after creation.
+Usage reports cached_tokens the way OpenAI's prompt cache does: the longest
+prefix already sent, from 1024 tokens on, in 128-token steps.
+
+    python benchmarks/mock_openai.py [--port 8765] [--batch-delay 5] [--latency 0.2]
+    OPENAI_API_KEY=mock OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_BATCH_MODE=true \\
+        OPENAI_BATCH_WINDOW_SECONDS=2 OPENAI_BATCH_POLL_SECONDS=1 uvicorn app:app
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import time
+import uuid
+
+from aiohttp import web
+
+_ITEM_RE = re.compile(r"^\[(\d+)\]", re.M)
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+_prefixes = set()  # hashes of every prompt prefix seen, at block boundaries
+
+
+def _cached_tokens(messages):
+    text = "".join(f"<{m.get('role')}>{json.dumps(m.get('content', ''))}" for m in messages)
+    cached = 0
+    for end in range(CACHE_MIN_TOKENS * 4, len(text) + 1, CACHE_BLOCK_TOKENS * 4):
+        key = hashlib.sha1(text[:end].encode("utf-8")).digest()
+        if key in _prefixes:
+            cached = end // 4
+        _prefixes.add(key)
+    return cached
+
+
+def _content(messages):
+    system = " ".join(m["content"] for m in messages if m["role"] == "system" and isinstance(m["content"], str))
+    user = messages[-1]["content"]
+    if not isinstance(user, str):
+        user = " ".join(p.get("text", "") for p in user if p.get("type") == "text")
+    if "JSON array" in system or "JSON array" in user:
+        n = len(_ITEM_RE.findall(user)) or 1
+        return json.dumps([
+            {"relevant": True, "sentiment": 0.1, "sentiment_label": "neutro", "topics": ["rendimiento"], "brands": [],
+             "confidence": 0.9}
+            for _ in range(n)
+        ])
+    if "JSON" in system or "JSON" in user:
+        return json.dumps({"resumen": "Respuesta simulada.", "recomendacion": "MONITORIZAR", "riesgos": [],
+                           "oportunidades": [], "justificacion": "mock"})
+    return "Respuesta simulada."
+
+
+def completion(body):
+    messages = body.get("messages", [])
+    content = _content(messages)
+    prompt_tokens = sum(len(json.dumps(m.get("content", ""))) for m in messages) // 4
+    completion_tokens = len(content) // 4 + 1
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens,
+                  "prompt_tokens_details": {"cached_tokens": min(_cached_tokens(messages), prompt_tokens)}},
+    }
+
+
+class MockOpenAI:
+    def __init__(self, batch_delay, latency):
+        self.batch_delay = batch_delay
+        self.latency = latency
+        self.files = {}  # id -> (meta, bytes)
+        self.batches = {}
+
+    def _file(self, data, filename, purpose):
+        file_id = f"file-{uuid.uuid4().hex[:12]}"
+        meta = {"id": file_id, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose, "status": "processed"}
+        self.files[file_id] = (meta, data)
+        return meta
+
+    async def chat(self, request):
+        await asyncio.sleep(self.latency)
+        return web.json_response(completion(await request.json()))
+
+    async def upload(self, request):
+        form = await request.post()
+        upload = form["file"]
+        return web.json_response(self._file(upload.file.read(), upload.filename, form.get("purpose", "batch")))
+
+    async def file_content(self, request):
+        _, data = self.files[request.match_info["file_id"]]
+        return web.Response(body=data, content_type="application/jsonl")
+
+    async def create_batch(self, request):
+        body = await request.json()
+        batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+        self.batches[batch_id] = {
+            "id": batch_id, "object": "batch", "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"], "completion_window": body["completion_window"],
+            "status": "validating", "created_at": int(time.time()), "metadata": body.get("metadata"),
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        asyncio.get_running_loop().create_task(self._process(batch_id))
+        return web.json_response(self.batches[batch_id])
+
+    async def _process(self, batch_id):
+        batch = self.batches[batch_id]
+        await asyncio.sleep(self.batch_delay / 2)
+        batch["status"] = "in_progress"
+        await asyncio.sleep(self.batch_delay / 2)
+        if batch["status"] == "cancelling":
+            batch["status"] = "cancelled"
+            return
+        _, data = self.files[batch["input_file_id"]]
+        out = []
+        for line in data.decode("utf-8").splitlines():
+            if line.strip():
+                req = json.loads(line)
+                out.append(json.dumps({
+                    "id": f"batch_req_{uuid.uuid4().hex[:12]}", "custom_id": req["custom_id"],
+                    "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": completion(req["body"])},
+                    "error": None,
+                }))
+        batch["output_file_id"] = self._file(("\n".join(out) + "\n").encode("utf-8"), "output.jsonl", "batch_output")["id"]
+        batch["request_counts"] = {"total": len(out), "completed": len(out), "failed": 0}
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+
+    async def get_batch(self, request):
+        return web.json_response(self.batches[request.match_info["batch_id"]])
+
+    async def cancel_batch(self, request):
+        batch = self.batches[request.match_info["batch_id"]]
+        if batch["status"] not in ("completed", "failed", "expired", "cancelled"):
+            batch["status"] = "cancelling"
+        return web.json_response(batch)
+
+    def app(self):
+        app = web.Application(client_max_size=200 * 1024 * 1024)
+        app.router.add_post("/v1/chat/completions", self.chat)
+        app.router.add_post("/v1/files", self.upload)
+        app.router.add_get("/v1/files/{file_id}/content", self.file_content)
+        app.router.add_post("/v1/batches", self.create_batch)
+        app.router.add_get("/v1/batches/{batch_id}", self.get_batch)
+        app.router.add_post("/v1/batches/{batch_id}/cancel", self.cancel_batch)
+        return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--batch-delay", type=float, default=5.0)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per sync chat completion")
+    args = parser.parse_args()
+    web.run_app(MockOpenAI(args.batch_delay, args.latency).app(), host="127.0.0.1", port=args.port)
@@ -0,0 +1,79 @@
+"""Local story clustering for the intelligence digest.
+
+Press items, mentions and posts about the same story (one agency piece
+syndicated by ten outlets, a quote retweeted fifty times) are grouped before
+the intelligence prompt is built, so GPT-4o reads each story once instead of
+once per copy. Texts become hashed TF-IDF vectors of words (accents folded,
+stopwords dropped, cut to a 6-character stem so "lesion"/"lesiona" match,
+L2-normalized). Each text joins the cluster with the highest average cosine
+similarity to its members when that reaches the threshold; otherwise it
+starts a new one.
+"""
+import re
+import unicodedata
+import zlib
+
+import numpy as np
+
+N_FEATURES = 1 << 14
+STEM = 6
+
+_WORD_RE = re.compile(r"\w{2,}")
+_URL_RE = re.compile(r"https?://\S+")
+STOPWORDS = set("""
+de la el en y a los las del se por un una con para que es al lo su sus como mas pero sin sobre
+the of and to in on for with is at by from his her it as be this that has have are was
+il di e che le per con un una del della dei da al
+le les des et du au pour avec sur est
+""".split())
+
+
+def _fold(text):
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def _terms(text):
+    return [w[:STEM] for w in _WORD_RE.findall(_URL_RE.sub(" ", _fold(text))) if w not in STOPWORDS]
+
+
+def vectorize(texts):
+    """L2-normalized hashed TF-IDF matrix (len(texts) x N_FEATURES), float32."""
+    rows = [[zlib.crc32(w.encode("utf-8")) % N_FEATURES for w in _terms(t)] for t in texts]
+    tf = np.zeros((len(texts), N_FEATURES), dtype=np.float32)
+    for i, idx in enumerate(rows):
+        if idx:
+            np.add.at(tf[i], idx, 1.0)
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log((1 + len(texts)) / (1 + df)).astype(np.float32) + 1
+    vectors = np.log1p(tf) * idf
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def cluster(texts, threshold):
+    """Greedy average-link clustering. Returns clusters as lists of indexes
+    into texts, largest first; each cluster starts with its medoid (the
+    member closest to the others), which serves as the representative."""
+    if not texts:
+        return []
+    vectors = vectorize(texts)
+    sims = vectors @ vectors.T
+    members = []
+    for i in range(len(texts)):
+        if members and vectors[i].any():
+            scores = [sims[i, group].mean() for group in members]
+            best = int(np.argmax(scores))
+            if scores[best] >= threshold:
+                members[best].append(i)
+                continue
+        members.append([i])
+
+    out = []
+    for group in members:
+        if len(group) > 2:
+            medoid = group[int(np.argmax(sims[np.ix_(group, group)].sum(axis=1)))]
+            group = [medoid] + [i for i in group if i != medoid]
+        out.append(group)
+    out.sort(key=len, reverse=True)
+    return out
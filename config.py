@@ -15,6 +15,8 @@ DAILY_SCAN_ENABLED = os.getenv("DAILY_SCAN_ENABLED", "true").lower() == "true"
 DAILY_SCAN_HOUR = int(os.getenv("DAILY_SCAN_HOUR", "7"))
 DAILY_SCAN_MINUTE = int(os.getenv("DAILY_SCAN_MINUTE", "0"))
 SCAN_DELAY_SECONDS = int(os.getenv("SCAN_DELAY_SECONDS", "30"))
+# Merge the roster's Twitter/Instagram scrapes into one Apify run per actor
+ROSTER_BATCH_ENABLED = os.getenv("ROSTER_BATCH_ENABLED", "true").lower() == "true"
 
 # Email digest
 SMTP_HOST = os.getenv("SMTP_HOST", "")
@@ -33,6 +35,12 @@ TWITTER_ACTOR = "apidojo~tweet-scraper"
 INSTAGRAM_ACTOR = "apify~instagram-scraper"
 INSTAGRAM_HASHTAG_ACTOR = "apify~instagram-hashtag-scraper"
 SOFASCORE_ACTOR = "azzouzana~sofascore-scraper-pro"
+APIFY_MAX_CONCURRENT_RUNS = int(os.getenv("APIFY_MAX_CONCURRENT_RUNS", "4"))  # global cap across scans
+APIFY_RUN_TIMEOUT = int(os.getenv("APIFY_RUN_TIMEOUT", "300"))  # seconds to wait for a run to finish
+APIFY_DATASET_PAGE_SIZE = 1000
+# Optional: public URL of /api/apify/webhook so runs call back instead of being long-polled
+APIFY_WEBHOOK_URL = os.getenv("APIFY_WEBHOOK_URL", "")
+APIFY_WEBHOOK_SECRET = os.getenv("APIFY_WEBHOOK_SECRET", "")
 
 # Instagram mention search limits
 MAX_INSTAGRAM_MENTIONS = 50
@@ -71,6 +79,11 @@ GOOGLE_NEWS_RSS_INTL = {
 }
 GOOGLE_ALERTS_RSS = "https://www.google.com/alerts/feeds/{alert_id}"
 
+# Query planner: site: searches are packed into OR-groups within these limits
+GOOGLE_NEWS_MAX_SITES_PER_QUERY = 4  # a group shares one feed of MAX_RSS_ITEMS entries
+GOOGLE_NEWS_MAX_URL_LENGTH = 1800
+GOOGLE_NEWS_DEDUP_SECONDS = 600  # identical query URLs share one request
+
 # Site-specific search: Google News RSS with site: operator
 # Finds articles about the player on each newspaper's website directly
 PRESS_SITE_SEARCH = {
@@ -114,6 +127,8 @@ PRESS_SITE_SEARCH = {
 }
 
 # YouTube (via HTML scraping - no API key needed)
+YOUTUBE_MAX_CONCURRENT = int(os.getenv("YOUTUBE_MAX_CONCURRENT", "3"))  # shared across scans
+YOUTUBE_MAX_PAGES = 3  # continuation pages per query on deep (first) scans
 
 # Reddit (international subreddits)
 REDDIT_SUBREDDITS = [
@@ -144,6 +159,103 @@ MAX_REDDIT_POSTS = 100
 MAX_RSS_ITEMS = 100
 MAX_YOUTUBE_RESULTS = 40
 
+# Source health: circuit breakers per host/feed/actor
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))
+CIRCUIT_COOLDOWN_SECONDS = int(os.getenv("CIRCUIT_COOLDOWN_SECONDS", "300"))
+CIRCUIT_MAX_COOLDOWN = int(os.getenv("CIRCUIT_MAX_COOLDOWN", "3600"))
+
+# Background press ingestion (RSS + Google News into a local article index)
+PRESS_INGEST_ENABLED = os.getenv("PRESS_INGEST_ENABLED", "true").lower() == "true"
+PRESS_INGEST_INTERVAL_MINUTES = int(os.getenv("PRESS_INGEST_INTERVAL_MINUTES", "5"))
+PRESS_INGEST_GOOGLE_BATCH = int(os.getenv("PRESS_INGEST_GOOGLE_BATCH", "3"))  # players per tick
+PRESS_INDEX_LOOKBACK_DAYS = 7  # scans read articles indexed in this window
+PRESS_INDEX_RETENTION_DAYS = 30
+
+# Transfermarkt: parsed profile/stats cache and host rate limit
+TRANSFERMARKT_CACHE_TTL_HOURS = int(os.getenv("TRANSFERMARKT_CACHE_TTL_HOURS", "24"))
+TRANSFERMARKT_MIN_INTERVAL = float(os.getenv("TRANSFERMARKT_MIN_INTERVAL", "2.0"))  # seconds between requests
+
+# Google Trends: roster comparisons in batches against a shared anchor keyword
+TRENDS_ANCHOR_KEYWORD = os.getenv("TRENDS_ANCHOR_KEYWORD", "LaLiga")
+TRENDS_BATCH_SIZE = 4  # players per comparison (+ anchor = 5, the Trends maximum)
+TRENDS_MIN_PEAK = 5  # a series peaking below this in a comparison is too coarse; queried on its own
+
+# HTTP cassettes: record scraper traffic / replay it offline (benchmarks)
+HTTP_CASSETTE_MODE = os.getenv("HTTP_CASSETTE_MODE", "off").lower()  # off | record | replay
+HTTP_CASSETTE_PATH = os.getenv("HTTP_CASSETTE_PATH", os.path.join(os.path.dirname(__file__), "data", "cassettes", "default.json.gz"))
+HTTP_CASSETTE_LATENCY = float(os.getenv("HTTP_CASSETTE_LATENCY", "0"))  # replay: x recorded latency
+
+# Parsing executors: threads for lxml, processes for pure-Python parsers
+PARSE_THREAD_WORKERS = int(os.getenv("PARSE_THREAD_WORKERS", "4"))
+PARSE_PROCESS_WORKERS = int(os.getenv("PARSE_PROCESS_WORKERS", "2"))
+PARSE_INLINE_BYTES = 16_384  # smaller bodies are parsed inline
+
+# Article text store (full-text enrichment of press items)
+ARTICLE_CACHE_TTL_HOURS = int(os.getenv("ARTICLE_CACHE_TTL_HOURS", "72"))
+ARTICLE_FAILED_TTL_HOURS = int(os.getenv("ARTICLE_FAILED_TTL_HOURS", "6"))
+ARTICLE_MAX_CHARS = 2000
+
+# OpenAI rate governor (shared by every GPT call in the process)
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "150000"))
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+OPENAI_MAX_CONCURRENT = int(os.getenv("OPENAI_MAX_CONCURRENT", "8"))
+
+# Model routing per analyzer task (llm_router.py)
+OPENAI_MODEL_SMALL = os.getenv("OPENAI_MODEL_SMALL", "gpt-4o-mini")
+OPENAI_MODEL_LARGE = os.getenv("OPENAI_MODEL_LARGE", "gpt-4o")
+MODEL_ROUTES = {
+    "default": OPENAI_MODEL_LARGE,
+    "sentiment": OPENAI_MODEL_SMALL,  # first pass of the item cascade
+    "sentiment_escalation": OPENAI_MODEL_LARGE,
+    "vision": OPENAI_MODEL_LARGE,
+    "alert": OPENAI_MODEL_SMALL,
+    "executive_summary": OPENAI_MODEL_SMALL,
+    "weekly_report": OPENAI_MODEL_LARGE,
+    "intelligence": OPENAI_MODEL_LARGE,
+}
+CASCADE_MIN_CONFIDENCE = float(os.getenv("CASCADE_MIN_CONFIDENCE", "0.7"))
+CASCADE_ESCALATE_TOPICS = {"polemica", "lesion", "vida_personal"}  # high stakes: always re-checked
+
+# Usage ledger prices (costs.py): USD per 1M tokens (input, output, cached input)
+OPENAI_PRICES = {
+    "gpt-4o": (2.50, 10.00, 1.25),
+    "gpt-4o-mini": (0.15, 0.60, 0.075),
+}
+OPENAI_BATCH_DISCOUNT = 0.5  # Batch API calls are billed at half price
+APIFY_COMPUTE_UNIT_USD = float(os.getenv("APIFY_COMPUTE_UNIT_USD", "0.4"))  # when a run reports no usageTotalUsd
+
+# Budget governor (0 = no limit)
+DAILY_BUDGET_USD = float(os.getenv("DAILY_BUDGET_USD", "0"))
+MONTHLY_BUDGET_USD = float(os.getenv("MONTHLY_BUDGET_USD", "0"))
+BUDGET_SOFT_RATIO = float(os.getenv("BUDGET_SOFT_RATIO", "0.8"))  # start downgrading at 80% of a limit
+BUDGET_DOWNGRADE_TASKS = {"alert", "executive_summary", "weekly_report", "intelligence"}  # -> small model
+BUDGET_DEFER_TASKS = {"sentiment_escalation", "vision", "intelligence"}  # skipped once over budget
+
+# OpenAI Batch API for scheduled jobs (daily scan, weekly reports)
+OPENAI_BATCH_MODE = os.getenv("OPENAI_BATCH_MODE", "false").lower() == "true"
+OPENAI_BATCH_WINDOW_SECONDS = float(os.getenv("OPENAI_BATCH_WINDOW_SECONDS", "20"))  # idle time before a flush
+OPENAI_BATCH_MAX_REQUESTS = int(os.getenv("OPENAI_BATCH_MAX_REQUESTS", "5000"))
+OPENAI_BATCH_POLL_SECONDS = float(os.getenv("OPENAI_BATCH_POLL_SECONDS", "30"))
+OPENAI_BATCH_TIMEOUT_HOURS = float(os.getenv("OPENAI_BATCH_TIMEOUT_HOURS", "6"))
+OPENAI_BATCH_SCAN_CONCURRENCY = int(os.getenv("OPENAI_BATCH_SCAN_CONCURRENCY", "5"))  # players in flight
+
+# analyze_batch planner: items are packed per batch up to these budgets
+ANALYSIS_BATCH_INPUT_TOKENS = int(os.getenv("ANALYSIS_BATCH_INPUT_TOKENS", "6000"))
+ANALYSIS_OUTPUT_TOKENS_PER_ITEM = 52  # one {"relevant", "sentiment", ..., "confidence"} object
+ANALYSIS_MAX_OUTPUT_TOKENS = 4000
+ANALYSIS_RETRY_DEPTH = 3  # re-asks for items whose answer was cut off or unparseable
+
+# GPT analysis cache (per content hash, player, prompt version, model)
+ANALYSIS_CACHE_TTL_DAYS = int(os.getenv("ANALYSIS_CACHE_TTL_DAYS", "30"))
+IMAGE_HASH_MAX_DISTANCE = int(os.getenv("IMAGE_HASH_MAX_DISTANCE", "3"))  # dHash bits for a near-duplicate image
+
+# Local triage classifier in front of GPT (python triage.py train|eval)
+TRIAGE_ENABLED = os.getenv("TRIAGE_ENABLED", "true").lower() == "true"
+TRIAGE_MODEL_PATH = os.getenv("TRIAGE_MODEL_PATH", os.path.join(os.path.dirname(__file__), "data", "triage_model.json"))
+TRIAGE_DROP_THRESHOLD = float(os.getenv("TRIAGE_DROP_THRESHOLD", "0.95"))  # P(irrelevant) to drop locally
+TRIAGE_NEUTRAL_THRESHOLD = float(os.getenv("TRIAGE_NEUTRAL_THRESHOLD", "0.9"))  # P(relevant) and P(neutral)
+TRIAGE_MIN_SAMPLES = int(os.getenv("TRIAGE_MIN_SAMPLES", "500"))
+
 # First scan multiplier (deeper scrape for new players)
 FIRST_SCAN_MULTIPLIER = 3
 
@@ -169,6 +281,34 @@ INTELLIGENCE_ENABLED = os.getenv("INTELLIGENCE_ENABLED", "true").lower() == "tru
 INTELLIGENCE_MAX_INPUT_ITEMS = int(os.getenv("INTELLIGENCE_MAX_INPUT_ITEMS", "200"))
 INTELLIGENCE_LOOKBACK_DAYS = int(os.getenv("INTELLIGENCE_LOOKBACK_DAYS", "7"))
 INTELLIGENCE_MAX_TOKENS = int(os.getenv("INTELLIGENCE_MAX_TOKENS", "4000"))
+NARRATIVE_STALE_DAYS = int(os.getenv("NARRATIVE_STALE_DAYS", "14"))  # close narrativas without new items
+INTELLIGENCE_CLUSTER_THRESHOLD = float(os.getenv("INTELLIGENCE_CLUSTER_THRESHOLD", "0.35"))  # cosine, same story
+INTELLIGENCE_CANDIDATE_ITEMS = int(os.getenv("INTELLIGENCE_CANDIDATE_ITEMS", "500"))  # pool ranked for the digest
+INTELLIGENCE_DIGEST_TOKENS = int(os.getenv("INTELLIGENCE_DIGEST_TOKENS", "6000"))
+ALERT_INPUT_TOKENS = 1500  # sources sent to analyze_alert_content
+
+# Alert suppression: a rule that fires again within its window (hours) for
+# mostly the same items refreshes the existing alert instead of adding one
+ALERT_WINDOW_HOURS = {
+    "default": int(os.getenv("ALERT_WINDOW_HOURS", "72")),
+    "inactividad": 24 * 30,  # one alert per silence, refreshed daily
+}
+# Story alerts (topic rules) continue the previous alert of their type when
+# their text is this similar to it (cosine, hashed TF-IDF as in clustering.py);
+# volume alerts (prensa_negativa, redes_negativas, trending) are one per window
+ALERT_STORY_TYPES = {"rumor_fichaje", "lesion", "polemica"}
+ALERT_STORY_SIMILARITY = float(os.getenv("ALERT_STORY_SIMILARITY", "0.3"))
+ALERT_ESCALATE_GROWTH = 2.0  # refreshed alert whose item set doubled is escalated (re-explained, unread again)
+INACTIVITY_ESCALATE_DAYS = 21  # inactividad goes from "media" to "alta"
+
+# Prompt input ranking (ranking.py), weights sum to 1
+RANKING_WEIGHTS = {
+    "credibility": 0.30,
+    "engagement": 0.20,
+    "extremity": 0.20,
+    "novelty": 0.15,
+    "cluster": 0.15,
+}
 RISK_CATEGORIES = [
     "reputacion_personal", "legal", "rendimiento", "fichaje",
     "lesion", "disciplina", "comercial", "imagen_publica",
@@ -0,0 +1,169 @@
+"""Usage ledger and budget governor for OpenAI and Apify.
+
+Every GPT call (analyzer._chat) and every Apify actor run (scrapers/apify.py)
+writes a row to db.usage_ledger with its real usage: prompt, completion and
+cached tokens for OpenAI (priced with OPENAI_PRICES, halved for Batch API
+calls); compute units and Apify's own usageTotalUsd for actor runs. Rows are
+attributed to the scan, player and job of the enclosing scope(), which is a
+contextvar, so concurrent scans don't mix.
+
+The governor compares today's and this month's spend with DAILY_BUDGET_USD /
+MONTHLY_BUDGET_USD (0 = no limit). Past BUDGET_SOFT_RATIO of either limit
+the BUDGET_DOWNGRADE_TASKS run on the small model; past the limit the
+BUDGET_DEFER_TASKS raise BudgetExceeded and their callers skip or retry the
+work on a later scan. Item sentiment is never deferred.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+import db
+import llm_router
+from config import (
+    OPENAI_PRICES, OPENAI_BATCH_DISCOUNT, APIFY_COMPUTE_UNIT_USD, DAILY_BUDGET_USD, MONTHLY_BUDGET_USD,
+    BUDGET_SOFT_RATIO, BUDGET_DOWNGRADE_TASKS, BUDGET_DEFER_TASKS, OPENAI_MODEL_SMALL,
+)
+
+log = logging.getLogger("agentradar")
+
+REFRESH_SECONDS = 300
+
+_scope = ContextVar("usage_scope", default={})
+_spend = {"day": None, "month": None, "today_usd": 0.0, "month_usd": 0.0, "loaded_at": 0.0}
+budget_stats = {"downgraded": 0, "deferred": 0}
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+# ── Attribution ──
+
+def set_scope(**attrs):
+    """Attribute usage in this task (and tasks it starts) to scan_log_id/player_id/job.
+    Returns a token for reset_scope()."""
+    return _scope.set({**_scope.get(), **attrs})
+
+
+def reset_scope(token):
+    _scope.reset(token)
+
+
+@contextmanager
+def scope(**attrs):
+    token = set_scope(**attrs)
+    try:
+        yield
+    finally:
+        reset_scope(token)
+
+
+# ── Pricing ──
+
+def llm_cost(model, prompt_tokens, completion_tokens, cached_tokens=0, batch=False):
+    """USD for one chat completion; unknown models are priced as the large tier."""
+    price = OPENAI_PRICES.get(model)
+    if price is None:
+        price = next((p for name, p in OPENAI_PRICES.items() if model.startswith(name)), OPENAI_PRICES["gpt-4o"])
+    input_price, output_price, cached_price = price
+    cost = ((prompt_tokens - cached_tokens) * input_price + cached_tokens * cached_price
+            + completion_tokens * output_price) / 1_000_000
+    return cost * (OPENAI_BATCH_DISCOUNT if batch else 1)
+
+
+# ── Recording ──
+
+async def _record(row):
+    attrs = _scope.get()
+    row.setdefault("scan_log_id", attrs.get("scan_log_id"))
+    row.setdefault("player_id", attrs.get("player_id"))
+    row.setdefault("job", attrs.get("job"))
+    try:
+        await db.insert_usage(row)
+    except Exception as e:
+        log.error(f"[costs] Could not record usage: {e}")
+        return
+    _add_spend(row["cost_usd"])
+
+
+async def record_llm(task, model, usage, batch=False):
+    if usage is None:
+        return
+    cached = llm_router.cached_tokens(usage)
+    prompt, completion = usage.prompt_tokens or 0, usage.completion_tokens or 0
+    await _record({
+        "provider": "openai", "task": task, "model": model,
+        "prompt_tokens": prompt, "completion_tokens": completion, "cached_tokens": cached,
+        "batch": int(batch), "cost_usd": llm_cost(model, prompt, completion, cached, batch),
+    })
+
+
+async def record_apify(actor, run, label=None):
+    """Ledger row for a finished (or failed) actor run object."""
+    stats = run.get("stats") or {}
+    units = stats.get("computeUnits") or 0
+    usd = run.get("usageTotalUsd")
+    await _record({
+        "provider": "apify", "task": label or actor, "model": actor,
+        "compute_units": units,
+        "cost_usd": usd if usd is not None else units * APIFY_COMPUTE_UNIT_USD,
+    })
+
+
+# ── Budget governor ──
+
+def _add_spend(usd):
+    now = datetime.now()
+    if _spend["day"] == now.strftime("%Y-%m-%d"):
+        _spend["today_usd"] += usd
+    if _spend["month"] == now.strftime("%Y-%m"):
+        _spend["month_usd"] += usd
+
+
+async def _refresh():
+    now = datetime.now()
+    day, month = now.strftime("%Y-%m-%d"), now.strftime("%Y-%m")
+    if _spend["day"] == day and _spend["month"] == month and time.monotonic() - _spend["loaded_at"] < REFRESH_SECONDS:
+        return
+    totals = await db.get_usage_totals()
+    _spend.update(day=day, month=month, today_usd=totals["today_usd"], month_usd=totals["month_usd"],
+                  loaded_at=time.monotonic())
+
+
+def _usage_ratio():
+    ratios = [0.0]
+    if DAILY_BUDGET_USD:
+        ratios.append(_spend["today_usd"] / DAILY_BUDGET_USD)
+    if MONTHLY_BUDGET_USD:
+        ratios.append(_spend["month_usd"] / MONTHLY_BUDGET_USD)
+    return max(ratios)
+
+
+async def admit(task, model):
+    """Model to use for a task under the current budget; raises BudgetExceeded to defer it."""
+    if not (DAILY_BUDGET_USD or MONTHLY_BUDGET_USD):
+        return model
+    await _refresh()
+    ratio = _usage_ratio()
+    if ratio >= 1 and task in BUDGET_DEFER_TASKS:
+        budget_stats["deferred"] += 1
+        raise BudgetExceeded(f"budget reached ({ratio:.0%}), {task} deferred")
+    if ratio >= BUDGET_SOFT_RATIO and task in BUDGET_DOWNGRADE_TASKS and model != OPENAI_MODEL_SMALL:
+        budget_stats["downgraded"] += 1
+        return OPENAI_MODEL_SMALL
+    return model
+
+
+async def budget_status():
+    if DAILY_BUDGET_USD or MONTHLY_BUDGET_USD:
+        await _refresh()
+    ratio = _usage_ratio()
+    return {
+        "daily_budget_usd": DAILY_BUDGET_USD or None,
+        "monthly_budget_usd": MONTHLY_BUDGET_USD or None,
+        "usage_ratio": round(ratio, 3),
+        "state": "over" if ratio >= 1 else "soft" if ratio >= BUDGET_SOFT_RATIO else "ok",
+        **budget_stats,
+    }
@@ -4,6 +4,7 @@ import json
 import hashlib
 import re
 import logging
+import zlib
 from datetime import datetime, timedelta
 
 log = logging.getLogger("agentradar")
@@ -290,6 +291,174 @@ async def init_db():
         except Exception:
             pass
 
+        # Article text store: bodies keyed by content hash, URLs (incl. Google News
+        # redirect sources) point at them, so syndicated copies share one row
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS article_texts (
+                content_hash TEXT PRIMARY KEY,
+                text_z BLOB NOT NULL,
+                created_at TEXT DEFAULT (datetime('now'))
+            )
+        """)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS article_urls (
+                url TEXT PRIMARY KEY,
+                resolved_url TEXT,
+                content_hash TEXT,
+                fetched_at TEXT DEFAULT (datetime('now'))
+            )
+        """)
+        try:
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_article_urls_hash ON article_urls(content_hash)")
+        except Exception:
+            pass
+
+        # Background press ingestion: articles + player -> article index
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS press_articles (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT UNIQUE NOT NULL,
+                source TEXT,
+                title TEXT,
+                summary TEXT,
+                published_at TEXT,
+                full_text TEXT,
+                ingested_at TEXT DEFAULT (datetime('now'))
+            )
+        """)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS player_press_index (
+                player_id INTEGER NOT NULL,
+                article_id INTEGER NOT NULL,
+                matched_at TEXT DEFAULT (datetime('now')),
+                PRIMARY KEY (player_id, article_id),
+                FOREIGN KEY (player_id) REFERENCES players(id),
+                FOREIGN KEY (article_id) REFERENCES press_articles(id)
+            )
+        """)
+        try:
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_press_index_matched ON player_press_index(player_id, matched_at)")
+        except Exception:
+            pass
+
+        # Transfermarkt parse cache (per tm_id and page kind) with change detection
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS transfermarkt_cache (
+                tm_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                data_json TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                fetched_at TEXT DEFAULT (datetime('now')),
+                changed_at TEXT DEFAULT (datetime('now')),
+                PRIMARY KEY (tm_id, kind)
+            )
+        """)
+
+        # GPT item analyses, reused for identical content (cross-player reposts, retried scans)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                content_hash TEXT NOT NULL,
+                player TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                model TEXT NOT NULL,
+                result_json TEXT NOT NULL,
+                hits INTEGER DEFAULT 0,
+                created_at TEXT DEFAULT (datetime('now')),
+                last_hit_at TEXT,
+                PRIMARY KEY (content_hash, player, prompt_version, model)
+            )
+        """)
+
+        # Real OpenAI / Apify usage per call or actor run (costs.py)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS usage_ledger (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at TEXT DEFAULT (datetime('now', 'localtime')),
+                provider TEXT NOT NULL,
+                task TEXT,
+                model TEXT,
+                job TEXT,
+                scan_log_id INTEGER,
+                player_id INTEGER,
+                prompt_tokens INTEGER DEFAULT 0,
+                completion_tokens INTEGER DEFAULT 0,
+                cached_tokens INTEGER DEFAULT 0,
+                compute_units REAL DEFAULT 0,
+                batch INTEGER DEFAULT 0,
+                cost_usd REAL DEFAULT 0
+            )
+        """)
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_created ON usage_ledger(created_at)")
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_scan ON usage_ledger(scan_log_id)")
+
+        # Incremental intelligence: living narrativas with stable IDs ("N<id>") and,
+        # per player, the last item IDs already seen by the model
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS narrative_state (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                player_id INTEGER NOT NULL,
+                titulo TEXT NOT NULL,
+                descripcion TEXT,
+                categoria TEXT,
+                severidad TEXT,
+                tendencia TEXT,
+                item_ids_json TEXT DEFAULT '[]',
+                fuentes_json TEXT DEFAULT '[]',
+                recomendacion TEXT,
+                status TEXT DEFAULT 'activa',
+                first_seen TEXT DEFAULT (datetime('now')),
+                updated_at TEXT DEFAULT (datetime('now')),
+                resolved_at TEXT,
+                FOREIGN KEY (player_id) REFERENCES players(id)
+            )
+        """)
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_narrative_state_player ON narrative_state(player_id, status)"
+        )
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS intelligence_state (
+                player_id INTEGER PRIMARY KEY,
+                press_id INTEGER DEFAULT 0,
+                social_id INTEGER DEFAULT 0,
+                post_id INTEGER DEFAULT 0,
+                risk_score REAL,
+                signals_json TEXT DEFAULT '[]',
+                resumen TEXT,
+                updated_at TEXT DEFAULT (datetime('now'))
+            )
+        """)
+
+        # GPT-4o Vision analyses keyed by perceptual image hash (scrapers/images.py);
+        # band0-3 are the hash's 16-bit slices, indexed for near-duplicate lookups
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS image_analysis_cache (
+                image_hash TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                band0 TEXT, band1 TEXT, band2 TEXT, band3 TEXT,
+                result_json TEXT NOT NULL,
+                hits INTEGER DEFAULT 0,
+                created_at TEXT DEFAULT (datetime('now')),
+                last_hit_at TEXT,
+                PRIMARY KEY (image_hash, prompt_version)
+            )
+        """)
+        for band in range(4):
+            await conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_image_cache_band{band} ON image_analysis_cache(band{band})"
+            )
+
+        # Google Trends comparison results, one row per keyword and day
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS trends_cache (
+                keyword TEXT NOT NULL,
+                geo TEXT NOT NULL,
+                time_range TEXT NOT NULL,
+                day TEXT NOT NULL,
+                data_json TEXT NOT NULL,
+                PRIMARY KEY (keyword, geo, time_range, day)
+            )
+        """)
+
         # Migrations - safe to re-run
         migrations = [
             "ALTER TABLE social_mentions ADD COLUMN content_hash TEXT",
@@ -309,6 +478,19 @@ async def init_db():
             "ALTER TABLE press_items ADD COLUMN full_text TEXT",
             # SofaScore URL for players
             "ALTER TABLE players ADD COLUMN sofascore_url TEXT",
+            # Google Trends interest relative to the roster anchor keyword
+            "ALTER TABLE player_trends ADD COLUMN relative_interest REAL",
+            # Prompt line of cached analyses (training data for the local triage model)
+            "ALTER TABLE analysis_cache ADD COLUMN item_text TEXT",
+            "ALTER TABLE narrativas ADD COLUMN narrative_id INTEGER",
+            # Full Image Index breakdown of the scan (weekly reports read it instead of recomputing)
+            "ALTER TABLE scan_reports ADD COLUMN image_index_json TEXT",
+            # Alert fingerprints: repeats refresh the alert in place
+            "ALTER TABLE alerts ADD COLUMN fingerprint TEXT",
+            "ALTER TABLE alerts ADD COLUMN item_keys_json TEXT",
+            "ALTER TABLE alerts ADD COLUMN last_seen_at TEXT",
+            "ALTER TABLE alerts ADD COLUMN occurrences INTEGER DEFAULT 1",
+            "ALTER TABLE alerts ADD COLUMN story_text TEXT",
         ]
         for m in migrations:
             try:
@@ -334,6 +516,7 @@ async def init_db():
             "CREATE INDEX IF NOT EXISTS idx_press_published ON press_items(player_id, published_at)",
             "CREATE INDEX IF NOT EXISTS idx_social_created ON social_mentions(player_id, created_at)",
             "CREATE INDEX IF NOT EXISTS idx_alerts_read ON alerts(player_id, read)",
+            "CREATE INDEX IF NOT EXISTS idx_alerts_type ON alerts(player_id, type)",
         ]:
             try:
                 await conn.execute(idx_sql)
@@ -561,17 +744,59 @@ async def insert_player_posts(player_id, items):
         return inserted
 
 
-async def insert_alert(player_id, type_, severity, title, message, data=None):
+async def insert_alert(player_id, type_, severity, title, message, data=None, fingerprint=None, item_keys=None,
+                       story_text=None):
     async with aiosqlite.connect(DB_PATH) as conn:
         await conn.execute(
-            """INSERT INTO alerts (player_id, type, severity, title, message, data_json)
-            VALUES (?, ?, ?, ?, ?, ?)""",
-            (player_id, type_, severity, title, message, json.dumps(data) if data else None),
+            """INSERT INTO alerts (player_id, type, severity, title, message, data_json, fingerprint, item_keys_json,
+                                  story_text, last_seen_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))""",
+            (player_id, type_, severity, title, message, json.dumps(data) if data else None, fingerprint,
+             json.dumps(item_keys) if item_keys is not None else None, story_text),
         )
         await conn.commit()
 
 
-async def get_press(player_id, limit=50, offset=0, date_from=None, date_to=None):
+async def get_recent_alerts(player_id, windows):
+    """{type: latest alert of that type seen within windows[type] hours} with item_keys decoded."""
+    out = {}
+    async with aiosqlite.connect(DB_PATH) as conn:
+        conn.row_factory = aiosqlite.Row
+        for type_, hours in windows.items():
+            row = await (await conn.execute(
+                """SELECT * FROM alerts
+                   WHERE player_id = ? AND type = ? AND COALESCE(last_seen_at, created_at) >= datetime('now', ?)
+                   ORDER BY id DESC LIMIT 1""",
+                (player_id, type_, f"-{int(hours)} hours"),
+            )).fetchone()
+            if row:
+                r = dict(row)
+                r["item_keys"] = json.loads(r.get("item_keys_json") or "[]")
+                out[type_] = r
+    return out
+
+
+async def refresh_alert(alert_id, title, data, fingerprint, item_keys, story_text=None, severity=None, message=None,
+                        unread=False):
+    """Update a repeated alert in place: new title/data/items/story, last_seen_at
+    and occurrences; severity, message and unread only when escalating."""
+    sets = ["title = ?", "data_json = ?", "fingerprint = ?", "item_keys_json = ?", "story_text = ?",
+            "last_seen_at = datetime('now')", "occurrences = COALESCE(occurrences, 1) + 1"]
+    params = [title, json.dumps(data) if data else None, fingerprint, json.dumps(item_keys), story_text]
+    if severity:
+        sets.append("severity = ?")
+        params.append(severity)
+    if message:
+        sets.append("message = ?")
+        params.append(message)
+    if unread:
+        sets.append("read = 0")
+    async with aiosqlite.connect(DB_PATH) as conn:
+        await conn.execute(f"UPDATE alerts SET {', '.join(sets)} WHERE id = ?", params + [alert_id])
+        await conn.commit()
+
+
+async def get_press(player_id, limit=50, offset=0, date_from=None, date_to=None, after_id=None):
     async with aiosqlite.connect(DB_PATH) as conn:
         conn.row_factory = aiosqlite.Row
         q = "SELECT * FROM press_items WHERE player_id = ?"
@@ -582,13 +807,18 @@ async def get_press(player_id, limit=50, offset=0, date_from=None, date_to=None)
         if date_to:
             q += " AND published_at <= ?"
             p.append(date_to)
-        q += " ORDER BY published_at DESC LIMIT ? OFFSET ?"
+        if after_id is not None:
+            # Incremental reads drain oldest-first so nothing past the limit is skipped
+            q += " AND id > ? ORDER BY id ASC LIMIT ? OFFSET ?"
+            p.append(after_id)
+        else:
+            q += " ORDER BY published_at DESC LIMIT ? OFFSET ?"
         p.extend([limit, offset])
         cursor = await conn.execute(q, p)
         return [dict(r) for r in await cursor.fetchall()]
 
 
-async def get_social(player_id, limit=50, offset=0, date_from=None, date_to=None, platform=None):
+async def get_social(player_id, limit=50, offset=0, date_from=None, date_to=None, after_id=None, platform=None):
     async with aiosqlite.connect(DB_PATH) as conn:
         conn.row_factory = aiosqlite.Row
         q = "SELECT * FROM social_mentions WHERE player_id = ?"
@@ -602,13 +832,18 @@ async def get_social(player_id, limit=50, offset=0, date_from=None, date_to=None
         if date_to:
             q += " AND created_at <= ?"
             p.append(date_to)
-        q += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
+        if after_id is not None:
+            # Incremental reads drain oldest-first so nothing past the limit is skipped
+            q += " AND id > ? ORDER BY id ASC LIMIT ? OFFSET ?"
+            p.append(after_id)
+        else:
+            q += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
         p.extend([limit, offset])
         cursor = await conn.execute(q, p)
         return [dict(r) for r in await cursor.fetchall()]
 
 
-async def get_player_posts_db(player_id, limit=50, offset=0, date_from=None, date_to=None):
+async def get_player_posts_db(player_id, limit=50, offset=0, date_from=None, date_to=None, after_id=None):
     async with aiosqlite.connect(DB_PATH) as conn:
         conn.row_factory = aiosqlite.Row
         q = "SELECT * FROM player_posts WHERE player_id = ?"
@@ -619,7 +854,12 @@ async def get_player_posts_db(player_id, limit=50, offset=0, date_from=None, dat
         if date_to:
             q += " AND posted_at <= ?"
             p.append(date_to)
-        q += " ORDER BY posted_at DESC LIMIT ? OFFSET ?"
+        if after_id is not None:
+            # Incremental reads drain oldest-first so nothing past the limit is skipped
+            q += " AND id > ? ORDER BY id ASC LIMIT ? OFFSET ?"
+            p.append(after_id)
+        else:
+            q += " ORDER BY posted_at DESC LIMIT ? OFFSET ?"
         p.extend([limit, offset])
         cursor = await conn.execute(q, p)
         return [dict(r) for r in await cursor.fetchall()]
@@ -655,7 +895,7 @@ async def get_alerts(player_id, limit=20):
     async with aiosqlite.connect(DB_PATH) as conn:
         conn.row_factory = aiosqlite.Row
         cursor = await conn.execute(
-            "SELECT * FROM alerts WHERE player_id = ? ORDER BY created_at DESC LIMIT ?",
+            "SELECT * FROM alerts WHERE player_id = ? ORDER BY COALESCE(last_seen_at, created_at) DESC LIMIT ?",
             (player_id, limit),
         )
         return [dict(r) for r in await cursor.fetchall()]
@@ -905,7 +1145,7 @@ async def get_alerts_filtered(player_id, limit=50, severity=None, unread_only=Fa
             params.append(severity)
         if unread_only:
             query += " AND read = 0"
-        query += " ORDER BY created_at DESC LIMIT ?"
+        query += " ORDER BY COALESCE(last_seen_at, created_at) DESC LIMIT ?"
         params.append(limit)
         cursor = await conn.execute(query, params)
         return [dict(r) for r in await cursor.fetchall()]
@@ -1149,12 +1389,12 @@ async def calculate_image_index(player_id):
         }
 
 
-async def update_scan_report_image_index(scan_log_id, image_index):
-    """Update image_index on the scan report."""
+async def update_scan_report_image_index(scan_log_id, image_index, detail=None):
+    """Update image_index (and its component breakdown) on the scan report."""
     async with aiosqlite.connect(DB_PATH) as conn:
         await conn.execute(
-            "UPDATE scan_reports SET image_index = ? WHERE scan_log_id = ?",
-            (image_index, scan_log_id),
+            "UPDATE scan_reports SET image_index = ?, image_index_json = ? WHERE scan_log_id = ?",
+            (image_index, json.dumps(detail) if detail else None, scan_log_id),
         )
         await conn.commit()
 
@@ -1237,6 +1477,50 @@ async def save_weekly_report(player_id, report_text, recommendation, image_index
         await conn.commit()
 
 
+async def save_weekly_reports(rows):
+    """Bulk save_weekly_report: rows of (player_id, report_text, recommendation, image_index, data)."""
+    async with aiosqlite.connect(DB_PATH) as conn:
+        await conn.executemany(
+            """INSERT INTO weekly_reports
+            (player_id, report_text, recommendation, image_index, data_json)
+            VALUES (?, ?, ?, ?, ?)""",
+            [(pid, text, rec, idx, json.dumps(data) if data else None) for pid, text, rec, idx, data in rows],
+        )
+        await conn.commit()
+
+
+async def get_weekly_inputs(player_ids):
+    """{player_id: {"summary", "image_index", "topics", "brands"}} from each
+    player's latest scan report in one query.
+
+    Players without a report carrying the full Image Index breakdown (never
+    scanned, or last scanned before it was stored) are left out; callers
+    compute those from the raw rows with get_summary / calculate_image_index.
+    """
+    if not player_ids:
+        return {}
+    marks = ",".join("?" * len(player_ids))
+    async with aiosqlite.connect(DB_PATH) as conn:
+        conn.row_factory = aiosqlite.Row
+        cursor = await conn.execute(
+            f"""SELECT sr.player_id, sr.summary_snapshot_json, sr.image_index_json, sr.topics_json, sr.brands_json
+                FROM scan_reports sr
+                JOIN (SELECT player_id, MAX(id) AS id FROM scan_reports
+                      WHERE player_id IN ({marks}) GROUP BY player_id) last ON last.id = sr.id""",
+            list(player_ids),
+        )
+        rows = await cursor.fetchall()
+    return {
+        r["player_id"]: {
+            "summary": json.loads(r["summary_snapshot_json"] or "{}"),
+            "image_index": json.loads(r["image_index_json"]),
+            "topics": json.loads(r["topics_json"] or "{}"),
+            "brands": json.loads(r["brands_json"] or "{}"),
+        }
+        for r in rows if r["image_index_json"]
+    }
+
+
 async def get_weekly_reports(player_id, limit=10):
     async with aiosqlite.connect(DB_PATH) as conn:
         conn.row_factory = aiosqlite.Row
@@ -1261,35 +1545,94 @@ async def get_scan_count(player_id):
         return row[0]
 
 
-async def get_cost_estimate():
-    """Estimate API costs based on scan history."""
+async def get_scan_counts():
+    """{player_id: completed scans} for the whole roster in one query."""
+    async with aiosqlite.connect(DB_PATH) as conn:
+        cursor = await conn.execute(
+            "SELECT player_id, COUNT(*) FROM scan_log WHERE status = 'completed' GROUP BY player_id"
+        )
+        return {player_id: count for player_id, count in await cursor.fetchall()}
+
+
+async def insert_usage(row):
+    """Append one usage_ledger row (see costs.py)."""
+    cols = ("provider", "task", "model", "job", "scan_log_id", "player_id", "prompt_tokens",
+            "completion_tokens", "cached_tokens", "compute_units", "batch", "cost_usd")
+    counters = {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "compute_units": 0,
+                "batch": 0, "cost_usd": 0}
+    row = {**counters, **{k: v for k, v in row.items() if v is not None}}
+    async with aiosqlite.connect(DB_PATH) as conn:
+        await conn.execute(
+            f"INSERT INTO usage_ledger ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+            [row.get(c) for c in cols],
+        )
+        await conn.commit()
+
+
+async def get_usage_totals():
+    """Spend today and this month (local time), for the budget governor."""
+    async with aiosqlite.connect(DB_PATH) as conn:
+        row = await (await conn.execute(
+            """SELECT
+                COALESCE(SUM(CASE WHEN created_at >= date('now', 'localtime') THEN cost_usd END), 0),
+                COALESCE(SUM(cost_usd), 0)
+            FROM usage_ledger WHERE created_at >= date('now', 'localtime', 'start of month')"""
+        )).fetchone()
+        return {"today_usd": row[0], "month_usd": row[1]}
+
+
+async def get_cost_report():
+    """Real API spend from usage_ledger: totals, per provider/task/model, top players and scans."""
     async with aiosqlite.connect(DB_PATH) as conn:
         conn.row_factory = aiosqlite.Row
-        # Total scans
-        row = await (await conn.execute("SELECT COUNT(*) as total FROM scan_log WHERE status = 'completed'")).fetchone()
+        row = await (await conn.execute("SELECT COUNT(*) FROM scan_log WHERE status = 'completed'")).fetchone()
         total_scans = row[0]
-        # Items analyzed (approximation)
-        row = await (await conn.execute("SELECT SUM(press_count + mentions_count + posts_count) as total FROM scan_log WHERE status = 'completed'")).fetchone()
+        row = await (await conn.execute("SELECT SUM(press_count + mentions_count + posts_count) FROM scan_log WHERE status = 'completed'")).fetchone()
         total_items = row[0] or 0
-        # Per-scan cost estimates
-        apify_per_scan = 0.03  # ~$0.03 per actor run avg (Twitter+Instagram+TikTok)
-        openai_per_item = 0.001  # ~$0.001 per item analyzed (batch of 30 ~$0.03)
-        apify_cost = total_scans * apify_per_scan * 3  # 3 actors per scan
-        openai_cost = total_items * openai_per_item
-        total = apify_cost + openai_cost
-        # This month
         row = await (await conn.execute("SELECT COUNT(*) FROM scan_log WHERE status = 'completed' AND started_at >= date('now', 'start of month')")).fetchone()
         month_scans = row[0]
-        row = await (await conn.execute("SELECT SUM(press_count + mentions_count + posts_count) FROM scan_log WHERE status = 'completed' AND started_at >= date('now', 'start of month')")).fetchone()
-        month_items = row[0] or 0
-        month_cost = (month_scans * apify_per_scan * 3) + (month_items * openai_per_item)
+
+        row = await (await conn.execute(
+            """SELECT COALESCE(SUM(cost_usd), 0) as total,
+                COALESCE(SUM(CASE WHEN created_at >= date('now', 'localtime', 'start of month') THEN cost_usd END), 0) as month,
+                COALESCE(SUM(CASE WHEN created_at >= date('now', 'localtime') THEN cost_usd END), 0) as today,
+                MIN(created_at) as since
+            FROM usage_ledger"""
+        )).fetchone()
+        totals = dict(row)
+
+        month = "created_at >= date('now', 'localtime', 'start of month')"
+        cursor = await conn.execute(
+            f"""SELECT provider, task, model, COUNT(*) as calls, SUM(prompt_tokens) as prompt_tokens,
+                SUM(completion_tokens) as completion_tokens, SUM(cached_tokens) as cached_tokens,
+                SUM(compute_units) as compute_units, SUM(batch) as batch_calls, ROUND(SUM(cost_usd), 4) as usd
+            FROM usage_ledger WHERE {month}
+            GROUP BY provider, task, model ORDER BY usd DESC"""
+        )
+        by_task = [dict(r) for r in await cursor.fetchall()]
+        cursor = await conn.execute(
+            f"""SELECT u.player_id, p.name, COUNT(DISTINCT u.scan_log_id) as scans, ROUND(SUM(u.cost_usd), 4) as usd
+            FROM usage_ledger u LEFT JOIN players p ON p.id = u.player_id
+            WHERE u.{month} GROUP BY u.player_id ORDER BY usd DESC LIMIT 20"""
+        )
+        by_player = [dict(r) for r in await cursor.fetchall()]
+        row = await (await conn.execute(
+            f"""SELECT COUNT(DISTINCT scan_log_id), SUM(cost_usd) FROM usage_ledger
+            WHERE {month} AND scan_log_id IS NOT NULL"""
+        )).fetchone()
+        per_scan = round(row[1] / row[0], 4) if row[0] else None
+
         return {
             "total_scans": total_scans,
             "total_items": total_items,
-            "estimated_total_usd": round(total, 2),
             "month_scans": month_scans,
-            "month_items": month_items,
-            "estimated_month_usd": round(month_cost, 2),
+            "total_usd": round(totals["total"], 2),
+            "month_usd": round(totals["month"], 2),
+            "today_usd": round(totals["today"], 2),
+            "since": totals["since"],
+            "month_usd_per_scan": per_scan,
+            "month_by_task": by_task,
+            "month_by_player": by_player,
         }
 
 
@@ -1441,15 +1784,16 @@ async def save_intelligence_report(player_id, scan_log_id, data):
                 """INSERT INTO narrativas
                 (player_id, intelligence_report_id, titulo, descripcion,
                  categoria, severidad, tendencia, num_items, item_ids_json,
-                 fuentes_json, recomendacion)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                 fuentes_json, recomendacion, narrative_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
                 (player_id, report_id, n.get("titulo", ""),
                  n.get("descripcion", ""), n.get("categoria", "otro"),
                  n.get("severidad", "bajo"), n.get("tendencia", "estable"),
                  len(n.get("items", [])),
                  json.dumps(n.get("items", [])),
                  json.dumps(n.get("fuentes", [])),
-                 n.get("recomendacion", "")),
+                 n.get("recomendacion", ""),
+                 int(n["id"][1:]) if str(n.get("id", "")).startswith("N") else None),
             )
         await conn.commit()
         return report_id
@@ -1484,6 +1828,126 @@ async def get_last_intelligence_report(player_id):
         return None
 
 
+async def get_item_watermarks(player_id):
+    """Highest press/social/post item IDs stored for a player (read before a
+    full intelligence pass; its watermarks never go below these)."""
+    async with aiosqlite.connect(DB_PATH) as conn:
+        marks = {}
+        for key, table in (("press_id", "press_items"), ("social_id", "social_mentions"), ("post_id", "player_posts")):
+            cursor = await conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table} WHERE player_id = ?", (player_id,))
+            marks[key] = (await cursor.fetchone())[0]
+        return marks
+
+
+def _narrative_row(r):
+    return {
+        "id": f"N{r['id']}",
+        "titulo": r["titulo"],
+        "descripcion": r["descripcion"] or "",
+        "categoria": r["categoria"] or "otro",
+        "severidad": r["severidad"] or "bajo",
+        "tendencia": r["tendencia"] or "estable",
+        "items": json.loads(r["item_ids_json"] or "[]"),
+        "fuentes": json.loads(r["fuentes_json"] or "[]"),
+        "recomendacion": r["recomendacion"] or "",
+        "first_seen": r["first_seen"],
+        "updated_at": r["updated_at"],
+    }
+
+
+async def get_intelligence_state(player_id):
+    """Watermarks, last risk/signals and active narrativas of a player, or None
+    before the first incremental pass."""
+    async with aiosqlite.connect(DB_PATH) as conn:
+        conn.row_factory = aiosqlite.Row
+        cursor = await conn.execute("SELECT * FROM intelligence_state WHERE player_id = ?", (player_id,))
+        row = await cursor.fetchone()
+        if not row:
+            return None
+        state = dict(row)
+        state["signals"] = json.loads(state.pop("signals_json") or "[]")
+        cursor = await conn.execute(
+            """SELECT * FROM narrative_state WHERE player_id = ? AND status = 'activa'
+            ORDER BY updated_at DESC""",
+            (player_id,),
+        )
+        state["narrativas"] = [_narrative_row(r) for r in await cursor.fetchall()]
+        return state
+
+
+async def apply_narrative_patches(player_id, nuevas, actualizadas, resueltas, watermarks,
+                                  risk_score, signals, resumen, stale_days, max_items=50):
+    """Apply one intelligence pass to the narrative store and return the active narrativas.
+
+    nuevas: narrativa dicts to insert; actualizadas: dicts with "id" ("N12"),
+    the fields to overwrite and "items_nuevos" to append; resueltas: IDs to
+    close. Narrativas without updates for stale_days are closed too.
+    """
+    async with aiosqlite.connect(DB_PATH) as conn:
+        conn.row_factory = aiosqlite.Row
+        for n in nuevas:
+            await conn.execute(
+                """INSERT INTO narrative_state
+                (player_id, titulo, descripcion, categoria, severidad, tendencia,
+                 item_ids_json, fuentes_json, recomendacion)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (player_id, n.get("titulo", ""), n.get("descripcion", ""), n.get("categoria", "otro"),
+                 n.get("severidad", "bajo"), n.get("tendencia", "estable"),
+                 json.dumps(list(dict.fromkeys(n.get("items", [])))[-max_items:]),
+                 json.dumps(n.get("fuentes", [])), n.get("recomendacion", "")),
+            )
+
+        for patch in actualizadas:
+            cursor = await conn.execute(
+                "SELECT * FROM narrative_state WHERE id = ? AND player_id = ?",
+                (int(patch["id"][1:]), player_id),
+            )
+            row = await cursor.fetchone()
+            if not row:
+                continue
+            current = _narrative_row(row)
+            items = list(dict.fromkeys(current["items"] + patch.get("items_nuevos", [])))[-max_items:]
+            fuentes = list(dict.fromkeys(current["fuentes"] + patch.get("fuentes", [])))
+            await conn.execute(
+                """UPDATE narrative_state SET titulo = ?, descripcion = ?, categoria = ?, severidad = ?,
+                tendencia = ?, item_ids_json = ?, fuentes_json = ?, recomendacion = ?, status = 'activa',
+                updated_at = datetime('now') WHERE id = ?""",
+                (patch.get("titulo") or current["titulo"], patch.get("descripcion") or current["descripcion"],
+                 patch.get("categoria") or current["categoria"], patch.get("severidad") or current["severidad"],
+                 patch.get("tendencia") or current["tendencia"], json.dumps(items), json.dumps(fuentes),
+                 patch.get("recomendacion") or current["recomendacion"], row["id"]),
+            )
+
+        ids = [int(n[1:]) for n in resueltas]
+        if ids:
+            await conn.execute(
+                f"""UPDATE narrative_state SET status = 'resuelta', resolved_at = datetime('now')
+                WHERE player_id = ? AND id IN ({",".join("?" * len(ids))})""",
+                (player_id, *ids),
+            )
+        await conn.execute(
+            """UPDATE narrative_state SET status = 'resuelta', resolved_at = datetime('now')
+            WHERE player_id = ? AND status = 'activa' AND updated_at < datetime('now', '-' || ? || ' days')""",
+            (player_id, stale_days),
+        )
+
+        await conn.execute(
+            """INSERT OR REPLACE INTO intelligence_state
+            (player_id, press_id, social_id, post_id, risk_score, signals_json, resumen, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))""",
+            (player_id, watermarks["press_id"], watermarks["social_id"], watermarks["post_id"],
+             risk_score, json.dumps(signals, ensure_ascii=False), resumen),
+        )
+        await conn.commit()
+
+        cursor = await conn.execute(
+            """SELECT * FROM narrative_state WHERE player_id = ? AND status = 'activa'
+            ORDER BY updated_at DESC""",
+            (player_id,),
+        )
+        return [_narrative_row(r) for r in await cursor.fetchall()]
+
+
 async def get_intelligence_history(player_id, limit=10):
     """Get intelligence report history (risk score trend)."""
     async with aiosqlite.connect(DB_PATH) as conn:
@@ -1669,15 +2133,31 @@ async def save_player_trends(player_id, trends):
     async with aiosqlite.connect(DB_PATH) as conn:
         await conn.execute(
             """INSERT INTO player_trends (player_id, average_interest, peak_interest,
-               trend_direction, data_points, timeline_json)
-               VALUES (?, ?, ?, ?, ?, ?)""",
+               trend_direction, data_points, timeline_json, relative_interest)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
             (player_id, trends.get("average_interest", 0), trends.get("peak_interest", 0),
              trends.get("trend_direction", "stable"), trends.get("data_points", 0),
-             json.dumps(trends.get("timeline", []))),
+             json.dumps(trends.get("timeline", [])), trends.get("relative_interest")),
         )
         await conn.commit()
 
 
+async def get_latest_relative_interest(player_ids):
+    """{player_id: relative_interest of the latest Trends row that has one}."""
+    if not player_ids:
+        return {}
+    player_ids = list(player_ids)
+    async with aiosqlite.connect(DB_PATH) as conn:
+        cursor = await conn.execute(
+            f"""SELECT player_id, relative_interest FROM player_trends t
+            WHERE player_id IN ({",".join("?" * len(player_ids))}) AND relative_interest IS NOT NULL
+              AND scraped_at = (SELECT MAX(scraped_at) FROM player_trends
+                                WHERE player_id = t.player_id AND relative_interest IS NOT NULL)""",
+            player_ids,
+        )
+        return {player_id: value for player_id, value in await cursor.fetchall()}
+
+
 async def get_player_trends(player_id):
     """Get latest Google Trends data for a player."""
     async with aiosqlite.connect(DB_PATH) as conn:
@@ -1919,3 +2399,375 @@ async def get_activity_by_platform(player_id):
             platforms[platform]["peak_days"] = [dict(d) for d in days]
 
         return platforms
+
+
+# ── Article text store ──
+
+async def get_cached_articles(urls, ttl_hours, failed_ttl_hours):
+    """Look up stored article text for urls.
+
+    Returns {url: text} for fresh entries only. Failed fetches are stored with
+    no content and returned as "" until failed_ttl_hours passes.
+    """
+    urls = list(dict.fromkeys(u for u in urls if u))
+    if not urls:
+        return {}
+    found = {}
+    async with aiosqlite.connect(DB_PATH) as conn:
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = await conn.execute_fetchall(
+                f"""SELECT u.url, u.content_hash, t.text_z FROM article_urls u
+                LEFT JOIN article_texts t ON t.content_hash = u.content_hash
+                WHERE u.url IN ({placeholders})
+                AND u.fetched_at >= datetime('now', '-' || (CASE WHEN u.content_hash IS NULL THEN ? ELSE ? END) || ' hours')""",
+                (*chunk, failed_ttl_hours, ttl_hours),
+            )
+            for url, content_hash, text_z in rows:
+                if content_hash is None:
+                    found[url] = ""
+                elif text_z is not None:
+                    found[url] = zlib.decompress(text_z).decode("utf-8")
+    return found
+
+
+async def save_articles(entries):
+    """Store fetched articles. entries: list of (url, resolved_url, text).
+
+    The body is stored once per content hash; both the requested URL and the
+    resolved URL (when a redirect was followed) map to it.
+    """
+    if not entries:
+        return
+    async with aiosqlite.connect(DB_PATH) as conn:
+        for url, resolved_url, text in entries:
+            content_hash = None
+            if text:
+                content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+                await conn.execute(
+                    "INSERT OR IGNORE INTO article_texts (content_hash, text_z) VALUES (?, ?)",
+                    (content_hash, zlib.compress(text.encode("utf-8"), 6)),
+                )
+            for u in {url, resolved_url or url}:
+                await conn.execute(
+                    "INSERT OR REPLACE INTO article_urls (url, resolved_url, content_hash, fetched_at) "
+                    "VALUES (?, ?, ?, datetime('now'))",
+                    (u, resolved_url or url, content_hash),
+                )
+        await conn.commit()
+
+
+async def prune_article_store(ttl_hours):
+    """Drop expired URL entries and article bodies no URL points at."""
+    async with aiosqlite.connect(DB_PATH) as conn:
+        cursor = await conn.execute(
+            "DELETE FROM article_urls WHERE fetched_at < datetime('now', '-' || ? || ' hours')",
+            (ttl_hours,),
+        )
+        removed = cursor.rowcount
+        await conn.execute(
+            "DELETE FROM article_texts WHERE content_hash NOT IN "
+            "(SELECT content_hash FROM article_urls WHERE content_hash IS NOT NULL)"
+        )
+        await conn.commit()
+    return removed
+
+
+# ── Press ingestion index ──
+
+async def save_ingested_articles(items):
+    """Insert new articles (existing URLs are kept). Returns {url: (article_id, has_text)}."""
+    urls = list(dict.fromkeys(i["url"] for i in items if i.get("url")))
+    if not urls:
+        return {}
+    async with aiosqlite.connect(DB_PATH) as conn:
+        await conn.executemany(
+            """INSERT OR IGNORE INTO press_articles (url, source, title, summary, published_at, full_text)
+            VALUES (?, ?, ?, ?, ?, ?)""",
+            [(i["url"], i.get("source", ""), i.get("title", ""), i.get("summary", ""),
+              i.get("published_at", ""), i.get("full_text")) for i in items if i.get("url")],
+        )
+        await conn.commit()
+        found = {}
+        for start in range(0, len(urls), 500):
+            chunk = urls[start:start + 500]
+            rows = await conn.execute_fetchall(
+                f"SELECT url, id, full_text IS NOT NULL AND full_text != '' FROM press_articles "
+                f"WHERE url IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            found.update({url: (aid, bool(has_text)) for url, aid, has_text in rows})
+    return found
+
+
+async def index_player_articles(pairs):
+    """Link (player_id, article_id) pairs. Returns how many links are new."""
+    if not pairs:
+        return 0
+    async with aiosqlite.connect(DB_PATH) as conn:
+        before = conn.total_changes
+        await conn.executemany(
+            "INSERT OR IGNORE INTO player_press_index (player_id, article_id) VALUES (?, ?)",
+            list(set(pairs)),
+        )
+        new = conn.total_changes - before
+        await conn.commit()
+    return new
+
+
+async def set_ingested_article_texts(texts):
+    """texts: {article_id: full_text}."""
+    if not texts:
+        return
+    async with aiosqlite.connect(DB_PATH) as conn:
+        await conn.executemany(
+            "UPDATE press_articles SET full_text = ? WHERE id = ?",
+            [(text, aid) for aid, text in texts.items() if text],
+        )
+        await conn.commit()
+
+
+async def get_indexed_press(player_id, days):
+    """Press items indexed for a player in the last `days`, shaped like scrape_all_press output."""
+    async with aiosqlite.connect(DB_PATH) as conn:
+        conn.row_factory = aiosqlite.Row
+        rows = await conn.execute_fetchall(
+            """SELECT a.source, a.title, a.url, a.summary, a.published_at, a.full_text
+            FROM player_press_index i JOIN press_articles a ON a.id = i.article_id
+            WHERE i.player_id = ? AND i.matched_at >= datetime('now', '-' || ? || ' days')
+            ORDER BY i.matched_at DESC""",
+            (player_id, days),
+        )
+    items = []
+    for r in rows:
+        item = dict(r)
+        if not item["full_text"]:
+            del item["full_text"]
+        items.append(item)
+    return items
+
+
+async def prune_press_index(days):
+    """Drop index links and articles older than `days`."""
+    async with aiosqlite.connect(DB_PATH) as conn:
+        await conn.execute(
+            "DELETE FROM player_press_index WHERE matched_at < datetime('now', '-' || ? || ' days')", (days,),
+        )
+        cursor = await conn.execute(
+            """DELETE FROM press_articles WHERE ingested_at < datetime('now', '-' || ? || ' days')
+            AND id NOT IN (SELECT article_id FROM player_press_index)""",
+            (days,),
+        )
+        removed = cursor.rowcount
+        await conn.commit()
+    return removed
+
+
+# ── Transfermarkt cache ──
+
+async def get_transfermarkt_cache(tm_id, kind, ttl_hours):
+    """Cached parsed data for (tm_id, kind) if fetched within ttl_hours, else None."""
+    async with aiosqlite.connect(DB_PATH) as conn:
+        cursor = await conn.execute(
+            """SELECT data_json FROM transfermarkt_cache WHERE tm_id = ? AND kind = ?
+            AND fetched_at >= datetime('now', '-' || ? || ' hours')""",
+            (str(tm_id), kind, ttl_hours),
+        )
+        row = await cursor.fetchone()
+    return json.loads(row[0]) if row else None
+
+
+async def save_transfermarkt_cache(tm_id, kind, data):
+    """Store freshly parsed data. Returns True if it differs from the previous fetch."""
+    data_json = json.dumps(data, sort_keys=True, ensure_ascii=False)
+    content_hash = hashlib.sha256(data_json.encode("utf-8")).hexdigest()
+    async with aiosqlite.connect(DB_PATH) as conn:
+        cursor = await conn.execute(
+            "SELECT content_hash FROM transfermarkt_cache WHERE tm_id = ? AND kind = ?", (str(tm_id), kind),
+        )
+        row = await cursor.fetchone()
+        changed = not row or row[0] != content_hash
+        if changed:
+            await conn.execute(
+                """INSERT OR REPLACE INTO transfermarkt_cache (tm_id, kind, data_json, content_hash, fetched_at, changed_at)
+                VALUES (?, ?, ?, ?, datetime('now'), datetime('now'))""",
+                (str(tm_id), kind, data_json, content_hash),
+            )
+        else:
+            await conn.execute(
+                "UPDATE transfermarkt_cache SET fetched_at = datetime('now') WHERE tm_id = ? AND kind = ?",
+                (str(tm_id), kind),
+            )
+        await conn.commit()
+    return changed
+
+
+async def get_trends_cache(keywords, geo, time_range):
+    """Today's cached Trends results for keywords: {keyword: data}."""
+    if not keywords:
+        return {}
+    keywords = list(keywords)
+    placeholders = ",".join("?" * len(keywords))
+    async with aiosqlite.connect(DB_PATH) as conn:
+        cursor = await conn.execute(
+            f"""SELECT keyword, data_json FROM trends_cache
+            WHERE geo = ? AND time_range = ? AND day = date('now') AND keyword IN ({placeholders})""",
+            (geo, time_range, *keywords),
+        )
+        rows = await cursor.fetchall()
+    return {k: json.loads(d) for k, d in rows}
+
+
+async def save_trends_cache(results, geo, time_range):
+    """Store {keyword: data} for today and drop rows from previous days."""
+    async with aiosqlite.connect(DB_PATH) as conn:
+        await conn.executemany(
+            """INSERT OR REPLACE INTO trends_cache (keyword, geo, time_range, day, data_json)
+            VALUES (?, ?, ?, date('now'), ?)""",
+            [(k, geo, time_range, json.dumps(d)) for k, d in results.items()],
+        )
+        await conn.execute("DELETE FROM trends_cache WHERE day < date('now')")
+        await conn.commit()
+
+
+async def get_cached_analyses(hashes, player, prompt_version, model):
+    """Cached analyses for content hashes: {content_hash: result}. Counts a hit on each."""
+    hashes = list(dict.fromkeys(hashes))
+    if not hashes:
+        return {}
+    found = {}
+    async with aiosqlite.connect(DB_PATH) as conn:
+        for i in range(0, len(hashes), 500):
+            chunk = hashes[i:i + 500]
+            cursor = await conn.execute(
+                f"""SELECT content_hash, result_json FROM analysis_cache
+                WHERE player = ? AND prompt_version = ? AND model = ?
+                AND content_hash IN ({",".join("?" * len(chunk))})""",
+                (player, prompt_version, model, *chunk),
+            )
+            found.update({h: json.loads(r) for h, r in await cursor.fetchall()})
+        if found:
+            await conn.executemany(
+                """UPDATE analysis_cache SET hits = hits + 1, last_hit_at = datetime('now')
+                WHERE content_hash = ? AND player = ? AND prompt_version = ? AND model = ?""",
+                [(h, player, prompt_version, model) for h in found],
+            )
+            await conn.commit()
+    return found
+
+
+async def save_analyses(results, player, prompt_version, model, texts=None):
+    """Store {content_hash: result} for a player/prompt version/model.
+
+    texts: optional {content_hash: prompt line}, kept for training the triage model.
+    """
+    if not results:
+        return
+    texts = texts or {}
+    async with aiosqlite.connect(DB_PATH) as conn:
+        await conn.executemany(
+            """INSERT OR REPLACE INTO analysis_cache (content_hash, player, prompt_version, model, result_json, item_text)
+            VALUES (?, ?, ?, ?, ?, ?)""",
+            [(h, player, prompt_version, model, json.dumps(r, ensure_ascii=False), texts.get(h))
+             for h, r in results.items()],
+        )
+        await conn.commit()
+
+
+async def find_image_analyses(image_hashes, prompt_version, max_distance):
+    """Cached Vision analyses for image hashes: {image_hash: result}.
+
+    A perceptual hash matches the closest cached hash within max_distance
+    bits (candidates share a 16-bit band, so max_distance <= 3 never misses);
+    "sha1:" hashes only match exactly. Counts a hit on each match.
+    """
+    from scrapers.images import bands, hamming
+    found, matched = {}, set()
+    async with aiosqlite.connect(DB_PATH) as conn:
+        for image_hash in dict.fromkeys(image_hashes):
+            if image_hash.startswith("sha1:"):
+                cursor = await conn.execute(
+                    """SELECT image_hash, result_json FROM image_analysis_cache
+                    WHERE image_hash = ? AND prompt_version = ?""",
+                    (image_hash, prompt_version),
+                )
+                candidates = [(0, h, r) for h, r in await cursor.fetchall()]
+            else:
+                cursor = await conn.execute(
+                    """SELECT image_hash, result_json FROM image_analysis_cache
+                    WHERE prompt_version = ? AND (band0 = ? OR band1 = ? OR band2 = ? OR band3 = ?)""",
+                    (prompt_version, *bands(image_hash)),
+                )
+                candidates = [(hamming(h, image_hash), h, r) for h, r in await cursor.fetchall()]
+                candidates = [c for c in candidates if c[0] <= max_distance]
+            if candidates:
+                _, best, result = min(candidates)
+                found[image_hash] = json.loads(result)
+                matched.add(best)
+        if matched:
+            await conn.executemany(
+                """UPDATE image_analysis_cache SET hits = hits + 1, last_hit_at = datetime('now')
+                WHERE image_hash = ? AND prompt_version = ?""",
+                [(h, prompt_version) for h in matched],
+            )
+            await conn.commit()
+    return found
+
+
+async def save_image_analyses(results, prompt_version):
+    """Store {image_hash: result} Vision analyses."""
+    if not results:
+        return
+    from scrapers.images import bands
+    async with aiosqlite.connect(DB_PATH) as conn:
+        await conn.executemany(
+            """INSERT OR REPLACE INTO image_analysis_cache
+            (image_hash, prompt_version, band0, band1, band2, band3, result_json)
+            VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            [(h, prompt_version, *([None] * 4 if h.startswith("sha1:") else bands(h)),
+              json.dumps(r, ensure_ascii=False)) for h, r in results.items()],
+        )
+        await conn.commit()
+
+
+async def get_triage_training_rows(limit=50000):
+    """Most recent GPT verdicts with their prompt text: [(player, item_text, result)]."""
+    async with aiosqlite.connect(DB_PATH) as conn:
+        cursor = await conn.execute(
+            """SELECT player, item_text, result_json FROM analysis_cache
+            WHERE item_text IS NOT NULL ORDER BY created_at DESC LIMIT ?""",
+            (limit,),
+        )
+        rows = await cursor.fetchall()
+    return [(player, text, json.loads(result)) for player, text, result in rows]
+
+
+async def get_analysis_cache_stats():
+    """Entries and lifetime hits of the item and image analysis caches, per prompt version and model."""
+    async with aiosqlite.connect(DB_PATH) as conn:
+        conn.row_factory = aiosqlite.Row
+        cursor = await conn.execute(
+            """SELECT prompt_version, model, COUNT(*) as entries, COALESCE(SUM(hits), 0) as hits,
+            MIN(created_at) as oldest FROM analysis_cache GROUP BY prompt_version, model
+            UNION ALL
+            SELECT prompt_version, 'gpt-4o-vision', COUNT(*), COALESCE(SUM(hits), 0), MIN(created_at)
+            FROM image_analysis_cache GROUP BY prompt_version
+            ORDER BY prompt_version DESC, model"""
+        )
+        return [dict(r) for r in await cursor.fetchall()]
+
+
+async def prune_analysis_cache(ttl_days):
+    """Drop item and image analyses not created or hit in the last ttl_days."""
+    removed = 0
+    async with aiosqlite.connect(DB_PATH) as conn:
+        for table in ("analysis_cache", "image_analysis_cache"):
+            cursor = await conn.execute(
+                f"""DELETE FROM {table}
+                WHERE COALESCE(last_hit_at, created_at) < datetime('now', '-' || ? || ' days')""",
+                (ttl_days,),
+            )
+            removed += cursor.rowcount
+        await conn.commit()
+        return removed
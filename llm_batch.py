@@ -0,0 +1,180 @@
+"""OpenAI Batch API mode for scheduled jobs.
+
+Inside `async with batch_mode():` (daily scan and weekly report jobs when
+OPENAI_BATCH_MODE is on) analyzer._chat() does not call chat completions
+directly. Each request is queued on the active collector and the caller
+awaits a future. The collector flushes its queue into a JSONL batch file
+once OPENAI_BATCH_WINDOW_SECONDS pass without new requests, or once
+OPENAI_BATCH_MAX_REQUESTS are queued. It then uploads the file, creates the
+batch, polls it until it ends, and resolves each future with its
+ChatCompletion. Requests in a failed, expired or timed-out batch, or that
+come back with an error, are retried synchronously, so callers always get
+the same result types as in interactive mode.
+
+The collector is carried in a contextvar, so only tasks started inside the
+block are batched. Interactive scans running at the same time stay
+synchronous. For local testing point OPENAI_BASE_URL at
+benchmarks/mock_openai.py.
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from openai.types.chat import ChatCompletion
+
+from config import (
+    OPENAI_BATCH_WINDOW_SECONDS, OPENAI_BATCH_MAX_REQUESTS, OPENAI_BATCH_POLL_SECONDS,
+    OPENAI_BATCH_TIMEOUT_HOURS,
+)
+
+log = logging.getLogger("agentradar")
+
+ENDPOINT = "/v1/chat/completions"
+FAILED_STATUSES = {"failed", "expired", "cancelled"}
+
+_collector = ContextVar("llm_batch_collector", default=None)
+
+batch_status = {"batches": 0, "requests": 0, "fallbacks": 0, "in_flight": 0, "last_batch": None}
+
+
+class BatchCollector:
+    def __init__(self, client, fallback, label):
+        self.client = client
+        self.fallback = fallback  # async fn(**kwargs) -> ChatCompletion, used for failed requests
+        self.label = label
+        self._queue = []  # (custom_id, kwargs, future)
+        self._timer = None
+        self._tasks = set()
+
+    async def submit(self, kwargs):
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((uuid.uuid4().hex, kwargs, future))
+        if len(self._queue) >= OPENAI_BATCH_MAX_REQUESTS:
+            self._flush()
+        else:
+            # Debounce: flush once the pipeline stops producing requests
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = asyncio.get_running_loop().call_later(OPENAI_BATCH_WINDOW_SECONDS, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._queue:
+            return
+        queue, self._queue = self._queue, []
+        task = asyncio.ensure_future(self._run(queue))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, queue):
+        pending = {cid: (kwargs, future) for cid, kwargs, future in queue}
+        batch_status["in_flight"] += 1
+        try:
+            results = await self._execute(pending)
+        except Exception as e:
+            log.error(f"[llm-batch] {self.label}: batch error, falling back to sync: {e}")
+            results = {}
+        finally:
+            batch_status["in_flight"] -= 1
+
+        for cid, (kwargs, future) in pending.items():
+            if future.done():
+                continue
+            if cid in results:
+                future.set_result(results[cid])
+            else:
+                batch_status["fallbacks"] += 1
+                self._resolve_sync(kwargs, future)
+
+    def _resolve_sync(self, kwargs, future):
+        async def run():
+            try:
+                future.set_result(await self.fallback(**kwargs))
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+        task = asyncio.ensure_future(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self, pending):
+        """Upload, create and poll one batch. Returns {custom_id: ChatCompletion} for successes."""
+        lines = [
+            json.dumps({"custom_id": cid, "method": "POST", "url": ENDPOINT, "body": kwargs}, ensure_ascii=False)
+            for cid, (kwargs, _) in pending.items()
+        ]
+        upload = await self.client.files.create(
+            file=("batch.jsonl", ("\n".join(lines) + "\n").encode("utf-8"), "application/jsonl"),
+            purpose="batch",
+        )
+        batch = await self.client.batches.create(
+            input_file_id=upload.id, endpoint=ENDPOINT, completion_window="24h",
+            metadata={"job": self.label},
+        )
+        batch_status["batches"] += 1
+        batch_status["requests"] += len(pending)
+        log.info(f"[llm-batch] {self.label}: batch {batch.id} submitted ({len(pending)} requests)")
+
+        started = time.monotonic()
+        deadline = started + OPENAI_BATCH_TIMEOUT_HOURS * 3600
+        while batch.status not in FAILED_STATUSES and batch.status != "completed":
+            if time.monotonic() > deadline:
+                log.warning(f"[llm-batch] {batch.id} still {batch.status} after {OPENAI_BATCH_TIMEOUT_HOURS}h, cancelling")
+                try:
+                    await self.client.batches.cancel(batch.id)
+                except Exception:
+                    pass
+                return {}
+            await asyncio.sleep(OPENAI_BATCH_POLL_SECONDS)
+            batch = await self.client.batches.retrieve(batch.id)
+
+        batch_status["last_batch"] = {
+            "id": batch.id, "job": self.label, "status": batch.status, "requests": len(pending),
+            "seconds": round(time.monotonic() - started),
+        }
+        if batch.status != "completed" or not batch.output_file_id:
+            log.warning(f"[llm-batch] {batch.id} ended {batch.status}")
+            return {}
+
+        content = await self.client.files.content(batch.output_file_id)
+        results = {}
+        for line in content.text.splitlines():
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            response = row.get("response") or {}
+            if row.get("error") or response.get("status_code") != 200:
+                continue
+            results[row["custom_id"]] = ChatCompletion.model_validate(response["body"])
+        log.info(f"[llm-batch] {batch.id} completed: {len(results)}/{len(pending)} ok "
+                 f"in {time.monotonic() - started:.0f}s")
+        return results
+
+    async def close(self):
+        self._flush()
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+
+def current():
+    """The collector of the enclosing batch_mode() block, or None."""
+    return _collector.get()
+
+
+@asynccontextmanager
+async def batch_mode(client, fallback, label):
+    """Route every _chat() call made by tasks started inside the block through the Batch API."""
+    collector = BatchCollector(client, fallback, label)
+    token = _collector.set(collector)
+    try:
+        yield collector
+    finally:
+        _collector.reset(token)
+        await collector.close()
@@ -0,0 +1,150 @@
+"""Process-wide OpenAI rate governor and local token estimator.
+
+Every GPT call (analyzer._chat) leases its estimated tokens from one shared
+token bucket refilled at OPENAI_TPM_LIMIT per minute, plus one request from
+an OPENAI_RPM_LIMIT bucket, and holds one of OPENAI_MAX_CONCURRENT slots
+while in flight. Concurrent scans therefore queue here instead of tripping
+429s at OpenAI. Leases reserve prompt estimate + max_tokens (what OpenAI's
+limiter counts) and are settled with the real usage when the response comes
+back.
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+from config import OPENAI_TPM_LIMIT, OPENAI_RPM_LIMIT, OPENAI_MAX_CONCURRENT
+
+log = logging.getLogger("agentradar")
+
+MESSAGE_OVERHEAD = 4  # role/separator tokens per chat message
+IMAGE_TOKENS_LOW = 85  # vision input with detail=low
+IMAGE_TOKENS_HIGH = 765
+
+
+def estimate_tokens(text):
+    """Rough token count without a tokenizer.
+
+    ~4 characters per token for Latin text, closer to one token per character
+    for Arabic and other non-ASCII scripts; errs on the high side.
+    """
+    if not text:
+        return 0
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return int((len(text) - non_ascii) / 3.6 + non_ascii * 0.8) + 1
+
+
+def estimate_messages(messages):
+    total = 3  # reply priming
+    for message in messages:
+        total += MESSAGE_OVERHEAD
+        content = message.get("content") or ""
+        if isinstance(content, str):
+            total += estimate_tokens(content)
+            continue
+        for part in content:
+            if part.get("type") == "text":
+                total += estimate_tokens(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                detail = (part.get("image_url") or {}).get("detail", "auto")
+                total += IMAGE_TOKENS_LOW if detail == "low" else IMAGE_TOKENS_HIGH
+    return total
+
+
+class Lease:
+    def __init__(self, reserved):
+        self.reserved = reserved
+        self.used = None  # set to response.usage.total_tokens by the caller
+
+
+class RateGovernor:
+    def __init__(self, tpm, rpm, max_concurrent):
+        self.tpm = tpm
+        self.rpm = rpm
+        self._tokens = float(tpm)
+        self._requests = float(rpm)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()  # FIFO: waiters are admitted in arrival order
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self.max_concurrent = max_concurrent
+        self.in_flight = 0
+        self.requests = 0
+        self.tokens_reserved = 0
+        self.tokens_used = 0
+        self.wait_seconds = 0.0
+        self.rate_limited = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+
+    async def _acquire(self, tokens):
+        tokens = min(tokens, self.tpm)
+        started = time.monotonic()
+        async with self._lock:
+            while True:
+                self._refill()
+                pause = self._paused_until - time.monotonic()
+                if pause <= 0 and self._tokens >= tokens and self._requests >= 1:
+                    self._tokens -= tokens
+                    self._requests -= 1
+                    break
+                wait = max(
+                    pause,
+                    (tokens - self._tokens) * 60 / self.tpm,
+                    (1 - self._requests) * 60 / self.rpm,
+                    0.05,
+                )
+                await asyncio.sleep(wait)
+        self.wait_seconds += time.monotonic() - started
+        return tokens
+
+    def _settle(self, lease):
+        used = lease.used if lease.used is not None else lease.reserved
+        self.tokens_used += used
+        self._refill()
+        # Give back what was reserved but not used (or charge an overrun)
+        self._tokens = min(self.tpm, self._tokens + lease.reserved - used)
+
+    def backoff(self, seconds):
+        """OpenAI answered 429: stop admitting requests for a while."""
+        self.rate_limited += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        log.warning(f"[llm] Rate limited by OpenAI, pausing {seconds:.0f}s")
+
+    @asynccontextmanager
+    async def lease(self, tokens):
+        """Hold a concurrency slot and tokens/requests for one API call."""
+        async with self._slots:
+            reserved = await self._acquire(tokens)
+            lease = Lease(reserved)
+            self.in_flight += 1
+            self.requests += 1
+            self.tokens_reserved += reserved
+            try:
+                yield lease
+            finally:
+                self.in_flight -= 1
+                self._settle(lease)
+
+    def snapshot(self):
+        self._refill()
+        return {
+            "tpm_limit": self.tpm,
+            "rpm_limit": self.rpm,
+            "max_concurrent": self.max_concurrent,
+            "in_flight": self.in_flight,
+            "tokens_available": int(self._tokens),
+            "requests": self.requests,
+            "tokens_reserved": self.tokens_reserved,
+            "tokens_used": self.tokens_used,
+            "wait_seconds": round(self.wait_seconds, 1),
+            "rate_limited": self.rate_limited,
+        }
+
+
+governor = RateGovernor(OPENAI_TPM_LIMIT, OPENAI_RPM_LIMIT, OPENAI_MAX_CONCURRENT)
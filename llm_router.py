@@ -0,0 +1,103 @@
+"""Per-task model routing and metrics for analyzer GPT calls.
+
+Each call site in analyzer.py names its task; MODEL_ROUTES maps the task to a
+model tier (OPENAI_MODEL_SMALL / OPENAI_MODEL_LARGE). Item analysis is a
+cascade: the small model answers first, and items it is unsure about
+(confidence < CASCADE_MIN_CONFIDENCE) or that touch CASCADE_ESCALATE_TOPICS
+are asked again on the "sentiment_escalation" route.
+
+Latency, tokens (including the prompt tokens OpenAI served from its prefix
+cache), errors and escalations are counted per task and model since startup
+(GET /api/llm/models).
+"""
+import time
+
+from config import MODEL_ROUTES, CASCADE_MIN_CONFIDENCE, CASCADE_ESCALATE_TOPICS
+
+_metrics = {}  # (task, model) -> counters
+
+
+def model_for(task):
+    return MODEL_ROUTES.get(task) or MODEL_ROUTES["default"]
+
+
+def needs_escalation(analysis):
+    """True when a small-model item verdict should be re-checked by the large model."""
+    if model_for("sentiment") == model_for("sentiment_escalation"):
+        return False
+    try:
+        confidence = float(analysis.get("confidence", 0))
+    except (TypeError, ValueError):
+        confidence = 0.0
+    if confidence < CASCADE_MIN_CONFIDENCE:
+        return True
+    return analysis.get("relevant", True) and bool(set(analysis.get("topics") or []) & CASCADE_ESCALATE_TOPICS)
+
+
+def cached_tokens(usage):
+    """Prompt tokens served from OpenAI's prompt cache (0 when not reported)."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    return (getattr(details, "cached_tokens", 0) or 0) if details else 0
+
+
+def _counters(task, model):
+    return _metrics.setdefault((task, model), {
+        "calls": 0, "errors": 0, "seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0,
+        "items": 0, "escalated": 0,
+    })
+
+
+def record(task, model, seconds, usage=None, error=False):
+    m = _counters(task, model)
+    m["calls"] += 1
+    m["seconds"] += seconds
+    if error:
+        m["errors"] += 1
+    if usage is not None:
+        m["prompt_tokens"] += usage.prompt_tokens or 0
+        m["completion_tokens"] += usage.completion_tokens or 0
+        m["cached_tokens"] += cached_tokens(usage)
+
+
+def record_items(task, model, items, escalated=0):
+    m = _counters(task, model)
+    m["items"] += items
+    m["escalated"] += escalated
+
+
+class timed:
+    """with timed(task, model) as t: ...; t.usage = response.usage"""
+
+    def __init__(self, task, model):
+        self.task = task
+        self.model = model
+        self.usage = None
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record(self.task, self.model, time.monotonic() - self.started, self.usage, error=exc_type is not None)
+        return False
+
+
+def snapshot():
+    out = []
+    for (task, model), m in sorted(_metrics.items()):
+        calls = m["calls"] or 1
+        out.append({
+            "task": task,
+            "model": model,
+            "calls": m["calls"],
+            "errors": m["errors"],
+            "mean_latency_s": round(m["seconds"] / calls, 2),
+            "prompt_tokens": m["prompt_tokens"],
+            "completion_tokens": m["completion_tokens"],
+            "cached_tokens": m["cached_tokens"],
+            "cache_hit_rate": round(m["cached_tokens"] / m["prompt_tokens"], 3) if m["prompt_tokens"] else None,
+            "items": m["items"],
+            "escalated": m["escalated"],
+            "escalation_rate": round(m["escalated"] / m["items"], 3) if m["items"] else None,
+        })
+    return {"routes": dict(MODEL_ROUTES), "tasks": out}
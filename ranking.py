@@ -0,0 +1,133 @@
+"""Informativeness ranking for GPT prompt inputs.
+
+Every candidate item gets a 0-1 score, a weighted sum (RANKING_WEIGHTS) of:
+
+- credibility: SOURCE_WEIGHTS of its outlet or platform / 10
+- engagement:  log-scaled likes + retweets/shares + views, relative to the batch
+- extremity:   |sentiment| (label-based when the numeric score is missing)
+- novelty:     1 - max cosine similarity to what was already reported
+               (e.g. the active narrativas), hashed TF-IDF as in clustering.py
+- cluster:     how many candidates tell the same story (log-scaled)
+
+select() then spends a token budget on the best items, one story at a
+time, so the prompt covers many stories before it repeats one; fit_prefix()
+spends it in the given order instead (draining a backlog oldest-first).
+"""
+import math
+
+import numpy as np
+
+import clustering
+from config import (
+    SOURCE_WEIGHTS, DEFAULT_SOURCE_WEIGHT, RANKING_WEIGHTS, INTELLIGENCE_CLUSTER_THRESHOLD,
+)
+from llm_governor import estimate_tokens
+
+LABEL_EXTREMITY = {"negativo": 0.8, "positivo": 0.5, "neutro": 0.0}
+
+
+def item_text(item):
+    return " ".join(filter(None, [item.get("title"), item.get("summary"), item.get("text")]))
+
+
+def credibility(item):
+    source = item.get("source") or item.get("platform") or ""
+    return min(SOURCE_WEIGHTS.get(source, DEFAULT_SOURCE_WEIGHT), 10) / 10
+
+
+def engagement(item):
+    reach = (item.get("likes") or 0) + 2 * ((item.get("retweets") or 0) + (item.get("shares") or 0)) \
+        + (item.get("views") or 0) / 100
+    return math.log1p(max(reach, 0))
+
+
+def extremity(item):
+    try:
+        return min(abs(float(item["sentiment"])), 1.0)
+    except (KeyError, TypeError, ValueError):
+        return LABEL_EXTREMITY.get(item.get("sentiment_label"), 0.0)
+
+
+def score_items(items, known_texts=(), threshold=INTELLIGENCE_CLUSTER_THRESHOLD):
+    """(scores, clusters) for items; clusters as returned by clustering.cluster()."""
+    if not items:
+        return [], []
+    texts = [item_text(i) for i in items]
+    clusters = clustering.cluster(texts, threshold)
+    size = [1] * len(items)
+    for group in clusters:
+        for i in group:
+            size[i] = len(group)
+
+    known = [t for t in known_texts if t]
+    novelty = np.ones(len(items))
+    if known:
+        vectors = clustering.vectorize(texts + known)
+        novelty = 1 - np.clip((vectors[:len(texts)] @ vectors[len(texts):].T).max(axis=1), 0, 1)
+
+    eng = [engagement(i) for i in items]
+    top_eng = max(eng) or 1
+    top_size = math.log(max(size)) or 1
+    w = RANKING_WEIGHTS
+    scores = [
+        w["credibility"] * credibility(item)
+        + w["engagement"] * eng[k] / top_eng
+        + w["extremity"] * extremity(item)
+        + w["novelty"] * float(novelty[k])
+        + w["cluster"] * math.log(size[k]) / top_size
+        for k, item in enumerate(items)
+    ]
+    return scores, clusters
+
+
+def select(items, budget_tokens, cost=None, max_items=None, known_texts=(), member_cost=None):
+    """Best items under a token budget, in score order.
+
+    cost(item) -> tokens the item adds to the prompt (default: its text).
+    member_cost(item), if given, is charged instead for the 2nd+ item of a
+    story (prompts that collapse a story into one line plus IDs).
+    Picks the best item of every story first, then second-best ones, and so on.
+    """
+    if not items:
+        return []
+    cost = cost or (lambda item: estimate_tokens(item_text(item)))
+    scores, clusters = score_items(items, known_texts)
+    order = sorted(
+        (rank, -scores[i], i, story)
+        for story, group in enumerate(clusters)
+        for rank, i in enumerate(sorted(group, key=lambda i: -scores[i]))
+    )
+    chosen, spent, covered = [], 0, set()
+    for _, _, i, story in order:
+        c = member_cost(items[i]) if member_cost and story in covered else cost(items[i])
+        if spent + c > budget_tokens and chosen:
+            continue
+        chosen.append(i)
+        covered.add(story)
+        spent += c
+        if max_items and len(chosen) >= max_items:
+            break
+    chosen.sort(key=lambda i: -scores[i])
+    return [items[i] for i in chosen]
+
+
+def fit_prefix(items, budget_tokens, cost=None, max_items=None, member_cost=None):
+    """Longest prefix of items, kept in their order, that fits a token budget.
+
+    Charged like select() (member_cost for the 2nd+ item of a story). The
+    first item is always kept, so a backlog drained in this order advances
+    on every call.
+    """
+    if not items:
+        return []
+    cost = cost or (lambda item: estimate_tokens(item_text(item)))
+    clusters = clustering.cluster([item_text(i) for i in items], INTELLIGENCE_CLUSTER_THRESHOLD)
+    story = {i: s for s, group in enumerate(clusters) for i in group}
+    spent, covered = 0, set()
+    for n, item in enumerate(items):
+        c = member_cost(item) if member_cost and story[n] in covered else cost(item)
+        if n and (spent + c > budget_tokens or (max_items and n >= max_items)):
+            return items[:n]
+        covered.add(story[n])
+        spent += c
+    return list(items)
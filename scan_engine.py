@@ -1,15 +1,23 @@
 """Shared scan engine used by both API and scheduler."""
 import asyncio
 import aiohttp
+import hashlib
 import logging
 from datetime import datetime, timedelta
 
+import costs
 import db
-from config import TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, FIRST_SCAN_MULTIPLIER, INTELLIGENCE_ENABLED
+from config import (
+    TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, FIRST_SCAN_MULTIPLIER, INTELLIGENCE_ENABLED,
+    PRESS_INGEST_ENABLED, PRESS_INDEX_LOOKBACK_DAYS,
+    ALERT_WINDOW_HOURS, ALERT_STORY_TYPES, ALERT_STORY_SIMILARITY, ALERT_ESCALATE_GROWTH, INACTIVITY_ESCALATE_DAYS,
+)
 from scrapers.press import scrape_all_press
+from scrapers import ingest
 from scrapers.social import scrape_all_social
 from scrapers.player import scrape_all_player_posts
 from scrapers.trends import scrape_google_trends
+from clustering import vectorize
 from analyzer import analyze_batch, analyze_images, generate_executive_summary, extract_topics_and_brands, generate_intelligence_report, analyze_alert_content
 
 log = logging.getLogger("agentradar")
@@ -19,11 +27,12 @@ scan_status = {"running": False, "progress": "", "player_id": None}
 scan_lock = asyncio.Lock()
 
 
-async def run_scan(player_data: dict, update_status=True):
+async def run_scan(player_data: dict, update_status=True, prefetched=None):
     """Run a full scan for a player.
 
     player_data: dict with keys name, twitter, instagram, transfermarkt_id, club, tiktok
     update_status: if True, updates the global scan_status for UI polling
+    prefetched: optional Twitter/Instagram results from the roster batch (scrapers.batch)
     Returns dict with scan results.
     """
     if update_status:
@@ -34,6 +43,7 @@ async def run_scan(player_data: dict, update_status=True):
     instagram = player_data.get("instagram")
     tm_id = player_data.get("transfermarkt_id")
     club = player_data.get("club")
+    scope_token = None
     try:
         if update_status:
             scan_status["progress"] = "Registrando jugador..."
@@ -44,6 +54,7 @@ async def run_scan(player_data: dict, update_status=True):
 
         # Create scan log
         scan_log_id = await db.save_scan_log(player_id)
+        scope_token = costs.set_scope(scan_log_id=scan_log_id, player_id=player_id, job="scan")
 
         # Detect first scan (deeper scrape)
         scan_count = await db.get_scan_count(player_id)
@@ -51,6 +62,7 @@ async def run_scan(player_data: dict, update_status=True):
         scan_multiplier = FIRST_SCAN_MULTIPLIER if is_first_scan else 1
         if is_first_scan:
             log.info(f"First scan for {name} - using {FIRST_SCAN_MULTIPLIER}x deeper scrape")
+            prefetched = None  # batched runs use standard limits
 
         # Get previous summary for comparison
         prev_summary = await db.get_previous_summary(player_id)
@@ -65,7 +77,12 @@ async def run_scan(player_data: dict, update_status=True):
         if update_status:
             scan_status["progress"] = f"{progress_prefix}Escaneando prensa (Google News + RSS)..."
         try:
-            press_items = await scrape_all_press(name, club, limit_multiplier=scan_multiplier)
+            if PRESS_INGEST_ENABLED and not is_first_scan and ingest.is_covered(player_id):
+                # Background ingester already matched feeds + Google News for this player
+                press_items = await db.get_indexed_press(player_id, PRESS_INDEX_LOOKBACK_DAYS)
+                log.info(f"[scan] Press from local index: {len(press_items)} articles")
+            else:
+                press_items = await scrape_all_press(name, club, limit_multiplier=scan_multiplier)
         except Exception as e:
             log.error(f"Press scraper EXCEPTION: {e}", exc_info=True)
             press_items = []
@@ -73,7 +90,8 @@ async def run_scan(player_data: dict, update_status=True):
         if update_status:
             scan_status["progress"] = f"{progress_prefix}Prensa: {len(press_items)} noticias. Escaneando redes sociales..."
         try:
-            social_items = await scrape_all_social(name, twitter, club, limit_multiplier=scan_multiplier, instagram_handle=instagram)
+            social_items = await scrape_all_social(name, twitter, club, limit_multiplier=scan_multiplier,
+                                                 instagram_handle=instagram, prefetched=prefetched)
         except Exception as e:
             log.error(f"Social scraper EXCEPTION: {e}", exc_info=True)
             social_items = []
@@ -81,7 +99,8 @@ async def run_scan(player_data: dict, update_status=True):
         if update_status:
             scan_status["progress"] = f"{progress_prefix}Redes: {len(social_items)} menciones. Escaneando posts del jugador..."
         try:
-            player_items = await scrape_all_player_posts(twitter, instagram, limit_multiplier=scan_multiplier)
+            player_items = await scrape_all_player_posts(twitter, instagram, limit_multiplier=scan_multiplier,
+                                                        prefetched=prefetched)
         except Exception as e:
             log.error(f"Player scraper EXCEPTION: {e}", exc_info=True)
             player_items = []
@@ -90,25 +109,12 @@ async def run_scan(player_data: dict, update_status=True):
         tm_stats = None
         if tm_id:
             try:
-                from scrapers.transfermarkt import scrape_transfermarkt_profile, scrape_transfermarkt_stats
-                tm_data = await scrape_transfermarkt_profile(tm_id)
-                if tm_data:
-                    await db.update_player_profile(
-                        player_id,
-                        photo_url=tm_data.get("photo_url"),
-                        market_value=tm_data.get("market_value"),
-                        contract_until=tm_data.get("contract_until"),
-                        nationality=tm_data.get("nationality"),
-                        position=tm_data.get("position"),
-                    )
-                    # D4: Track market value history
-                    if tm_data.get("market_value"):
-                        await db.save_market_value(player_id, tm_data["market_value"])
-                # Scrape performance stats
-                tm_stats = await scrape_transfermarkt_stats(tm_id)
+                from scrapers.transfermarkt import refresh_player
+                # Cached per player; profile, market value and stats are only written on change
+                tm_result = await refresh_player(player_id, tm_id)
+                tm_stats = tm_result["stats"]
                 if tm_stats:
-                    await db.save_player_stats(player_id, tm_stats)
-                    log.info(f"Stats saved: {tm_stats.get('appearances', 0)} apps, {tm_stats.get('goals', 0)} goals")
+                    log.info(f"Stats: {tm_stats.get('appearances', 0)} apps, {tm_stats.get('goals', 0)} goals")
             except Exception as e:
                 log.error(f"Transfermarkt scraper EXCEPTION: {e}", exc_info=True)
 
@@ -217,7 +223,7 @@ async def run_scan(player_data: dict, update_status=True):
         if update_status:
             scan_status["progress"] = "Calculando Indice de Imagen..."
         image_index_data = await db.calculate_image_index(player_id)
-        await db.update_scan_report_image_index(scan_log_id, image_index_data["index"])
+        await db.update_scan_report_image_index(scan_log_id, image_index_data["index"], image_index_data)
         log.info(f"Image Index for {name}: {image_index_data['index']}/100")
 
         # Intelligence Analysis (second-pass)
@@ -268,12 +274,84 @@ async def run_scan(player_data: dict, update_status=True):
         log.error(f"SCAN ERROR: {e}", exc_info=True)
         return None
     finally:
+        if scope_token is not None:
+            costs.reset_scope(scope_token)
         if update_status:
             scan_status["running"] = False
 
 
+SEVERITY_RANK = {"baja": 0, "media": 1, "alta": 2}
+
+
+def _alert_item_key(item):
+    """Identity of an alert's source item: its URL, else its normalized text."""
+    url = item.get("url")
+    if url:
+        return url
+    text = " ".join((item.get("title") or item.get("text") or "").lower().split())
+    return "text:" + hashlib.sha1(text[:300].encode("utf-8")).hexdigest()[:16]
+
+
+def _alert_fingerprint(alert_type, keys):
+    return hashlib.sha1("\n".join([alert_type] + sorted(keys)).encode("utf-8")).hexdigest()
+
+
+def _alert_story(items, max_len=4000):
+    """Text of an alert's items, compared across scans to tell whether a story alert continues."""
+    return " ".join(f"{i.get('title') or ''} {i.get('summary') or i.get('text') or ''}" for i in items)[:max_len]
+
+
+def _same_story(prev, alert):
+    """Whether a firing alert continues prev (the latest alert of its type in the window).
+
+    A scan only passes the rules its new items, so consecutive alerts about
+    one story rarely share URLs. Volume rules (negative press, negative
+    social, trending) keep one alert per window whose item set accumulates
+    every scan; topic rules continue prev when their text is similar to it;
+    keyed rules (inactivity) only when the key is the same.
+    """
+    if prev.get("fingerprint") == alert["fingerprint"]:
+        return True
+    if not alert["items"]:
+        return False
+    if alert["type"] not in ALERT_STORY_TYPES:
+        return True
+    if not prev.get("story_text") or not alert["story"]:
+        return False
+    vectors = vectorize([prev["story_text"], alert["story"]])
+    return float(vectors[0] @ vectors[1]) >= ALERT_STORY_SIMILARITY
+
+
+def _alert_action(prev, alert):
+    """What to do with a firing alert given the latest one of its type in the window:
+    ("new", None) | ("refresh", keys) | ("escalate", keys), keys being the merged item set."""
+    if prev is None or not _same_story(prev, alert):
+        return "new", None
+    prev_keys = set(prev["item_keys"])
+    merged = sorted(prev_keys | set(alert["keys"]))
+    # Escalate when the rule now fires with a higher severity or the story has grown
+    rises = SEVERITY_RANK.get(alert["severity"], 0) > SEVERITY_RANK.get(prev.get("severity"), 0)
+    grew = bool(prev_keys) and len(merged) >= ALERT_ESCALATE_GROWTH * len(prev_keys)
+    return ("escalate" if rises or grew else "refresh"), merged
+
+
+def _merged_story(prev, alert):
+    """Story text kept on a continued alert: the latest items first, then what it already had."""
+    return f"{alert['story']} {prev.get('story_text') or ''}".strip()[:4000] or None
+
+
 async def _check_alerts(player_id, press_items, social_items, player_name=""):
-    count = 0
+    """Evaluate the alert rules for a scan's new items.
+
+    Every firing rule is fingerprinted by its type and item set and compared
+    with the latest alert of the same type within ALERT_WINDOW_HOURS (see
+    _same_story). Continuations refresh that alert in place, merging the
+    items, without a GPT call; continuations that raise the severity or double
+    the items escalate it (new explanation, severity up, unread again);
+    anything else is a new alert. GPT explanations for the new and escalated alerts run concurrently.
+    Returns the number of new + escalated alerts.
+    """
+    fired = []
 
     def _excerpt(text, max_len=100):
         """Truncate text for alert display."""
@@ -284,6 +362,14 @@ async def _check_alerts(player_id, press_items, social_items, player_name=""):
         """Extract published dates from items for temporal context."""
         return [i.get("published_at", "") or i.get("created_at", "") for i in items[:max_items]]
 
+    def fire(alert_type, severity, title, fallback_msg, data, items=(), keys=None, explain=True):
+        keys = keys if keys is not None else sorted({_alert_item_key(i) for i in items})
+        fired.append({
+            "type": alert_type, "severity": severity, "title": title, "message": fallback_msg, "data": data,
+            "items": list(items), "keys": keys, "fingerprint": _alert_fingerprint(alert_type, keys),
+            "story": _alert_story(items), "explain": explain,
+        })
+
     async def _gpt_message(alert_type, items, fallback_msg):
         """Try GPT analysis; fall back to template message."""
         try:
@@ -297,19 +383,17 @@ async def _check_alerts(player_id, press_items, social_items, player_name=""):
     negative_press = [i for i in press_items if i.get("sentiment_label") == "negativo"]
     if len(negative_press) >= 3:
         sources = list(set(i.get("source", "?") for i in negative_press))
-        message = await _gpt_message("prensa_negativa", negative_press,
-            f"Se han identificado {len(negative_press)} noticias con sentimiento negativo en {', '.join(sources[:4])}.")
-        await db.insert_alert(
-            player_id, "prensa_negativa", "alta",
+        fire(
+            "prensa_negativa", "alta",
             f"Detectada cobertura negativa en prensa ({len(negative_press)} noticias)",
-            message,
+            f"Se han identificado {len(negative_press)} noticias con sentimiento negativo en {', '.join(sources[:4])}.",
             {"count": len(negative_press),
              "titles": [i.get("title", "") for i in negative_press[:5]],
              "urls": [i.get("url", "") for i in negative_press[:5]],
              "sources_list": [i.get("source", "") for i in negative_press[:5]],
              "published_dates": _dates_range(negative_press)},
+            negative_press,
         )
-        count += 1
 
     # 2. Negative social sentiment majority
     if social_items:
@@ -321,20 +405,18 @@ async def _check_alerts(player_id, press_items, social_items, player_name=""):
                 platforms[p] = platforms.get(p, 0) + 1
             top_platform = max(platforms, key=platforms.get) if platforms else "redes"
             ratio_pct = round(len(negative_social) / len(social_items) * 100)
-            message = await _gpt_message("redes_negativas", negative_social,
-                f"El {ratio_pct}% de las menciones en redes sociales tienen sentimiento negativo. La plataforma mas afectada es {top_platform}.")
-            await db.insert_alert(
-                player_id, "redes_negativas", "alta",
+            fire(
+                "redes_negativas", "alta",
                 f"Sentimiento negativo dominante en redes ({ratio_pct}% de menciones)",
-                message,
+                f"El {ratio_pct}% de las menciones en redes sociales tienen sentimiento negativo. La plataforma mas afectada es {top_platform}.",
                 {"negative_ratio": round(len(negative_social) / len(social_items), 2),
                  "platforms": platforms,
                  "samples": [_excerpt(i.get("text", "")) for i in negative_social[:5]],
                  "urls": [i.get("url", "") for i in negative_social[:5]],
                  "platforms_list": [i.get("platform", "") for i in negative_social[:5]],
                  "published_dates": _dates_range(negative_social)},
+                negative_social,
             )
-            count += 1
 
     # 3. Trending - high media presence
     if len(press_items) > 15:
@@ -342,90 +424,115 @@ async def _check_alerts(player_id, press_items, social_items, player_name=""):
         for item in press_items:
             s = item.get("source", "?")
             sources[s] = sources.get(s, 0) + 1
-        top_source = max(sources, key=sources.get) if sources else "prensa"
-        message = await _gpt_message("trending", press_items,
-            f"El jugador aparece en {len(press_items)} noticias de {len(sources)} medios diferentes.")
-        await db.insert_alert(
-            player_id, "trending", "media",
+        fire(
+            "trending", "media",
             f"Alta presencia mediatica detectada ({len(press_items)} noticias)",
-            message,
+            f"El jugador aparece en {len(press_items)} noticias de {len(sources)} medios diferentes.",
             {"count": len(press_items), "sources": sources,
              "titles": [i.get("title", "") for i in press_items[:5]],
              "urls": [i.get("url", "") for i in press_items[:5]],
              "sources_list": [i.get("source", "") for i in press_items[:5]],
              "published_dates": _dates_range(press_items)},
+            press_items,
         )
-        count += 1
 
     # 4. Transfer rumor detected
     transfer_items = [i for i in press_items if "fichaje" in (i.get("topics") or [])]
     if transfer_items:
         sources = list(set(i.get("source", "?") for i in transfer_items))
-        message = await _gpt_message("rumor_fichaje", transfer_items,
-            f"Se han identificado {len(transfer_items)} noticias sobre un posible traspaso en {', '.join(sources[:3])}.")
-        await db.insert_alert(
-            player_id, "rumor_fichaje", "alta",
+        fire(
+            "rumor_fichaje", "alta",
             f"Detectados rumores de fichaje ({len(transfer_items)} noticias)",
-            message,
+            f"Se han identificado {len(transfer_items)} noticias sobre un posible traspaso en {', '.join(sources[:3])}.",
             {"titles": [i.get("title", "") for i in transfer_items[:5]],
              "urls": [i.get("url", "") for i in transfer_items[:5]],
              "sources_list": [i.get("source", "") for i in transfer_items[:5]],
              "published_dates": _dates_range(transfer_items)},
+            transfer_items,
         )
-        count += 1
 
     # 5. Injury mention detected
     injury_items = [i for i in press_items if "lesion" in (i.get("topics") or [])]
     if injury_items:
         sources = list(set(i.get("source", "?") for i in injury_items))
-        message = await _gpt_message("lesion", injury_items,
-            f"Se han detectado {len(injury_items)} noticias sobre una posible lesion en {', '.join(sources[:3])}.")
-        await db.insert_alert(
-            player_id, "lesion", "alta",
+        fire(
+            "lesion", "alta",
             f"Posible lesion mencionada en prensa ({len(injury_items)} noticias)",
-            message,
+            f"Se han detectado {len(injury_items)} noticias sobre una posible lesion en {', '.join(sources[:3])}.",
             {"titles": [i.get("title", "") for i in injury_items[:5]],
              "urls": [i.get("url", "") for i in injury_items[:5]],
              "sources_list": [i.get("source", "") for i in injury_items[:5]],
              "published_dates": _dates_range(injury_items)},
+            injury_items,
         )
-        count += 1
 
     # 6. Controversy/polemic detected
     polemic_items = [i for i in press_items + social_items if "polemica" in (i.get("topics") or [])]
     if len(polemic_items) >= 2:
         n_sources = len(set(i.get('platform', i.get('source', '?')) for i in polemic_items))
-        message = await _gpt_message("polemica", polemic_items,
-            f"Se han encontrado {len(polemic_items)} menciones polemicas en {n_sources} fuentes distintas.")
-        await db.insert_alert(
-            player_id, "polemica", "alta",
+        fire(
+            "polemica", "alta",
             f"Polemica detectada en {n_sources} fuentes ({len(polemic_items)} menciones)",
-            message,
+            f"Se han encontrado {len(polemic_items)} menciones polemicas en {n_sources} fuentes distintas.",
             {"count": len(polemic_items),
              "samples": [_excerpt(i.get("text", "") or i.get("title", "")) for i in polemic_items[:5]],
              "urls": [i.get("url", "") for i in polemic_items[:5]],
              "platforms_list": [i.get("platform", i.get("source", "")) for i in polemic_items[:5]],
              "published_dates": _dates_range(polemic_items)},
+            polemic_items,
         )
-        count += 1
 
-    # 7. Player inactivity (no posts in 7+ days)
+    # 7. Player inactivity (no posts in 7+ days); one alert per silence, keyed by the last post
     try:
         last_post_date = await db.get_last_player_post_date(player_id)
         if last_post_date:
             last_post = datetime.fromisoformat(last_post_date.replace("Z", "+00:00").split("+")[0])
             days_inactive = (datetime.now() - last_post).days
             if days_inactive >= 7:
-                await db.insert_alert(
-                    player_id, "inactividad", "media",
+                fire(
+                    "inactividad", "alta" if days_inactive >= INACTIVITY_ESCALATE_DAYS else "media",
                     f"Inactividad en redes: {days_inactive} dias sin publicar",
                     f"Ultimo post: {last_post_date[:10]}. Lleva {days_inactive} dias sin actividad en redes sociales.",
                     {"days_inactive": days_inactive, "last_post": last_post_date},
+                    keys=[f"last_post:{last_post_date}"], explain=False,
                 )
-                count += 1
     except Exception as e:
         log.warning(f"Inactivity check error: {e}")
 
+    if not fired:
+        return 0
+
+    recent = await db.get_recent_alerts(player_id, {
+        a["type"]: ALERT_WINDOW_HOURS.get(a["type"], ALERT_WINDOW_HOURS["default"]) for a in fired
+    })
+    plans = [(a, recent.get(a["type"]), *_alert_action(recent.get(a["type"]), a)) for a in fired]
+
+    # One concurrent round of GPT explanations for the alerts that need one
+    explain = [(a, action) for a, _, action, _ in plans if action != "refresh" and a["explain"]]
+    messages = await asyncio.gather(*[_gpt_message(a["type"], a["items"], a["message"]) for a, _ in explain])
+    for (a, _), message in zip(explain, messages):
+        a["message"] = message
+
+    count, refreshed = 0, 0
+    for a, prev, action, merged in plans:
+        if action == "new":
+            await db.insert_alert(player_id, a["type"], a["severity"], a["title"], a["message"], a["data"],
+                                  fingerprint=a["fingerprint"], item_keys=a["keys"], story_text=a["story"] or None)
+            count += 1
+        elif action == "escalate":
+            rank = max(SEVERITY_RANK.get(a["severity"], 0), min(SEVERITY_RANK.get(prev["severity"], 0) + 1, 2))
+            severity = next(s for s, r in SEVERITY_RANK.items() if r == rank)
+            await db.refresh_alert(prev["id"], a["title"], {**a["data"], "escalated_at": datetime.now().isoformat()},
+                                   _alert_fingerprint(a["type"], merged), merged, _merged_story(prev, a),
+                                   severity=severity, message=a["message"], unread=True)
+            count += 1
+        else:
+            await db.refresh_alert(prev["id"], a["title"], a["data"], _alert_fingerprint(a["type"], merged), merged,
+                                   _merged_story(prev, a))
+            refreshed += 1
+    escalated = sum(1 for p in plans if p[2] == "escalate")
+    log.info(f"[alerts] {player_name}: {count - escalated} new, {escalated} escalated, {refreshed} refreshed "
+             f"({len(explain)} GPT explanations)")
     return count
 
 
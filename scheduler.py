@@ -1,20 +1,26 @@
 """Daily scan scheduler using APScheduler."""
 import asyncio
 import logging
+import time
 from datetime import datetime
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 
+import costs
 import db
 from config import (
-    DAILY_SCAN_ENABLED, DAILY_SCAN_HOUR, DAILY_SCAN_MINUTE, SCAN_DELAY_SECONDS,
-    WEEKLY_REPORT_DAY, WEEKLY_REPORT_HOUR, WEEKLY_REPORT_MINUTE,
+    DAILY_SCAN_ENABLED, DAILY_SCAN_HOUR, DAILY_SCAN_MINUTE, SCAN_DELAY_SECONDS, ROSTER_BATCH_ENABLED,
+    WEEKLY_REPORT_DAY, WEEKLY_REPORT_HOUR, WEEKLY_REPORT_MINUTE, ARTICLE_CACHE_TTL_HOURS,
+    PRESS_INGEST_ENABLED, PRESS_INGEST_INTERVAL_MINUTES, ANALYSIS_CACHE_TTL_DAYS,
+    OPENAI_BATCH_MODE, OPENAI_BATCH_SCAN_CONCURRENCY,
 )
 
 log = logging.getLogger("agentradar")
 
 scheduler = AsyncIOScheduler()
 last_daily_run = {"started_at": None, "finished_at": None, "players_scanned": 0, "status": "idle"}
+last_weekly_run = {"started_at": None, "finished_at": None, "players": 0, "status": "idle"}
 
 
 async def daily_scan_job():
@@ -38,11 +44,40 @@ async def daily_scan_job():
             last_daily_run["finished_at"] = datetime.now().isoformat()
             return
 
+        removed = await db.prune_article_store(ARTICLE_CACHE_TTL_HOURS)
+        if removed:
+            log.info(f"[scheduler] Article store: {removed} expired URLs pruned")
+        removed = await db.prune_analysis_cache(ANALYSIS_CACHE_TTL_DAYS)
+        if removed:
+            log.info(f"[scheduler] Analysis cache: {removed} stale entries pruned")
+
         players = await db.get_all_players()
         log.info(f"[scheduler] Scanning {len(players)} players")
 
-        results = []
-        for player in players:
+        # Transfermarkt for the whole roster up front (rate-limited, cached), so scans hit the cache
+        try:
+            from scrapers.transfermarkt import refresh_roster
+            await refresh_roster(players)
+        except Exception as e:
+            log.error(f"[scheduler] Transfermarkt roster refresh error: {e}")
+
+        # Google Trends in batched anchor comparisons; scans read today's cache
+        try:
+            from scrapers.trends import prefetch_roster_trends
+            await prefetch_roster_trends(players)
+        except Exception as e:
+            log.error(f"[scheduler] Trends roster prefetch error: {e}")
+
+        # One Apify run per actor for the whole roster; first scans still go deep per player
+        prefetched = {}
+        if ROSTER_BATCH_ENABLED:
+            from scrapers.batch import prefetch_roster_social
+            scan_counts = await db.get_scan_counts()
+            batch_players = [p for p in players if scan_counts.get(p["id"], 0) > 0]
+            if len(batch_players) >= 2:
+                prefetched = await prefetch_roster_social(batch_players)
+
+        async def scan_player(player):
             player_data = {
                 "name": player["name"],
                 "twitter": player.get("twitter"),
@@ -52,13 +87,30 @@ async def daily_scan_job():
                 "tiktok": player.get("tiktok"),
             }
             log.info(f"[scheduler] Scanning {player['name']}...")
-            result = await run_scan(player_data, update_status=False)
-            results.append(result)
+            result = await run_scan(player_data, update_status=False,
+                                    prefetched=prefetched.get(player["name"]))
             last_daily_run["players_scanned"] += 1
+            return result
 
-            # Breathing room between players
-            if SCAN_DELAY_SECONDS > 0:
-                await asyncio.sleep(SCAN_DELAY_SECONDS)
+        if OPENAI_BATCH_MODE:
+            # Scans run side by side so their GPT requests share Batch API submissions
+            from analyzer import scheduled_batch
+            slots = asyncio.Semaphore(OPENAI_BATCH_SCAN_CONCURRENCY)
+
+            async def scan_in_slot(player):
+                async with slots:
+                    return await scan_player(player)
+
+            async with scheduled_batch("daily_scan"):
+                results = list(await asyncio.gather(*[scan_in_slot(p) for p in players]))
+        else:
+            results = []
+            for player in players:
+                results.append(await scan_player(player))
+
+                # Breathing room between players
+                if SCAN_DELAY_SECONDS > 0:
+                    await asyncio.sleep(SCAN_DELAY_SECONDS)
 
         last_daily_run["status"] = "completed"
         last_daily_run["finished_at"] = datetime.now().isoformat()
@@ -77,53 +129,95 @@ async def daily_scan_job():
         except Exception as e:
             log.error(f"[scheduler] Email digest error: {e}")
 
+        # Retrain the local triage model on today's GPT verdicts
+        try:
+            import triage
+            await triage.retrain()
+        except Exception as e:
+            log.error(f"[scheduler] Triage retrain error: {e}")
+
     except Exception as e:
         log.error(f"[scheduler] Daily scan error: {e}", exc_info=True)
         last_daily_run["status"] = f"error: {str(e)}"
         last_daily_run["finished_at"] = datetime.now().isoformat()
 
 
+async def press_ingest_job():
+    """Poll press feeds and Google News into the local article index."""
+    from scrapers.ingest import ingest_press_once
+    await ingest_press_once()
+
+
 async def weekly_report_job():
-    """Generate weekly actionable reports for all players."""
+    """Generate weekly actionable reports for all players.
+
+    Inputs come from each player's latest scan report (summary snapshot,
+    Image Index breakdown, topics, brands) rather than from the raw rows.
+    Players are reported concurrently - the shared LLM governor paces the GPT
+    calls - and the reports are saved in one write.
+    """
+    global last_weekly_run
+    started = time.monotonic()
+    last_weekly_run = {"started_at": datetime.now().isoformat(), "finished_at": None, "players": 0,
+                       "recomputed": 0, "errors": 0, "seconds": None, "status": "running"}
     log.info("[scheduler] Weekly report job started")
     try:
-        from analyzer import generate_weekly_report
+        from analyzer import generate_weekly_report, scheduled_batch
 
         players = await db.get_all_players()
-        for player in players:
+        inputs = await db.get_weekly_inputs([p["id"] for p in players])
+
+        async def report_player(player):
             pid = player["id"]
             try:
-                summary = await db.get_summary(pid)
-                image_index = await db.calculate_image_index(pid)
-                report = await db.get_last_report(pid)
-                topics = report.get("topics", {}) if report else {}
-                brands = report.get("brands", {}) if report else {}
-
-                result = await generate_weekly_report(
-                    player["name"], summary, image_index, topics, brands, player.get("club", ""),
-                )
-
-                await db.save_weekly_report(
+                with costs.scope(player_id=pid, job="weekly_report"):
+                    data = inputs.get(pid)
+                    if data is None:
+                        # No scan snapshot with the Image Index breakdown yet
+                        last_weekly_run["recomputed"] += 1
+                        report = await db.get_last_report(pid)
+                        data = {
+                            "summary": await db.get_summary(pid),
+                            "image_index": await db.calculate_image_index(pid),
+                            "topics": report.get("topics", {}) if report else {},
+                            "brands": report.get("brands", {}) if report else {},
+                        }
+
+                    result = await generate_weekly_report(
+                        player["name"], data["summary"], data["image_index"], data["topics"], data["brands"],
+                        player.get("club", ""),
+                    )
+                log.info(f"[scheduler] Weekly report for {player['name']}: {result.get('recommendation', '?')}")
+                return (
                     pid,
                     result.get("text", ""),
                     result.get("recommendation", "MONITORIZAR"),
-                    image_index.get("index", 0),
+                    data["image_index"].get("index", 0),
                     {
                         "risks": result.get("risks", []),
                         "opportunities": result.get("opportunities", []),
                         "justification": result.get("justification", ""),
                     },
                 )
-                log.info(f"[scheduler] Weekly report for {player['name']}: {result.get('recommendation', '?')}")
             except Exception as e:
+                last_weekly_run["errors"] += 1
                 log.error(f"[scheduler] Weekly report error for {player['name']}: {e}")
+                return None
 
-            await asyncio.sleep(5)
+        # In batch mode this is one Batch API submission for the whole roster
+        async with scheduled_batch("weekly_report"):
+            rows = [r for r in await asyncio.gather(*[report_player(p) for p in players]) if r]
+        await db.save_weekly_reports(rows)
 
-        log.info(f"[scheduler] Weekly reports done for {len(players)} players")
+        last_weekly_run.update(players=len(rows), status="completed")
+        log.info(f"[scheduler] Weekly reports done for {len(rows)}/{len(players)} players "
+                 f"in {time.monotonic() - started:.0f}s ({last_weekly_run['recomputed']} recomputed from raw rows)")
 
     except Exception as e:
         log.error(f"[scheduler] Weekly report job error: {e}", exc_info=True)
+        last_weekly_run["status"] = f"error: {str(e)}"
+    last_weekly_run["finished_at"] = datetime.now().isoformat()
+    last_weekly_run["seconds"] = round(time.monotonic() - started, 1)
 
 
 async def send_telegram_daily_summary(players, results):
@@ -223,6 +317,18 @@ def start_scheduler():
         replace_existing=True,
     )
 
+    # Background press ingestion (first pass right away so scans can use the index)
+    if PRESS_INGEST_ENABLED:
+        scheduler.add_job(
+            press_ingest_job,
+            IntervalTrigger(minutes=PRESS_INGEST_INTERVAL_MINUTES),
+            id="press_ingest",
+            replace_existing=True,
+            next_run_time=datetime.now(),
+            max_instances=1,
+            coalesce=True,
+        )
+
     scheduler.start()
     days = ["Lun", "Mar", "Mie", "Jue", "Vie", "Sab", "Dom"]
     log.info(f"[scheduler] Started - daily scan at {DAILY_SCAN_HOUR:02d}:{DAILY_SCAN_MINUTE:02d}, weekly report {days[WEEKLY_REPORT_DAY]} {WEEKLY_REPORT_HOUR:02d}:{WEEKLY_REPORT_MINUTE:02d}")
@@ -236,11 +342,22 @@ def stop_scheduler():
 
 def get_scheduler_status():
     """Get scheduler status for API."""
+    from scrapers.ingest import ingest_status
+    from llm_batch import batch_status
     job = scheduler.get_job("daily_scan") if scheduler.running else None
+    ingest_job = scheduler.get_job("press_ingest") if scheduler.running else None
     return {
         "enabled": DAILY_SCAN_ENABLED,
         "running": scheduler.running if DAILY_SCAN_ENABLED else False,
         "next_run": str(job.next_run_time) if job else None,
         "schedule": f"{DAILY_SCAN_HOUR:02d}:{DAILY_SCAN_MINUTE:02d}",
         "last_run": last_daily_run,
+        "weekly_report": last_weekly_run,
+        "press_ingest": {
+            "enabled": PRESS_INGEST_ENABLED,
+            "interval_minutes": PRESS_INGEST_INTERVAL_MINUTES,
+            "next_run": str(ingest_job.next_run_time) if ingest_job else None,
+            **ingest_status,
+        },
+        "openai_batch": {"enabled": OPENAI_BATCH_MODE, **batch_status},
     }
@@ -0,0 +1,224 @@
+"""Shared Apify client: start a run, wait for it, stream its dataset.
+
+Runs are awaited with Apify's waitForFinish long-polling (the request returns
+as soon as the run ends); when APIFY_WEBHOOK_URL and APIFY_WEBHOOK_SECRET are
+both set, each poll also races a webhook that the run calls on completion.
+The callback is only a wake-up signal: the run itself is always re-read from
+the Apify API. Runs still going after APIFY_RUN_TIMEOUT are aborted. A global
+semaphore caps concurrent actor runs across all scans.
+"""
+import aiohttp
+import asyncio
+import base64
+import json
+import logging
+import time
+from urllib.parse import quote
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from config import (
+    APIFY_TOKEN, APIFY_BASE, APIFY_MAX_CONCURRENT_RUNS, APIFY_RUN_TIMEOUT,
+    APIFY_DATASET_PAGE_SIZE, APIFY_WEBHOOK_URL, APIFY_WEBHOOK_SECRET,
+)
+from scrapers import health
+import costs
+
+log = logging.getLogger("agentradar")
+
+TERMINAL_STATUSES = ("SUCCEEDED", "FAILED", "ABORTED", "TIMED-OUT")
+WAIT_FOR_FINISH = 60  # Apify caps waitForFinish at 60 s per request
+
+_run_slots = asyncio.Semaphore(APIFY_MAX_CONCURRENT_RUNS)
+_webhook_waiters = {}  # run_id -> Future resolved by the webhook endpoint
+
+# An unauthenticated callback endpoint would let anyone wake runs up early
+WEBHOOKS_ENABLED = bool(APIFY_WEBHOOK_URL and APIFY_WEBHOOK_SECRET)
+if APIFY_WEBHOOK_URL and not APIFY_WEBHOOK_SECRET:
+    log.warning("[apify] APIFY_WEBHOOK_URL is set without APIFY_WEBHOOK_SECRET; webhooks disabled, long-polling runs")
+
+
+def _webhooks_param():
+    """Ad-hoc webhook definition, base64-encoded as the runs endpoint expects."""
+    url = APIFY_WEBHOOK_URL + ("&" if "?" in APIFY_WEBHOOK_URL else "?") + f"secret={APIFY_WEBHOOK_SECRET}"
+    hooks = [{
+        "eventTypes": ["ACTOR.RUN.SUCCEEDED", "ACTOR.RUN.FAILED",
+                       "ACTOR.RUN.ABORTED", "ACTOR.RUN.TIMED_OUT"],
+        "requestUrl": url,
+    }]
+    return base64.b64encode(json.dumps(hooks).encode()).decode()
+
+
+def resolve_webhook(payload):
+    """Called by the webhook endpoint. Returns True if a waiting run was woken up.
+
+    Nothing from the payload but the run ID is used; the waiter re-fetches the
+    run (status, dataset) from the Apify API.
+    """
+    run_id = (payload.get("eventData") or {}).get("actorRunId") or (payload.get("resource") or {}).get("id")
+    fut = _webhook_waiters.get(run_id)
+    if not fut or fut.done():
+        return False
+    fut.set_result(None)
+    return True
+
+
+async def _get_run(session, run_id, wait=0):
+    url = f"{APIFY_BASE}/actor-runs/{run_id}?token={APIFY_TOKEN}"
+    if wait:
+        url += f"&waitForFinish={wait}"
+    async with session.get(url, timeout=aiohttp.ClientTimeout(total=wait + 30)) as resp:
+        return (await resp.json())["data"]
+
+
+async def _abort_run(session, run_id, label):
+    """Abort a run so it stops billing; returns its updated state, None if the abort failed."""
+    try:
+        async with session.post(
+            f"{APIFY_BASE}/actor-runs/{run_id}/abort?token={APIFY_TOKEN}",
+            timeout=aiohttp.ClientTimeout(total=30),
+        ) as resp:
+            if resp.status != 200:
+                log.warning(f"[apify] {label} abort returned {resp.status}")
+                return None
+            return (await resp.json())["data"]
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        log.warning(f"[apify] {label} abort error: {e}")
+        return None
+
+
+async def _wait_for_run(session, run, label):
+    """Block until the run reaches a terminal status; abort it once APIFY_RUN_TIMEOUT passes.
+
+    Every round long-polls with waitForFinish. With a webhook the poll races the
+    callback and whichever comes first ends the round (a wake-up re-reads the
+    run), so a lost webhook costs nothing over plain long-polling.
+    """
+    run_id = run["id"]
+    deadline = time.monotonic() + APIFY_RUN_TIMEOUT
+    fut = _webhook_waiters.get(run_id)
+    try:
+        while run.get("status") not in TERMINAL_STATUSES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                log.warning(f"[apify] {label} still {run.get('status')} after {APIFY_RUN_TIMEOUT}s, aborting")
+                run = await _abort_run(session, run_id, label) or run
+                break
+            wait = int(min(WAIT_FOR_FINISH, remaining)) or 1
+            poll = asyncio.ensure_future(_get_run(session, run_id, wait=wait))
+            if fut is not None:
+                try:
+                    done, _ = await asyncio.wait({poll, fut}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    if not poll.done():
+                        poll.cancel()
+                if fut.done():
+                    fut = None  # woken up once; long-poll alone if the run is somehow not finished yet
+                if poll not in done:
+                    run = await _get_run(session, run_id)
+                    continue
+            run = await poll
+    finally:
+        _webhook_waiters.pop(run_id, None)
+    return run
+
+
+async def iter_dataset(session, dataset_id, max_items, page_size=APIFY_DATASET_PAGE_SIZE):
+    """Yield dataset items page by page instead of downloading them in one request."""
+    offset = 0
+    while offset < max_items:
+        limit = min(page_size, max_items - offset)
+        url = (f"{APIFY_BASE}/datasets/{dataset_id}/items?token={APIFY_TOKEN}"
+               f"&clean=true&offset={offset}&limit={limit}")
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=60)) as resp:
+            page = await resp.json()
+        if not page:
+            return
+        for item in page:
+            yield item
+        if len(page) < limit:
+            return
+        offset += len(page)
+
+
+class ApifyRunError(Exception):
+    """A run that could not be started or did not succeed (run_actor with raise_on_failure)."""
+
+
+async def run_actor(session, actor, input_data, max_items=100, label=None, retries=2, raise_on_failure=False):
+    """Run an Apify actor and return up to max_items dataset items.
+
+    On failure returns [] - or raises ApifyRunError with raise_on_failure, for
+    callers that must tell a failed run from one that found nothing.
+    """
+    label = label or actor
+    items = await _run_actor(session, actor, input_data, max_items, label, retries)
+    if items is None:
+        if raise_on_failure:
+            raise ApifyRunError(f"{label} failed")
+        return []
+    return items
+
+
+async def _run_actor(session, actor, input_data, max_items, label, retries):
+    """Dataset items of a successful run, None on failure."""
+    if not APIFY_TOKEN:
+        return None
+
+    source = f"apify:{actor}"
+    for attempt in range(retries + 1):
+        try:
+            async with _run_slots, health.track(source) as probe:
+                run_url = f"{APIFY_BASE}/acts/{actor}/runs?token={APIFY_TOKEN}&waitForFinish={WAIT_FOR_FINISH}"
+                if WEBHOOKS_ENABLED:
+                    run_url += f"&webhooks={quote(_webhooks_param())}"
+                started = time.monotonic()
+                async with session.post(
+                    run_url, json=input_data,
+                    timeout=aiohttp.ClientTimeout(total=WAIT_FOR_FINISH + 30),
+                ) as resp:
+                    if resp.status not in (200, 201):
+                        body = await resp.text()
+                        log.error(f"[apify] {label} start error {resp.status}: {body[:200]}")
+                        probe.fail(f"Start HTTP {resp.status}: {body[:100]}", health.retry_after_seconds(resp))
+                        run = None
+                    else:
+                        run = (await resp.json())["data"]
+
+                if run is not None:
+                    if WEBHOOKS_ENABLED and run.get("status") not in TERMINAL_STATUSES:
+                        _webhook_waiters[run["id"]] = asyncio.get_running_loop().create_future()
+                    run = await _wait_for_run(session, run, label)
+                    if run.get("status") != "SUCCEEDED":
+                        probe.fail(f"Run ended: {run.get('status')}")
+
+            if run is not None:
+                await costs.record_apify(actor, run, label)  # billed even if the run failed
+            if run is None:
+                if attempt < retries:
+                    await asyncio.sleep(2 ** (attempt + 1))
+                    continue
+                return None
+
+            status = run.get("status")
+            if status != "SUCCEEDED":
+                log.warning(f"[apify] {label} run ended: {status}")
+                return None
+
+            items = [item async for item in iter_dataset(session, run["defaultDatasetId"], max_items)]
+            log.info(f"[apify] {label}: {len(items)} items in {time.monotonic() - started:.1f}s")
+            return items
+        except health.SourceUnavailable:
+            log.warning(f"[apify] {label} skipped: circuit open")
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            log.error(f"[apify] {label} error (attempt {attempt+1}/{retries+1}): {e}")
+            if attempt < retries:
+                await asyncio.sleep(2 ** (attempt + 1))
+            else:
+                return None
+        except Exception as e:
+            log.error(f"[apify] {label} unexpected error: {e}")
+            return None
+    return None
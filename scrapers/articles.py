@@ -0,0 +1,127 @@
+"""Full-text enrichment for press items.
+
+Article bodies are looked up in the article store (db.article_urls /
+db.article_texts) first, so a syndicated article or a Google News link that
+was already resolved is not downloaded again for every player it mentions.
+Misses are fetched, and HTML-to-text extraction runs with lxml in the
+parsing thread pool so a scan never parses pages on the event loop thread.
+"""
+import aiohttp
+import asyncio
+import logging
+import re
+from urllib.parse import urlparse
+
+import lxml.html
+from lxml import etree
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import db
+from scrapers import health, parsing
+from config import (
+    ARTICLE_CACHE_TTL_HOURS, ARTICLE_FAILED_TTL_HOURS, ARTICLE_MAX_CHARS,
+)
+
+log = logging.getLogger("agentradar")
+
+MAX_HTML_BYTES = 2_000_000  # pages beyond this are truncated before extraction
+
+_STRIP_TAGS = ("script", "style", "nav", "header", "footer", "aside", "iframe", "form", "noscript")
+_CONTENT_CLASS_RE = re.compile(r"article|post|content|entry|body", re.I)
+
+def extract_article_text(html, max_chars=ARTICLE_MAX_CHARS):
+    """Extract the main paragraph text of an article page.
+
+    Free of shared state so it can run in any executor.
+    """
+    if not html:
+        return ""
+    try:
+        doc = lxml.html.document_fromstring(html)
+    except (etree.ParserError, ValueError):
+        return ""
+
+    etree.strip_elements(doc, etree.Comment, *_STRIP_TAGS, with_tail=False)
+
+    # Same precedence as before: <article>, a content-looking <div>, <main>, whole page
+    container = next(doc.iter("article"), None)
+    if container is None:
+        container = next(
+            (d for d in doc.iter("div") if _CONTENT_CLASS_RE.search(d.get("class") or "")), None
+        )
+    if container is None:
+        container = next(doc.iter("main"), None)
+    if container is None:
+        container = doc
+
+    parts = []
+    size = 0
+    for p in container.iter("p"):
+        text = " ".join(p.text_content().split())
+        if len(text) > 30:
+            parts.append(text)
+            size += len(text) + 1
+            if size >= max_chars:
+                break
+    return " ".join(parts)[:max_chars]
+
+
+async def _extract(html):
+    # lxml releases the GIL while parsing, so a thread is enough and the page
+    # does not have to be pickled to a worker process
+    return await parsing.in_thread(extract_article_text, html)
+
+
+async def _fetch_one(session, url, timeout=8):
+    """Download url (following redirects). Returns (resolved_url, text)."""
+    try:
+        async with health.track(f"article:{urlparse(url).netloc}") as probe:
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout),
+                                   allow_redirects=True) as resp:
+                resolved = str(resp.url)
+                if resp.status != 200:
+                    probe.fail(f"HTTP {resp.status}", health.retry_after_seconds(resp))
+                    return resolved, ""
+                raw = await resp.read()
+                html = raw[:MAX_HTML_BYTES].decode(resp.charset or "utf-8", errors="replace")
+    except health.SourceUnavailable:
+        raise
+    except Exception:
+        return url, ""
+    return resolved, await _extract(html)
+
+
+async def fetch_article_texts(session, urls, max_concurrent=5):
+    """Return {url: text} for urls, using the article store for repeats."""
+    urls = list(dict.fromkeys(u for u in urls if u))
+    if not urls:
+        return {}
+
+    try:
+        texts = await db.get_cached_articles(urls, ARTICLE_CACHE_TTL_HOURS, ARTICLE_FAILED_TTL_HOURS)
+    except Exception as e:
+        log.error(f"[articles] Store lookup error: {e}")
+        texts = {}
+
+    misses = [u for u in urls if u not in texts]
+    sem = asyncio.Semaphore(max_concurrent)
+
+    async def fetch(url):
+        async with sem:
+            return url, *await _fetch_one(session, url)
+
+    fetched = await asyncio.gather(*[fetch(u) for u in misses], return_exceptions=True)
+    entries = [r for r in fetched if not isinstance(r, Exception)]
+    for url, _resolved, text in entries:
+        texts[url] = text
+
+    if entries:
+        try:
+            await db.save_articles(entries)
+        except Exception as e:
+            log.error(f"[articles] Store save error: {e}")
+
+    log.info(f"[articles] {len(urls) - len(misses)}/{len(urls)} from store, {len(entries)} fetched")
+    return texts
@@ -0,0 +1,185 @@
+"""Roster-wide batched Apify runs for the daily scheduler.
+
+Instead of four actor runs per player (Twitter mentions, Twitter profile,
+Instagram profile, Instagram hashtags), the search terms, start URLs and
+hashtags of the whole roster are merged into one run per actor. Results are
+routed back to each player by author/handle, hashtag and name match, and
+converted with the same helpers the per-player scrapers use.
+
+A bucket key that is absent means "not prefetched": the scrapers run that
+source per player. Keys are dropped for every player when a batched run
+fails, and twitter_mentions for players the batch left without mentions.
+"""
+import asyncio
+import logging
+import re
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from config import (
+    APIFY_TOKEN, TWITTER_ACTOR, INSTAGRAM_ACTOR, INSTAGRAM_HASHTAG_ACTOR,
+    MAX_TWEETS_MENTIONS, MAX_TWEETS_PLAYER, MAX_INSTAGRAM_POSTS, MAX_INSTAGRAM_MENTIONS,
+)
+from scrapers import http
+from scrapers.apify import run_actor
+from scrapers.social import (
+    _build_search_queries, _build_hashtags, _mention_from_tweet, _mention_from_instagram,
+    _name_matches,
+)
+from scrapers.player import _post_from_tweet, _post_from_instagram
+
+log = logging.getLogger("agentradar")
+
+
+def _handle(value):
+    return (value or "").strip().lstrip("@").lower()
+
+
+def _empty_bucket():
+    return {"twitter_mentions": [], "twitter_posts": [], "instagram_posts": [], "instagram_mentions": []}
+
+
+# Bucket keys filled by each batched run
+SOURCE_KEYS = {
+    "twitter": ("twitter_mentions", "twitter_posts"),
+    "instagram": ("instagram_posts",),
+    "instagram_hashtags": ("instagram_mentions",),
+}
+
+
+def _append_capped(bucket, key, item, cap):
+    if len(bucket[key]) < cap:
+        bucket[key].append(item)
+
+
+def _mentions_handle(text_lower, handle):
+    """@handle as a whole handle: @rodri must not match @rodrigo_xx."""
+    return bool(handle) and re.search(rf"@{re.escape(handle)}\b", text_lower) is not None
+
+
+async def _run_twitter(session, players, buckets):
+    # The actor only takes a global maxItems, so it is sized per search term
+    # (each player's MAX_TWEETS_MENTIONS split over its terms); players whose
+    # mentions still come back empty are scraped on their own
+    term_limits = {}
+    start_urls = []
+    for p in players:
+        terms = _build_search_queries(p["name"], p.get("twitter"), p.get("club"))
+        share = -(-MAX_TWEETS_MENTIONS // len(terms))
+        for term in terms:
+            term_limits[term] = max(term_limits.get(term, 0), share)
+        if p.get("twitter"):
+            start_urls.append({"url": f"https://twitter.com/{_handle(p['twitter'])}"})
+
+    limit = sum(term_limits.values()) + MAX_TWEETS_PLAYER * len(start_urls)
+    input_data = {"searchTerms": list(term_limits), "startUrls": start_urls, "maxItems": limit, "sort": "Latest"}
+    tweets = await run_actor(session, TWITTER_ACTOR, input_data, limit, f"Twitter batch ({len(players)} players)",
+                             raise_on_failure=True)
+
+    for tweet in tweets:
+        mention = _mention_from_tweet(tweet)
+        author = _handle(mention["author"])
+        text_lower = (mention["text"] or "").lower()
+        for p in players:
+            handle = _handle(p.get("twitter"))
+            bucket = buckets[p["name"]]
+            if handle and author == handle:
+                _append_capped(bucket, "twitter_posts", _post_from_tweet(tweet), MAX_TWEETS_PLAYER)
+            if _name_matches(mention["text"] or "", p["name"]) or _mentions_handle(text_lower, handle):
+                _append_capped(bucket, "twitter_mentions", dict(mention), MAX_TWEETS_MENTIONS)
+
+    starved = [name for name, bucket in buckets.items() if not bucket["twitter_mentions"]]
+    for name in starved:
+        del buckets[name]["twitter_mentions"]
+    if starved:
+        log.info(f"[batch] {len(starved)} players without batched Twitter mentions, scraped per player")
+    return len(tweets)
+
+
+async def _run_instagram_profiles(session, players, buckets):
+    by_handle = {_handle(p["instagram"]): p for p in players if p.get("instagram")}
+    if not by_handle:
+        return 0
+
+    input_data = {
+        "directUrls": [f"https://www.instagram.com/{h}/" for h in by_handle],
+        "resultsType": "posts",
+        "resultsLimit": MAX_INSTAGRAM_POSTS,  # per profile
+    }
+    limit = MAX_INSTAGRAM_POSTS * len(by_handle)
+    posts = await run_actor(session, INSTAGRAM_ACTOR, input_data, limit,
+                            f"Instagram batch ({len(by_handle)} profiles)", raise_on_failure=True)
+
+    for post in posts:
+        owner = _handle(post.get("ownerUsername") or (post.get("owner") or {}).get("username"))
+        if not owner:
+            # Fall back to the profile URL the item was scraped from
+            input_url = (post.get("inputUrl") or "").rstrip("/")
+            owner = _handle(input_url.rsplit("/", 1)[-1]) if input_url else ""
+        p = by_handle.get(owner)
+        if p:
+            _append_capped(buckets[p["name"]], "instagram_posts", _post_from_instagram(post), MAX_INSTAGRAM_POSTS)
+    return len(posts)
+
+
+async def _run_instagram_hashtags(session, players, buckets):
+    tags_by_player = {p["name"]: set(_build_hashtags(p["name"], p.get("instagram"))) for p in players}
+    all_tags = sorted(set().union(*tags_by_player.values()))
+    if not all_tags:
+        return 0
+
+    input_data = {"hashtags": all_tags, "resultsLimit": MAX_INSTAGRAM_MENTIONS}
+    limit = MAX_INSTAGRAM_MENTIONS * len(players)
+    posts = await run_actor(session, INSTAGRAM_HASHTAG_ACTOR, input_data, limit,
+                            f"Instagram hashtag batch ({len(all_tags)} tags)", raise_on_failure=True)
+
+    for post in posts:
+        mention = _mention_from_instagram(post)
+        post_tags = {str(t).lstrip("#").lower() for t in (post.get("hashtags") or [])}
+        caption_lower = mention["text"].lower()
+        for p in players:
+            handle = _handle(p.get("instagram"))
+            if (post_tags & tags_by_player[p["name"]]
+                    or _name_matches(mention["text"], p["name"])
+                    or _mentions_handle(caption_lower, handle)):
+                _append_capped(buckets[p["name"]], "instagram_mentions", dict(mention), MAX_INSTAGRAM_MENTIONS)
+    return len(posts)
+
+
+async def prefetch_roster_social(players):
+    """Run the batched actors for players and return {player_name: bucket}.
+
+    Each bucket has twitter_mentions, twitter_posts, instagram_posts and
+    instagram_mentions lists, ready to pass as `prefetched` to
+    scrape_all_social / scrape_all_player_posts; the keys of a failed run are
+    left out so only that source falls back to per-player runs.
+    """
+    if not APIFY_TOKEN or not players:
+        return {}
+
+    buckets = {p["name"]: _empty_bucket() for p in players}
+    async with http.new_session() as session:
+        results = await asyncio.gather(
+            _run_twitter(session, players, buckets),
+            _run_instagram_profiles(session, players, buckets),
+            _run_instagram_hashtags(session, players, buckets),
+            return_exceptions=True,
+        )
+
+    # run_actor raises ApifyRunError for a failed or aborted batched run
+    failed = [(source, r) for source, r in zip(SOURCE_KEYS, results) if isinstance(r, Exception)]
+    for source, _ in failed:
+        for bucket in buckets.values():
+            for key in SOURCE_KEYS[source]:
+                bucket.pop(key, None)
+    if failed:
+        log.error(f"[batch] Batched runs failed ({', '.join(f'{s}: {e}' for s, e in failed)}), "
+                  f"falling back to per-player runs for those sources")
+    if len(failed) == len(SOURCE_KEYS):
+        return {}
+
+    routed = sum(len(v) for b in buckets.values() for v in b.values())
+    log.info(f"[batch] Roster prefetch: {len(players)} players, {len(SOURCE_KEYS) - len(failed)} actor runs, "
+             f"{routed} items routed")
+    return buckets
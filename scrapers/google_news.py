@@ -0,0 +1,173 @@
+"""Google News RSS query planner.
+
+Packs site: searches into `"name" (site:a OR site:b ...)` groups that fit
+GOOGLE_NEWS_MAX_SITES_PER_QUERY / GOOGLE_NEWS_MAX_URL_LENGTH, and shares the
+result of identical query URLs fired within GOOGLE_NEWS_DEDUP_SECONDS (across
+press/social scrapers and concurrent scans). Grouped results are attributed
+back to their site from the publisher domain of each entry; a group whose
+feed comes back full has its sites re-queried one by one (fetch_site_entries).
+"""
+import aiohttp
+import asyncio
+import logging
+import time
+from urllib.parse import urlparse
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from config import (
+    GOOGLE_NEWS_RSS, MAX_RSS_ITEMS, GOOGLE_NEWS_MAX_SITES_PER_QUERY, GOOGLE_NEWS_MAX_URL_LENGTH,
+    GOOGLE_NEWS_DEDUP_SECONDS,
+)
+from scrapers import health, parsing
+
+log = logging.getLogger("agentradar")
+
+GOOGLE_NEWS_SOURCE = "news.google.com"
+
+_recent = {}  # url -> (monotonic time, Task returning parsed entries)
+
+
+def build_url(query, template=GOOGLE_NEWS_RSS):
+    return template.format(query=query.replace(" ", "+"))
+
+
+def _site_query(base, domains):
+    if len(domains) == 1:
+        return f"{base} site:{domains[0]}"
+    return f"{base} (" + " OR ".join(f"site:{d}" for d in domains) + ")"
+
+
+def plan_site_queries(base, domains, template=GOOGLE_NEWS_RSS,
+                      max_sites=GOOGLE_NEWS_MAX_SITES_PER_QUERY, max_url=GOOGLE_NEWS_MAX_URL_LENGTH):
+    """Split domains into site: OR-groups. Returns [(query, [domains])]."""
+    groups = []
+    current = []
+    for domain in dict.fromkeys(domains):
+        candidate = current + [domain]
+        too_long = len(build_url(_site_query(base, candidate), template)) > max_url
+        if current and (len(candidate) > max_sites or too_long):
+            groups.append(current)
+            current = [domain]
+        else:
+            current = candidate
+    if current:
+        groups.append(current)
+    return [(_site_query(base, g), g) for g in groups]
+
+
+def any_of(terms):
+    """OR-group for query keywords: ["futbol", '"Real Betis"'] -> (futbol OR "Real Betis")."""
+    terms = list(dict.fromkeys(terms))
+    return terms[0] if len(terms) == 1 else "(" + " OR ".join(terms) + ")"
+
+
+def _host(url):
+    host = urlparse(url or "").netloc.lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def entry_domain(entry):
+    """Publisher host of a parsed Google News entry (the link itself is a news.google.com redirect)."""
+    return _host(entry.get("source_href")) or _host(entry.get("link"))
+
+
+def attribute(entry, sites):
+    """Name of the site in sites ({name: domain}) that published entry, or None."""
+    host = entry_domain(entry)
+    if not host:
+        return None
+    for name, domain in sites.items():
+        site_host = domain.split("/")[0].lower()
+        if host == site_host or host.endswith("." + site_host):
+            return name
+    return None
+
+
+async def _fetch(session, url, limit):
+    async with health.track(GOOGLE_NEWS_SOURCE) as probe:
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=15)) as resp:
+            if resp.status != 200:
+                probe.fail(f"HTTP {resp.status}", health.retry_after_seconds(resp))
+                return []
+            text = await resp.text()
+    feed = await parsing.parse_feed(text, limit)
+    return feed["entries"]
+
+
+async def fetch_entries(session, query, template=GOOGLE_NEWS_RSS, limit=MAX_RSS_ITEMS):
+    """Parsed entries for a Google News query ([] on error or open circuit).
+
+    Identical URLs requested within GOOGLE_NEWS_DEDUP_SECONDS share one request.
+    """
+    url = build_url(query, template)
+    now = time.monotonic()
+    for key in [k for k, (ts, _) in _recent.items() if now - ts > GOOGLE_NEWS_DEDUP_SECONDS]:
+        del _recent[key]
+
+    cached = _recent.get(url)
+    if cached is None:
+        task = asyncio.ensure_future(_fetch(session, url, MAX_RSS_ITEMS))
+        _recent[url] = (now, task)
+    else:
+        task = cached[1]
+
+    try:
+        entries = await asyncio.shield(task)
+    except health.SourceUnavailable:
+        _recent.pop(url, None)
+        return []
+    except Exception as e:
+        _recent.pop(url, None)
+        log.error(f"[google-news] '{query}' error: {e}")
+        return []
+    if not entries:
+        _recent.pop(url, None)  # don't pin an empty/failed result
+    return entries[:limit]
+
+
+async def fetch_site_entries(session, base, sites, per_site_limit, label):
+    """Entries of base searched on sites ({name: domain}) in site: OR-groups.
+
+    Returns ({name: entries}, number of queries). Each site keeps up to
+    per_site_limit entries. A group feed holding MAX_RSS_ITEMS entries may have
+    let its busiest outlets crowd the others out, so its sites still short of
+    per_site_limit are re-queried on their own.
+    """
+    by_site = {}
+    seen = set()
+    dropped = 0
+
+    def route(entries):
+        nonlocal dropped
+        for entry in entries:
+            name = attribute(entry, sites)
+            if not name:
+                dropped += 1
+                continue
+            bucket = by_site.setdefault(name, [])
+            if len(bucket) < per_site_limit and entry["link"] not in seen:
+                seen.add(entry["link"])
+                bucket.append(entry)
+
+    queries = plan_site_queries(base, sites.values())
+    results = await asyncio.gather(*[fetch_entries(session, q) for q, _ in queries])
+    full = []
+    for (_, domains), entries in zip(queries, results):
+        route(entries)
+        if len(domains) > 1 and len(entries) >= MAX_RSS_ITEMS:
+            full.extend(domains)
+
+    names = {}
+    for name, domain in sites.items():
+        names.setdefault(domain, name)
+    retry = [d for d in full if len(by_site.get(names[d], [])) < per_site_limit]
+    if retry:
+        log.info(f"[google-news] {label}: {len(retry)} sites of full OR-groups re-queried on their own")
+        for entries in await asyncio.gather(*[fetch_entries(session, _site_query(base, [d])) for d in retry]):
+            route(entries)
+
+    if dropped:
+        log.info(f"[google-news] {label}: {dropped} entries not attributable to any site dropped")
+    return by_site, len(queries) + len(retry)
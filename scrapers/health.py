@@ -0,0 +1,187 @@
+"""Source health registry with per-source circuit breakers.
+
+Every scraper request goes through `track(key)`, where key identifies a host
+("news.google.com"), a feed ("rss:Relevo"), a Telegram channel or an Apify
+actor. The registry keeps success rate, latency percentiles and the last error
+per key. After CIRCUIT_FAILURE_THRESHOLD consecutive failures the breaker
+opens and the source is skipped (SourceUnavailable) for a cool-down that
+doubles on every failed probe, up to CIRCUIT_MAX_COOLDOWN. When the cool-down
+ends a single probe request is let through; success closes the breaker.
+
+    async with health.track("news.google.com") as probe:
+        async with session.get(url) as resp:
+            if resp.status != 200:
+                probe.fail(f"HTTP {resp.status}")
+"""
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from config import CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_COOLDOWN_SECONDS, CIRCUIT_MAX_COOLDOWN
+
+log = logging.getLogger("agentradar")
+
+WINDOW = 100  # recent requests kept per source for rates/percentiles
+
+
+class SourceUnavailable(Exception):
+    """Raised by track() when the source's circuit is open."""
+
+
+class SourceHealth:
+    def __init__(self, key):
+        self.key = key
+        self.recent = deque(maxlen=WINDOW)  # (ok, latency_seconds)
+        self.total = 0
+        self.failures = 0
+        self.skipped = 0
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.last_error_at = None
+        self.last_success_at = None
+        self.open_until = 0.0
+        self.cooldown = CIRCUIT_COOLDOWN_SECONDS
+        self.probing = False
+
+    @property
+    def state(self):
+        if self.open_until and time.monotonic() < self.open_until:
+            return "open"
+        if self.open_until:
+            return "half-open"
+        return "closed"
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.probing:
+            self.probing = True
+            return True
+        self.skipped += 1
+        return False
+
+    def success(self, latency):
+        self.total += 1
+        self.recent.append((True, latency))
+        self.last_success_at = datetime.now().isoformat()
+        self.consecutive_failures = 0
+        if self.open_until:
+            log.info(f"[health] {self.key} recovered, circuit closed")
+        self.open_until = 0.0
+        self.cooldown = CIRCUIT_COOLDOWN_SECONDS
+        self.probing = False
+
+    def failure(self, error, latency, retry_after=None):
+        self.total += 1
+        self.failures += 1
+        self.recent.append((False, latency))
+        self.last_error = str(error)[:300]
+        self.last_error_at = datetime.now().isoformat()
+        self.consecutive_failures += 1
+
+        if self.probing:
+            # Failed probe: back off further
+            self.cooldown = min(self.cooldown * 2, CIRCUIT_MAX_COOLDOWN)
+        if self.probing or self.consecutive_failures >= CIRCUIT_FAILURE_THRESHOLD or retry_after:
+            cooldown = max(self.cooldown, retry_after or 0)
+            self.open_until = time.monotonic() + cooldown
+            log.warning(f"[health] {self.key} circuit open for {cooldown:.0f}s ({self.last_error})")
+        self.probing = False
+
+    def snapshot(self):
+        latencies = sorted(lat for _, lat in self.recent)
+        ok = sum(1 for success, _ in self.recent if success)
+        open_for = max(0.0, self.open_until - time.monotonic()) if self.open_until else 0.0
+        return {
+            "source": self.key,
+            "state": self.state,
+            "requests": self.total,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "success_rate": round(ok / len(self.recent), 3) if self.recent else None,
+            "latency_p50_ms": _percentile_ms(latencies, 0.50),
+            "latency_p95_ms": _percentile_ms(latencies, 0.95),
+            "latency_p99_ms": _percentile_ms(latencies, 0.99),
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "last_error_at": self.last_error_at,
+            "last_success_at": self.last_success_at,
+            "retry_in_seconds": round(open_for),
+        }
+
+
+def _percentile_ms(sorted_values, q):
+    if not sorted_values:
+        return None
+    idx = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return round(sorted_values[idx] * 1000)
+
+
+_registry = {}
+
+
+def get(key):
+    source = _registry.get(key)
+    if source is None:
+        source = _registry[key] = SourceHealth(key)
+    return source
+
+
+def is_available(key):
+    """True if the circuit for key is not open (does not consume the half-open probe)."""
+    return get(key).state != "open"
+
+
+class Probe:
+    """Handle yielded by track(); call fail() for responses that are errors but not exceptions."""
+
+    def __init__(self):
+        self.error = None
+        self.retry_after = None
+
+    def fail(self, error, retry_after=None):
+        self.error = error
+        self.retry_after = retry_after
+
+
+def retry_after_seconds(resp):
+    """Parse a numeric Retry-After header from a 429/503 response."""
+    value = resp.headers.get("Retry-After", "")
+    return int(value) if value.isdigit() else None
+
+
+@asynccontextmanager
+async def track(key):
+    source = get(key)
+    if not source.allow():
+        raise SourceUnavailable(key)
+    probe = Probe()
+    started = time.monotonic()
+    try:
+        yield probe
+    except Exception as e:
+        source.failure(e.__class__.__name__ + (f": {e}" if str(e) else ""), time.monotonic() - started)
+        raise
+    else:
+        if probe.error:
+            source.failure(probe.error, time.monotonic() - started, probe.retry_after)
+        else:
+            source.success(time.monotonic() - started)
+    finally:
+        # Probe abandoned by cancellation: let the next request probe
+        source.probing = False
+
+
+def snapshot():
+    """Health of every source seen so far, worst first."""
+    order = {"open": 0, "half-open": 1, "closed": 2}
+    return sorted(
+        (s.snapshot() for s in _registry.values()),
+        key=lambda s: (order[s["state"]], s["success_rate"] if s["success_rate"] is not None else 1, s["source"]),
+    )
@@ -0,0 +1,293 @@
+"""Shared HTTP session factory with cassette record/replay.
+
+Scrapers open their sessions with http.new_session() instead of
+aiohttp.ClientSession(). Without a cassette that is a plain aiohttp session.
+With one active (HTTP_CASSETTE_MODE or the use_cassette() context manager):
+
+- record: requests go to the network and every response (status, headers,
+  body, latency) is added to the cassette, saved as gzip-compressed JSON.
+- replay: responses come from the cassette and nothing touches the network.
+  A request that was not recorded raises aiohttp.ClientConnectionError, which
+  the scrapers already handle as a network error.
+
+Requests are matched on method, URL (query sorted, credential params such as
+token/key dropped) and a hash of the request body. Identical requests replay
+their recorded responses in order (Apify run polling, paged datasets).
+"""
+import aiohttp
+import asyncio
+import atexit
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from config import HTTP_CASSETTE_MODE, HTTP_CASSETTE_PATH, HTTP_CASSETTE_LATENCY
+
+log = logging.getLogger("agentradar")
+
+SECRET_PARAMS = {"token", "key", "api_key", "apikey", "access_token"}
+KEPT_HEADERS = ("Content-Type", "Content-Encoding", "Retry-After", "Location")
+
+
+def _scrub(u):
+    """URL with the query sorted and credential params removed."""
+    return u.with_query(sorted((k, v) for k, v in u.query.items() if k.lower() not in SECRET_PARAMS))
+
+
+def request_key(method, url, params=None, data=None, json_body=None):
+    """Cassette key of a request: "GET https://host/path?a=1&b=2 [body-hash]"."""
+    u = URL(str(url))
+    if params:
+        u = u.update_query(params)
+    key = f"{method.upper()} {_scrub(u)}"
+
+    body = None
+    if json_body is not None:
+        body = json.dumps(json_body, sort_keys=True).encode("utf-8")
+    elif isinstance(data, str):
+        body = data.encode("utf-8")
+    elif isinstance(data, bytes):
+        body = data
+    elif isinstance(data, dict):
+        body = json.dumps(data, sort_keys=True).encode("utf-8")
+    if body:
+        key += " " + hashlib.sha1(body).hexdigest()[:12]
+    return key
+
+
+class Cassette:
+    def __init__(self, path, mode, latency=0.0):
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.meta = {}
+        self.interactions = {}  # key -> [recorded response]
+        self._cursor = {}
+        self.hits = 0
+        self.misses = 0
+        if mode == "replay":
+            self.load()
+
+    def load(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        self.meta = data.get("meta", {})
+        self.interactions = data["interactions"]
+        log.info(f"[http] Replaying {sum(map(len, self.interactions.values()))} responses from {self.path}")
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with gzip.open(self.path, "wt", encoding="utf-8") as f:
+            json.dump({
+                "version": 1,
+                "recorded_at": datetime.now().isoformat(),
+                "meta": self.meta,
+                "interactions": self.interactions,
+            }, f)
+        log.info(f"[http] Cassette saved: {sum(map(len, self.interactions.values()))} responses -> {self.path}")
+
+    def record(self, key, entry):
+        self.interactions.setdefault(key, []).append(entry)
+
+    def next(self, key):
+        """Next recorded response for key (the last one repeats), or None."""
+        recorded = self.interactions.get(key)
+        if not recorded:
+            self.misses += 1
+            return None
+        i = self._cursor.get(key, 0)
+        self._cursor[key] = i + 1
+        self.hits += 1
+        return recorded[min(i, len(recorded) - 1)]
+
+
+def _encode_body(body):
+    try:
+        return {"text": body.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"b64": base64.b64encode(body).decode("ascii")}
+
+
+def _decode_body(entry):
+    if "b64" in entry:
+        return base64.b64decode(entry["b64"])
+    return entry.get("text", "").encode("utf-8")
+
+
+class ReplayResponse:
+    """The parts of aiohttp.ClientResponse the scrapers use, served from a cassette."""
+
+    def __init__(self, method, entry):
+        self.method = method
+        self.status = entry["status"]
+        self.reason = entry.get("reason", "")
+        self.url = URL(entry["url"])
+        self.headers = CIMultiDictProxy(CIMultiDict(entry.get("headers", {})))
+        self._body = _decode_body(entry)
+
+    @property
+    def ok(self):
+        return self.status < 400
+
+    @property
+    def content_type(self):
+        return self.headers.get("Content-Type", "application/octet-stream").split(";")[0].strip()
+
+    @property
+    def charset(self):
+        for part in self.headers.get("Content-Type", "").split(";")[1:]:
+            name, _, value = part.strip().partition("=")
+            if name.lower() == "charset":
+                return value.strip('"') or None
+        return None
+
+    async def read(self):
+        return self._body
+
+    async def text(self, encoding=None, errors="strict"):
+        return self._body.decode(encoding or self.charset or "utf-8", errors)
+
+    async def json(self, *, encoding=None, loads=json.loads, content_type="application/json"):
+        text = (await self.text(encoding)).strip()
+        return loads(text) if text else None
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise aiohttp.ClientResponseError(None, (), status=self.status, message=self.reason)
+
+    def release(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+class _RequestContext:
+    """Awaitable / async context manager, like the object session.get() returns."""
+
+    def __init__(self, coro):
+        self._coro = coro
+        self._resp = None
+
+    def __await__(self):
+        return self._coro.__await__()
+
+    async def __aenter__(self):
+        self._resp = await self._coro
+        return self._resp
+
+    async def __aexit__(self, *exc):
+        self._resp.release()
+
+
+class CassetteSession:
+    """Drop-in for aiohttp.ClientSession that records to / replays from a cassette."""
+
+    def __init__(self, cassette, **kwargs):
+        self._cassette = cassette
+        self._session = aiohttp.ClientSession(**kwargs) if cassette.mode == "record" else None
+        self._closed = False
+
+    @property
+    def closed(self):
+        return self._session.closed if self._session is not None else self._closed
+
+    def request(self, method, url, **kwargs):
+        return _RequestContext(self._request(method, url, **kwargs))
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    async def _request(self, method, url, **kwargs):
+        key = request_key(method, url, kwargs.get("params"), kwargs.get("data"), kwargs.get("json"))
+        if self._cassette.mode == "record":
+            return await self._record(key, method, url, **kwargs)
+
+        entry = self._cassette.next(key)
+        if entry is None:
+            raise aiohttp.ClientConnectionError(f"Not in cassette: {key}")
+        if self._cassette.latency:
+            await asyncio.sleep(entry.get("elapsed", 0) * self._cassette.latency)
+        if "error" in entry:
+            if entry["error"] == "TimeoutError":
+                raise asyncio.TimeoutError()
+            raise aiohttp.ClientConnectionError(entry["error"])
+        return ReplayResponse(method, entry)
+
+    async def _record(self, key, method, url, **kwargs):
+        started = time.monotonic()
+        try:
+            resp = await self._session.request(method, url, **kwargs)
+            body = await resp.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self._cassette.record(key, {
+                "error": e.__class__.__name__ if isinstance(e, asyncio.TimeoutError) else f"{e.__class__.__name__}: {e}",
+                "elapsed": round(time.monotonic() - started, 3),
+            })
+            raise
+        self._cassette.record(key, {
+            "status": resp.status,
+            "reason": resp.reason or "",
+            "url": str(_scrub(resp.url)),
+            "headers": {h: resp.headers[h] for h in KEPT_HEADERS if h in resp.headers},
+            "elapsed": round(time.monotonic() - started, 3),
+            **_encode_body(body),
+        })
+        return resp  # body already read, so text()/json() still work
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+        self._closed = True
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+_active = None
+if HTTP_CASSETTE_MODE in ("record", "replay"):
+    _active = Cassette(HTTP_CASSETTE_PATH, HTTP_CASSETTE_MODE, HTTP_CASSETTE_LATENCY)
+    if HTTP_CASSETTE_MODE == "record":
+        atexit.register(_active.save)
+
+
+def new_session(**kwargs):
+    """aiohttp.ClientSession(**kwargs), or a cassette session when one is active."""
+    if _active is None:
+        return aiohttp.ClientSession(**kwargs)
+    return CassetteSession(_active, **kwargs)
+
+
+@contextmanager
+def use_cassette(path, mode="replay", latency=0.0):
+    """Record or replay all sessions opened through new_session() inside the block."""
+    global _active
+    previous = _active
+    cassette = Cassette(path, mode, latency)
+    _active = cassette
+    try:
+        yield cassette
+    finally:
+        _active = previous
+        if mode == "record":
+            cassette.save()
@@ -0,0 +1,103 @@
+"""Image download, downscale and perceptual hash for Vision analysis.
+
+prepare() decodes an image, shrinks it to the size GPT-4o sees with
+detail=low (512px on the long side) and computes a 64-bit difference hash
+(dHash): the image is reduced to 9x8 grayscale and each bit records whether a
+pixel is brighter than its right neighbour. Reposts, crops of a few pixels
+and recompressions land within a few bits of each other, so they can share
+one cached analysis.
+
+Pillow is optional: without it the hash is the SHA-1 of the raw bytes
+(exact copies only) and the original URL is sent to OpenAI.
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import logging
+
+import aiohttp
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from scrapers import http, parsing
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - Pillow is an optional dependency
+    Image = None
+
+log = logging.getLogger("agentradar")
+
+IMAGE_HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AgentRadar/1.0"}
+MAX_IMAGE_BYTES = 8 * 1024 * 1024
+VISION_SIDE = 512  # GPT-4o detail=low works on a 512x512 version
+HASH_BANDS = 4  # 16-bit bands stored separately for near-duplicate lookups
+
+
+def dhash(img):
+    """64-bit difference hash of a PIL image as 16 hex chars."""
+    small = img.convert("L").resize((9, 8), Image.BILINEAR)
+    px = list(small.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+def hamming(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def bands(image_hash):
+    """The hash split into HASH_BANDS equal hex slices. Two hashes within
+    HASH_BANDS - 1 bits of each other always share at least one band."""
+    width = len(image_hash) // HASH_BANDS
+    return [image_hash[i * width:(i + 1) * width] for i in range(HASH_BANDS)]
+
+
+def prepare(data):
+    """(hash, data URL of the downscaled JPEG or None) for raw image bytes.
+
+    Module-level so it can run in the parsing process pool.
+    """
+    if Image is None:
+        return "sha1:" + hashlib.sha1(data).hexdigest(), None
+    with Image.open(io.BytesIO(data)) as img:
+        img.draft("RGB", (VISION_SIDE, VISION_SIDE))  # JPEG: decode at reduced scale
+        img = img.convert("RGB")
+        image_hash = dhash(img)
+        img.thumbnail((VISION_SIDE, VISION_SIDE))
+        out = io.BytesIO()
+        img.save(out, "JPEG", quality=80)
+    return image_hash, "data:image/jpeg;base64," + base64.b64encode(out.getvalue()).decode("ascii")
+
+
+async def _fetch(session, url):
+    try:
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=15)) as resp:
+            if resp.status != 200:
+                return None
+            data = await resp.read()
+            return data if len(data) <= MAX_IMAGE_BYTES else None
+    except Exception as e:
+        log.debug(f"[images] Fetch failed {url[:80]}: {e}")
+        return None
+
+
+async def fetch_and_prepare(urls):
+    """{url: (hash, data URL or None)} for every image that could be fetched and decoded."""
+    async with http.new_session(headers=IMAGE_HEADERS) as session:
+        blobs = await asyncio.gather(*[_fetch(session, url) for url in urls])
+
+    async def one(url, data):
+        try:
+            return url, await parsing.in_process(prepare, data)
+        except Exception as e:
+            log.debug(f"[images] Could not decode {url[:80]}: {e}")
+            return url, None
+
+    prepared = await asyncio.gather(*[one(url, data) for url, data in zip(urls, blobs) if data])
+    return {url: result for url, result in prepared if result}
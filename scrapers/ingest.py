@@ -0,0 +1,125 @@
+"""Background press ingestion into the local article index.
+
+Every PRESS_INGEST_INTERVAL_MINUTES the scheduler calls ingest_press_once():
+all SPANISH_PRESS_FEEDS are polled and every entry is matched against the
+whole roster, and the Google News searches run for the next
+PRESS_INGEST_GOOGLE_BATCH players (round-robin, so Google sees a few queries
+per tick instead of the full roster). Matches are stored in press_articles /
+player_press_index with their full text, and player scans read the press
+stage from that index instead of going to the network.
+"""
+import asyncio
+import logging
+from datetime import datetime
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import db
+from config import PRESS_INGEST_GOOGLE_BATCH, PRESS_INDEX_RETENTION_DAYS
+from scrapers import http
+from scrapers.articles import fetch_article_texts
+from scrapers.press import (
+    PRESS_HEADERS, fetch_press_feeds, scrape_google_news, scrape_site_search,
+    filter_press_items, is_profile_page, _name_matches, _press_item,
+)
+
+log = logging.getLogger("agentradar")
+
+ingest_status = {"runs": 0, "last_run": None, "last_duration_s": None, "last_new_links": 0, "running": False}
+
+_google_cursor = 0
+_google_covered = set()  # player ids that have had at least one Google pass since startup
+_lock = asyncio.Lock()
+
+
+def is_covered(player_id):
+    """True once the index holds both RSS and Google results for this player."""
+    return player_id in _google_covered
+
+
+def _next_google_batch(players):
+    global _google_cursor
+    if not players:
+        return []
+    n = min(PRESS_INGEST_GOOGLE_BATCH, len(players))
+    start = _google_cursor % len(players)
+    _google_cursor = start + n
+    return [players[(start + i) % len(players)] for i in range(n)]
+
+
+async def _google_for_player(session, player):
+    google, site_search = await asyncio.gather(
+        scrape_google_news(player["name"], session, player.get("club")),
+        scrape_site_search(player["name"], session, player.get("club")),
+    )
+    return filter_press_items(google + site_search, player["name"])
+
+
+async def ingest_press_once():
+    """One ingestion pass. Returns the number of new player -> article links."""
+    if _lock.locked():
+        log.info("[ingest] Previous pass still running, skipping")
+        return 0
+
+    async with _lock:
+        started = datetime.now()
+        ingest_status["running"] = True
+        try:
+            players = await db.get_all_players()
+            if not players:
+                return 0
+
+            matches = []  # (player, item)
+            async with http.new_session(headers=PRESS_HEADERS) as session:
+                batch = _next_google_batch(players)
+                feeds, google_results = await asyncio.gather(
+                    fetch_press_feeds(session),
+                    asyncio.gather(*[_google_for_player(session, p) for p in batch], return_exceptions=True),
+                )
+
+                for source, entries in feeds:
+                    for entry in entries:
+                        if is_profile_page(entry["link"]):
+                            continue
+                        text = entry["title"] + " " + entry["summary"]
+                        for player in players:
+                            if _name_matches(text, player["name"]):
+                                matches.append((player, _press_item(entry, source)))
+
+                for player, result in zip(batch, google_results):
+                    if isinstance(result, Exception):
+                        log.error(f"[ingest] Google search error for {player['name']}: {result}")
+                        continue
+                    matches.extend((player, item) for item in result)
+                    _google_covered.add(player["id"])
+
+                articles = await db.save_ingested_articles([item for _, item in matches])
+                new_links = await db.index_player_articles(
+                    [(player["id"], articles[item["url"]][0]) for player, item in matches if item["url"] in articles]
+                )
+
+                # Full text for matched articles that don't have it yet (article store first)
+                missing = {url: aid for url, (aid, has_text) in articles.items() if not has_text}
+                if missing:
+                    texts = await fetch_article_texts(session, list(missing))
+                    await db.set_ingested_article_texts({missing[url]: t for url, t in texts.items() if t})
+
+            if ingest_status["runs"] % 100 == 0:
+                await db.prune_press_index(PRESS_INDEX_RETENTION_DAYS)
+
+            elapsed = (datetime.now() - started).total_seconds()
+            ingest_status.update({
+                "runs": ingest_status["runs"] + 1,
+                "last_run": started.isoformat(),
+                "last_duration_s": round(elapsed, 1),
+                "last_new_links": new_links,
+            })
+            log.info(f"[ingest] {len(matches)} matches, {new_links} new links, "
+                     f"Google for {[p['name'] for p in batch]} in {elapsed:.1f}s")
+            return new_links
+        except Exception as e:
+            log.error(f"[ingest] Pass error: {e}", exc_info=True)
+            return 0
+        finally:
+            ingest_status["running"] = False
@@ -0,0 +1,127 @@
+"""Executor layer for parsing scraped pages off the event loop.
+
+Scrapers fetch on the loop and hand the body to one of two pools:
+
+- in_thread: a thread pool for lxml work, which releases the GIL while parsing.
+- in_process: a process pool for pure-Python parsers (feedparser, BeautifulSoup
+  trees, large regex passes), which would otherwise hold the GIL and stall
+  the loop even from a thread.
+
+Functions sent to the process pool must be module-level and return plain
+dicts/lists so they pickle. Bodies smaller than PARSE_INLINE_BYTES are parsed
+inline, where a pool round-trip would cost more than the parse itself.
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+import feedparser
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from config import PARSE_THREAD_WORKERS, PARSE_PROCESS_WORKERS, PARSE_INLINE_BYTES
+from db import normalize_date
+
+log = logging.getLogger("agentradar")
+
+_thread_pool = None
+_process_pool = None
+
+
+def _get_thread_pool():
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(max_workers=PARSE_THREAD_WORKERS, thread_name_prefix="parse")
+    return _thread_pool
+
+
+def _get_process_pool():
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=PARSE_PROCESS_WORKERS)
+    return _process_pool
+
+
+def shutdown():
+    global _thread_pool, _process_pool
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=False, cancel_futures=True)
+        _thread_pool = None
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+async def in_thread(fn, *args, size=None):
+    """Run fn(*args) in the parsing thread pool (inline when size is small)."""
+    if size is not None and size < PARSE_INLINE_BYTES:
+        return fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(_get_thread_pool(), fn, *args)
+
+
+async def in_process(fn, *args, size=None):
+    """Run fn(*args) in the parsing process pool (inline when size is small)."""
+    global _process_pool
+    if size is not None and size < PARSE_INLINE_BYTES:
+        return fn(*args)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_process_pool(), fn, *args)
+    except BrokenProcessPool:
+        # A worker died (OOM on a huge page); retry this call in a thread and
+        # start a fresh pool on the next one
+        log.warning("[parsing] Process pool broken, restarting")
+        _process_pool = None
+        return await in_thread(fn, *args)
+
+
+def entry_date(entry):
+    """ISO date of a feed entry, or "" when it has none (DB falls back to scraped_at)."""
+    for field in ["published_parsed", "updated_parsed"]:
+        tp = entry.get(field)
+        if tp:
+            try:
+                return datetime(*tp[:6]).isoformat()
+            except Exception:
+                pass
+    # Try parsing raw date strings before giving up
+    for field in ["published", "updated"]:
+        raw = entry.get(field, "")
+        if raw:
+            parsed = normalize_date(raw)
+            if parsed:
+                return parsed
+    return ""
+
+
+def parse_feed_text(text, limit=None):
+    """Parse an RSS/Atom body into plain dicts.
+
+    Returns {"entries": [...], "invalid": bool, "error": str}; invalid is set
+    when the body is not a feed at all (e.g. an HTML error page).
+    """
+    feed = feedparser.parse(text)
+    entries = []
+    for entry in feed.entries[:limit]:
+        source = entry.get("source") or {}
+        entries.append({
+            "title": entry.get("title", ""),
+            "link": entry.get("link", ""),
+            "summary": entry.get("summary", ""),
+            "published_at": entry_date(entry),
+            "published_raw": entry.get("published", entry.get("updated", "")),
+            # Publisher of a Google News item (<source url="...">)
+            "source_href": source.get("href", ""),
+            "source_title": source.get("title", ""),
+        })
+    return {
+        "entries": entries,
+        "invalid": bool(feed.bozo) and not feed.entries,
+        "error": str(feed.get("bozo_exception", "")),
+    }
+
+
+async def parse_feed(text, limit=None):
+    return await in_process(parse_feed_text, text, limit, size=len(text))
@@ -8,18 +8,22 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from db import normalize_date
 from config import (
-    APIFY_TOKEN, APIFY_BASE, TWITTER_ACTOR,
+    APIFY_TOKEN, TWITTER_ACTOR,
     INSTAGRAM_HASHTAG_ACTOR, MAX_INSTAGRAM_MENTIONS,
     REDDIT_SUBREDDITS, MAX_TWEETS_MENTIONS, MAX_REDDIT_POSTS,
-    TELEGRAM_CHANNELS, GOOGLE_NEWS_RSS, FORUM_SITES,
+    TELEGRAM_CHANNELS, FORUM_SITES,
 )
+from scrapers.apify import run_actor
 from scrapers.youtube import scrape_youtube
 from scrapers.telegram import scrape_all_telegram
-import feedparser
+from scrapers import google_news, health, http
 import unicodedata
 
 log = logging.getLogger("agentradar")
 
+REDDIT_SOURCE = "reddit.com"
+FORUM_SITE_LIMIT = 10  # results kept per forum/fan site
+
 
 def _normalize(text):
     """Remove accents and normalize for comparison."""
@@ -122,50 +126,55 @@ def _filter_by_relevance(items, player_name):
     return filtered
 
 
-async def _apify_run_with_retry(session, actor, input_data, max_items, label, retries=2):
-    """Run Apify actor with exponential backoff retry."""
-    for attempt in range(retries + 1):
-        try:
-            run_url = f"{APIFY_BASE}/acts/{actor}/runs?token={APIFY_TOKEN}"
-            async with session.post(run_url, json=input_data, timeout=aiohttp.ClientTimeout(total=30)) as resp:
-                if resp.status not in (200, 201):
-                    body = await resp.text()
-                    log.error(f"[social] {label} Apify start error {resp.status}: {body[:200]}")
-                    if attempt < retries:
-                        await asyncio.sleep(2 ** (attempt + 1))
-                        continue
-                    return []
-                run_data = await resp.json()
-
-            run_id = run_data["data"]["id"]
-            status = "RUNNING"
-            for _ in range(60):
-                await asyncio.sleep(5)
-                status_url = f"{APIFY_BASE}/actor-runs/{run_id}?token={APIFY_TOKEN}"
-                async with session.get(status_url) as resp:
-                    status_data = await resp.json()
-                    status = status_data["data"]["status"]
-                    if status in ("SUCCEEDED", "FAILED", "ABORTED", "TIMED-OUT"):
-                        break
-
-            if status != "SUCCEEDED":
-                log.warning(f"[social] {label} Apify run ended: {status}")
-                return []
-
-            dataset_id = status_data["data"]["defaultDatasetId"]
-            data_url = f"{APIFY_BASE}/datasets/{dataset_id}/items?token={APIFY_TOKEN}&limit={max_items}"
-            async with session.get(data_url) as resp:
-                return await resp.json()
-        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-            log.error(f"[social] {label} error (attempt {attempt+1}/{retries+1}): {e}")
-            if attempt < retries:
-                await asyncio.sleep(2 ** (attempt + 1))
-            else:
-                return []
-        except Exception as e:
-            log.error(f"[social] {label} unexpected error: {e}")
-            return []
-    return []
+def _mention_from_tweet(tweet):
+    """Convert a raw tweet-scraper item into a social mention dict."""
+    # Extract image URL if available
+    media_list = tweet.get("media") or tweet.get("entities", {}).get("media", [])
+    image_url = ""
+    if isinstance(media_list, list) and media_list:
+        image_url = media_list[0].get("media_url_https", "") or media_list[0].get("url", "")
+    return {
+        "platform": "twitter",
+        "author": tweet.get("author", {}).get("userName", "")
+            or tweet.get("user", {}).get("screen_name", "unknown"),
+        "text": tweet.get("full_text", tweet.get("text", "")),
+        "url": tweet.get("url", ""),
+        "likes": tweet.get("likeCount", tweet.get("favorite_count", 0)) or 0,
+        "retweets": tweet.get("retweetCount", tweet.get("retweet_count", 0)) or 0,
+        "created_at": normalize_date(tweet.get("createdAt", tweet.get("created_at", ""))),
+        "image_url": image_url,
+    }
+
+
+def _mention_from_instagram(post):
+    """Convert a raw Instagram hashtag-scraper item into a social mention dict."""
+    image_url = post.get("displayUrl", "") or post.get("thumbnailSrc", "") or post.get("previewUrl", "")
+    return {
+        "platform": "instagram",
+        "author": post.get("ownerUsername", "") or post.get("owner", {}).get("username", "unknown"),
+        "text": post.get("caption", "") or "",
+        "url": post.get("url", "") or post.get("shortCode", ""),
+        "likes": post.get("likesCount", post.get("likes", 0)) or 0,
+        "retweets": post.get("commentsCount", post.get("comments", 0)) or 0,
+        "created_at": normalize_date(post.get("timestamp", post.get("taken_at", ""))),
+        "image_url": image_url,
+    }
+
+
+def _build_hashtags(player_name, instagram_handle=None):
+    """Build multiple hashtag variants for better coverage."""
+    hashtag_base = player_name.lower().replace(" ", "").replace("-", "")
+    hashtags = [hashtag_base]
+    # With underscore: rodri_sanchez
+    hashtags.append(player_name.lower().replace(" ", "_").replace("-", "_"))
+    # Surname + futbol if surname is long enough
+    parts = player_name.split()
+    if len(parts) > 1 and len(parts[-1]) > 4:
+        hashtags.append(parts[-1].lower() + "futbol")
+    # Handle if available
+    if instagram_handle:
+        hashtags.append(instagram_handle.lower().replace("@", ""))
+    return list(set(h for h in hashtags if h))  # Dedup
 
 
 def _build_search_queries(player_name, twitter_handle=None, club=None):
@@ -196,25 +205,8 @@ async def scrape_twitter_mentions(player_name, session, twitter_handle=None, clu
         "sort": "Latest",
     }
 
-    tweets = await _apify_run_with_retry(session, TWITTER_ACTOR, input_data, limit, "Twitter")
-    items = []
-    for tweet in tweets:
-        # Extract image URL if available
-        media_list = tweet.get("media") or tweet.get("entities", {}).get("media", [])
-        image_url = ""
-        if isinstance(media_list, list) and media_list:
-            image_url = media_list[0].get("media_url_https", "") or media_list[0].get("url", "")
-        items.append({
-            "platform": "twitter",
-            "author": tweet.get("author", {}).get("userName", "")
-                or tweet.get("user", {}).get("screen_name", "unknown"),
-            "text": tweet.get("full_text", tweet.get("text", "")),
-            "url": tweet.get("url", ""),
-            "likes": tweet.get("likeCount", tweet.get("favorite_count", 0)) or 0,
-            "retweets": tweet.get("retweetCount", tweet.get("retweet_count", 0)) or 0,
-            "created_at": normalize_date(tweet.get("createdAt", tweet.get("created_at", ""))),
-            "image_url": image_url,
-        })
+    tweets = await run_actor(session, TWITTER_ACTOR, input_data, limit, "Twitter")
+    items = [_mention_from_tweet(tweet) for tweet in tweets]
 
     log.info(f"[social] Twitter: {len(items)} menciones")
     return items
@@ -227,6 +219,8 @@ async def scrape_reddit(player_name, session):
     }
 
     for sub in REDDIT_SUBREDDITS:
+        if not health.is_available(REDDIT_SOURCE):
+            break
         try:
             url = f"https://www.reddit.com/r/{sub}/search.json"
             params = {
@@ -237,31 +231,37 @@ async def scrape_reddit(player_name, session):
                 "t": "year",
             }
 
-            async with session.get(
-                url, params=params, headers=headers,
-                timeout=aiohttp.ClientTimeout(total=10),
-            ) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    posts = data.get("data", {}).get("children", [])
-                    per_sub = MAX_REDDIT_POSTS // len(REDDIT_SUBREDDITS)
-                    for post in posts[:per_sub]:
-                        pd = post.get("data", {})
-                        items.append({
-                            "platform": "reddit",
-                            "author": pd.get("author", ""),
-                            "text": f"{pd.get('title', '')} {pd.get('selftext', '')[:300]}",
-                            "url": f"https://reddit.com{pd.get('permalink', '')}",
-                            "likes": pd.get("score", 0),
-                            "retweets": pd.get("num_comments", 0),
-                            "created_at": datetime.fromtimestamp(
-                                pd.get("created_utc", 0)
-                            ).isoformat()
-                            if pd.get("created_utc")
-                            else "",
-                        })
+            async with health.track(REDDIT_SOURCE) as probe:
+                async with session.get(
+                    url, params=params, headers=headers,
+                    timeout=aiohttp.ClientTimeout(total=10),
+                ) as resp:
+                    if resp.status == 200:
+                        data = await resp.json()
+                    else:
+                        probe.fail(f"HTTP {resp.status}", health.retry_after_seconds(resp))
+                        data = {}
+            posts = data.get("data", {}).get("children", [])
+            per_sub = MAX_REDDIT_POSTS // len(REDDIT_SUBREDDITS)
+            for post in posts[:per_sub]:
+                pd = post.get("data", {})
+                items.append({
+                    "platform": "reddit",
+                    "author": pd.get("author", ""),
+                    "text": f"{pd.get('title', '')} {pd.get('selftext', '')[:300]}",
+                    "url": f"https://reddit.com{pd.get('permalink', '')}",
+                    "likes": pd.get("score", 0),
+                    "retweets": pd.get("num_comments", 0),
+                    "created_at": datetime.fromtimestamp(
+                        pd.get("created_utc", 0)
+                    ).isoformat()
+                    if pd.get("created_utc")
+                    else "",
+                })
 
             await asyncio.sleep(1.5)
+        except health.SourceUnavailable:
+            break
         except Exception as e:
             log.error(f"[social] Reddit r/{sub} error: {e}")
 
@@ -270,46 +270,27 @@ async def scrape_reddit(player_name, session):
 
 
 async def scrape_google_web(player_name, session, club=None):
-    """Search forums, blogs, and fan sites via Google News RSS with site: operator."""
+    """Search forums, blogs, and fan sites via Google News RSS with site: operator (OR-grouped)."""
     items = []
-    quoted = f'"{player_name}"'
-
-    for site_name, domain in FORUM_SITES.items():
-        query = f'{quoted}+site:{domain}'
-        url = GOOGLE_NEWS_RSS.format(query=query.replace(" ", "+"))
-        try:
-            async with session.get(url, timeout=aiohttp.ClientTimeout(total=10)) as resp:
-                if resp.status == 200:
-                    text = await resp.text()
-                    feed = feedparser.parse(text)
-                    for entry in feed.entries[:10]:
-                        items.append({
-                            "platform": site_name.lower().replace(" ", "_"),
-                            "author": site_name,
-                            "text": entry.get("title", "") + " " + entry.get("summary", "")[:200],
-                            "url": entry.get("link", ""),
-                            "likes": 0,
-                            "retweets": 0,
-                            "created_at": _parse_date_simple(entry),
-                        })
-        except Exception as e:
-            log.error(f"[social] Google web {site_name} error: {e}")
-
-    log.info(f"[social] Google Web: {len(items)} resultados de {len(FORUM_SITES)} sitios")
+    per_site, n_queries = await google_news.fetch_site_entries(
+        session, f'"{player_name}"', FORUM_SITES, FORUM_SITE_LIMIT, "Google Web",
+    )
+    for site_name, entries in per_site.items():
+        for entry in entries:
+            items.append({
+                "platform": site_name.lower().replace(" ", "_"),
+                "author": site_name,
+                "text": entry["title"] + " " + entry["summary"][:200],
+                "url": entry["link"],
+                "likes": 0,
+                "retweets": 0,
+                "created_at": entry["published_at"] or entry["published_raw"] or datetime.now().isoformat(),
+            })
+
+    log.info(f"[social] Google Web: {len(items)} resultados de {len(FORUM_SITES)} sitios ({n_queries} consultas)")
     return items
 
 
-def _parse_date_simple(entry):
-    for field in ["published_parsed", "updated_parsed"]:
-        tp = entry.get(field)
-        if tp:
-            try:
-                return datetime(*tp[:6]).isoformat()
-            except Exception:
-                pass
-    return entry.get("published", entry.get("updated", datetime.now().isoformat()))
-
-
 async def scrape_instagram_mentions(player_name, session, instagram_handle=None, max_items=None):
     """Scrape Instagram hashtag/tag mentions via Apify."""
     if not APIFY_TOKEN:
@@ -317,67 +298,53 @@ async def scrape_instagram_mentions(player_name, session, instagram_handle=None,
         return []
 
     limit = max_items or MAX_INSTAGRAM_MENTIONS
-    # Build multiple hashtag variants for better coverage
-    hashtag_base = player_name.lower().replace(" ", "").replace("-", "")
-    hashtags = [hashtag_base]
-    # With underscore: rodri_sanchez
-    hashtags.append(player_name.lower().replace(" ", "_").replace("-", "_"))
-    # Surname + futbol if surname is long enough
-    parts = player_name.split()
-    if len(parts) > 1 and len(parts[-1]) > 4:
-        hashtags.append(parts[-1].lower() + "futbol")
-    # Handle if available
-    if instagram_handle:
-        hashtags.append(instagram_handle.lower().replace("@", ""))
-    hashtags = list(set(h for h in hashtags if h))  # Dedup
+    hashtags = _build_hashtags(player_name, instagram_handle)
 
     input_data = {
         "hashtags": hashtags,
         "resultsLimit": limit,
     }
 
-    posts = await _apify_run_with_retry(session, INSTAGRAM_HASHTAG_ACTOR, input_data, limit, "Instagram Mentions")
-    items = []
-    for post in posts:
-        text = post.get("caption", "") or ""
-        image_url = post.get("displayUrl", "") or post.get("thumbnailSrc", "") or post.get("previewUrl", "")
-        items.append({
-            "platform": "instagram",
-            "author": post.get("ownerUsername", "") or post.get("owner", {}).get("username", "unknown"),
-            "text": text,
-            "url": post.get("url", "") or post.get("shortCode", ""),
-            "likes": post.get("likesCount", post.get("likes", 0)) or 0,
-            "retweets": post.get("commentsCount", post.get("comments", 0)) or 0,
-            "created_at": normalize_date(post.get("timestamp", post.get("taken_at", ""))),
-            "image_url": image_url,
-        })
+    posts = await run_actor(session, INSTAGRAM_HASHTAG_ACTOR, input_data, limit, "Instagram Mentions")
+    items = [_mention_from_instagram(post) for post in posts]
 
     log.info(f"[social] Instagram Mentions: {len(items)} posts (hashtags: {hashtags})")
     return items
 
 
-async def scrape_all_social(player_name, twitter_handle=None, club=None, limit_multiplier=1, instagram_handle=None):
+async def _from_batch(items):
+    """Items prefetched by the roster batch, awaited alongside the scrapers they replace."""
+    return items
+
+
+async def scrape_all_social(player_name, twitter_handle=None, club=None, limit_multiplier=1, instagram_handle=None,
+                            prefetched=None):
+    """prefetched: this player's share of the roster-wide batched Apify runs
+    (see scrapers.batch); the Twitter/Instagram mentions it holds are not
+    re-scraped, the sources it lacks are."""
     # Override limits for deep scrape
     tw_limit = MAX_TWEETS_MENTIONS * limit_multiplier
     if limit_multiplier > 1:
         log.info(f"[social] Deep scrape mode: {limit_multiplier}x limits (tw={tw_limit})")
 
     ig_limit = MAX_INSTAGRAM_MENTIONS * limit_multiplier
+    prefetched = prefetched or {}
 
-    async with aiohttp.ClientSession() as session:
+    async with http.new_session() as session:
         twitter, reddit, youtube, ig_mentions = await asyncio.gather(
-            scrape_twitter_mentions(player_name, session, twitter_handle, club,
-                                    max_items=tw_limit),
+            _from_batch(prefetched["twitter_mentions"]) if "twitter_mentions" in prefetched
+            else scrape_twitter_mentions(player_name, session, twitter_handle, club, max_items=tw_limit),
             scrape_reddit(player_name, session),
-            scrape_youtube(player_name, session),
-            scrape_instagram_mentions(player_name, session, instagram_handle, max_items=ig_limit),
+            scrape_youtube(player_name, session, max_pages=limit_multiplier),
+            _from_batch(prefetched["instagram_mentions"]) if "instagram_mentions" in prefetched
+            else scrape_instagram_mentions(player_name, session, instagram_handle, max_items=ig_limit),
         )
 
     # Telegram
     telegram = await scrape_all_telegram(player_name, TELEGRAM_CHANNELS)
 
     # Google Web Search (forums, blogs, fan sites)
-    async with aiohttp.ClientSession() as session:
+    async with http.new_session() as session:
         web_results = await scrape_google_web(player_name, session, club)
 
     total = twitter + reddit + youtube + ig_mentions + telegram + web_results
@@ -1,12 +1,11 @@
-import aiohttp
-import asyncio
 import logging
-import re
 
 import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-from config import APIFY_TOKEN, APIFY_BASE, SOFASCORE_ACTOR
+from config import APIFY_TOKEN, SOFASCORE_ACTOR
+from scrapers import http
+from scrapers.apify import run_actor
 
 log = logging.getLogger("agentradar")
 
@@ -20,56 +19,12 @@ async def scrape_sofascore_ratings(sofascore_url, max_retries=2):
         "startUrls": [{"url": sofascore_url}],
     }
 
-    items = []
-    async with aiohttp.ClientSession() as session:
-        for attempt in range(max_retries + 1):
-            try:
-                run_url = f"{APIFY_BASE}/acts/{SOFASCORE_ACTOR}/runs?token={APIFY_TOKEN}"
-                async with session.post(run_url, json=input_data,
-                                        timeout=aiohttp.ClientTimeout(total=30)) as resp:
-                    if resp.status not in (200, 201):
-                        body = await resp.text()
-                        log.error(f"[sofascore] Apify start error {resp.status}: {body[:200]}")
-                        if attempt < max_retries:
-                            await asyncio.sleep(2 ** (attempt + 1))
-                            continue
-                        return []
-                    run_data = await resp.json()
-
-                run_id = run_data["data"]["id"]
-                status = "RUNNING"
-                for _ in range(60):
-                    await asyncio.sleep(5)
-                    status_url = f"{APIFY_BASE}/actor-runs/{run_id}?token={APIFY_TOKEN}"
-                    async with session.get(status_url) as resp:
-                        status_data = await resp.json()
-                        status = status_data["data"]["status"]
-                        if status in ("SUCCEEDED", "FAILED", "ABORTED", "TIMED-OUT"):
-                            break
-
-                if status != "SUCCEEDED":
-                    log.warning(f"[sofascore] Apify run ended: {status}")
-                    return []
-
-                dataset_id = status_data["data"]["defaultDatasetId"]
-                data_url = f"{APIFY_BASE}/datasets/{dataset_id}/items?token={APIFY_TOKEN}&limit=100"
-                async with session.get(data_url) as resp:
-                    raw_items = await resp.json()
-
-                items = _parse_sofascore_data(raw_items)
-                log.info(f"[sofascore] Scraped {len(items)} match ratings")
-                return items
-
-            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-                log.error(f"[sofascore] Error (attempt {attempt+1}/{max_retries+1}): {e}")
-                if attempt < max_retries:
-                    await asyncio.sleep(2 ** (attempt + 1))
-                else:
-                    return []
-            except Exception as e:
-                log.error(f"[sofascore] Unexpected error: {e}")
-                return []
+    async with http.new_session() as session:
+        raw_items = await run_actor(session, SOFASCORE_ACTOR, input_data, 100, "SofaScore",
+                                    retries=max_retries)
 
+    items = _parse_sofascore_data(raw_items)
+    log.info(f"[sofascore] Scraped {len(items)} match ratings")
     return items
 
 
@@ -8,6 +8,7 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from db import normalize_date
+from scrapers import health, http, parsing
 
 log = logging.getLogger("agentradar")
 
@@ -29,74 +30,86 @@ async def scrape_telegram_channel(channel, player_name, session):
     items = []
 
     try:
-        async with session.get(url, headers=TG_HEADERS,
-                               timeout=aiohttp.ClientTimeout(total=15)) as resp:
-            if resp.status != 200:
-                log.warning(f"[telegram-scraper] HTTP {resp.status} for {channel}")
-                return []
-
-            html = await resp.text()
-
-            # Extract messages from the public preview HTML
-            messages = re.findall(
-                r'<div class="tgme_widget_message_text[^"]*"[^>]*>(.*?)</div>',
-                html, re.DOTALL,
-            )
-
-            # Extract all <time datetime="..."> tags (one per message block)
-            datetimes = re.findall(
-                r'<time[^>]*datetime="([^"]+)"',
-                html,
-            )
-
-            name_lower = player_name.lower()
-            name_parts = name_lower.split()
-
-            for i, msg_html in enumerate(messages):
-                # Strip HTML tags to get plain text
-                text = re.sub(r'<[^>]+>', ' ', msg_html).strip()
-                text = re.sub(r'\s+', ' ', text)
-
-                # Check if player is mentioned
-                text_lower = text.lower()
-                if name_lower not in text_lower:
-                    # Try partial match (last name)
-                    if len(name_parts) > 1 and name_parts[-1] not in text_lower:
-                        continue
-                    elif len(name_parts) == 1:
-                        continue
-
-                # Get corresponding date if available
-                msg_date = None
-                if i < len(datetimes):
-                    msg_date = normalize_date(datetimes[i])
-                if not msg_date:
-                    msg_date = datetime.now().isoformat()
-
-                items.append({
-                    "platform": "telegram",
-                    "author": channel,
-                    "text": text[:500],
-                    "url": f"https://t.me/s/{channel}",
-                    "likes": 0,
-                    "retweets": 0,
-                    "created_at": msg_date,
-                })
+        async with health.track(f"telegram:{channel}") as probe:
+            async with session.get(url, headers=TG_HEADERS,
+                                   timeout=aiohttp.ClientTimeout(total=15)) as resp:
+                if resp.status != 200:
+                    log.warning(f"[telegram-scraper] HTTP {resp.status} for {channel}")
+                    probe.fail(f"HTTP {resp.status}", health.retry_after_seconds(resp))
+                    return []
 
+                html = await resp.text()
+
+        items = await parsing.in_process(_parse_channel_html, html, channel, player_name, size=len(html))
         log.info(f"[telegram-scraper] {channel}: {len(items)} mentions of {player_name}")
+    except health.SourceUnavailable:
+        pass
     except Exception as e:
         log.error(f"[telegram-scraper] Error scraping {channel}: {e}")
 
     return items
 
 
+def _parse_channel_html(html, channel, player_name):
+    """Extract messages mentioning player_name from a t.me/s/ preview page."""
+    items = []
+
+    # Extract messages from the public preview HTML
+    messages = re.findall(
+        r'<div class="tgme_widget_message_text[^"]*"[^>]*>(.*?)</div>',
+        html, re.DOTALL,
+    )
+
+    # Extract all <time datetime="..."> tags (one per message block)
+    datetimes = re.findall(
+        r'<time[^>]*datetime="([^"]+)"',
+        html,
+    )
+
+    name_lower = player_name.lower()
+    name_parts = name_lower.split()
+
+    for i, msg_html in enumerate(messages):
+        # Strip HTML tags to get plain text
+        text = re.sub(r'<[^>]+>', ' ', msg_html).strip()
+        text = re.sub(r'\s+', ' ', text)
+
+        # Check if player is mentioned
+        text_lower = text.lower()
+        if name_lower not in text_lower:
+            # Try partial match (last name)
+            if len(name_parts) > 1 and name_parts[-1] not in text_lower:
+                continue
+            elif len(name_parts) == 1:
+                continue
+
+        # Get corresponding date if available
+        msg_date = None
+        if i < len(datetimes):
+            msg_date = normalize_date(datetimes[i])
+        if not msg_date:
+            msg_date = datetime.now().isoformat()
+
+        items.append({
+            "platform": "telegram",
+            "author": channel,
+            "text": text[:500],
+            "url": f"https://t.me/s/{channel}",
+            "likes": 0,
+            "retweets": 0,
+            "created_at": msg_date,
+        })
+
+    return items
+
+
 async def scrape_all_telegram(player_name, channels):
     """Scrape all configured Telegram channels for player mentions."""
     if not channels:
         return []
 
     items = []
-    async with aiohttp.ClientSession() as session:
+    async with http.new_session() as session:
         for channel in channels:
             channel_items = await scrape_telegram_channel(channel, player_name, session)
             items.extend(channel_items)
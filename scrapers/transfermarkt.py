@@ -1,205 +1,323 @@
-"""Transfermarkt profile + performance stats scraper."""
+"""Transfermarkt profile + performance stats scraper.
+
+One shared session for all requests to the host, spaced at least
+TRANSFERMARKT_MIN_INTERVAL seconds apart. Parsed profiles and stats are cached
+per player for TRANSFERMARKT_CACHE_TTL_HOURS (db.transfermarkt_cache), and
+refresh_player() only writes the player profile, market value history and
+stats when the parsed data actually changed. Pages are parsed with
+precompiled lxml XPath expressions in the parsing thread pool.
+"""
 import re
 import aiohttp
+import asyncio
 import logging
-from bs4 import BeautifulSoup
+import time
+from datetime import datetime
+
+import lxml.html
+from lxml import etree
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import db
+from config import TRANSFERMARKT_CACHE_TTL_HOURS, TRANSFERMARKT_MIN_INTERVAL
+from scrapers import health, http, parsing
 
 log = logging.getLogger("agentradar")
 
+TM_SOURCE = "transfermarkt.com"
+TM_BASE = "https://www.transfermarkt.com"
+
 TM_HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
     "Accept-Language": "es-ES,es;q=0.9,en;q=0.8",
 }
 
-
-async def scrape_transfermarkt_profile(tm_id):
-    """Scrape basic profile info from Transfermarkt.
-
-    Returns dict with: photo_url, market_value, contract_until, nationality, position
-    """
+# ── Compiled parser ──
+
+_X_PHOTO = etree.XPath(
+    "//img[contains(@class, 'data-header__profile-image')]/@src"
+    " | //img[starts-with(@src, 'https://img.a.transfermarkt.technology/portrait/')]/@src"
+)
+_X_MARKET_VALUE = etree.XPath("//a[contains(@class, 'data-header__market-value-wrapper')]")
+_X_INFO_LABELS = etree.XPath("//span[contains(@class, 'info-table__content--regular')]")
+_X_NATIONALITY = etree.XPath(
+    "//span[contains(@class, 'info-table__content--bold')]/img[contains(@class, 'flaggenrahmen')]/@title"
+)
+_X_HEADER_LABELS = etree.XPath("//li[contains(@class, 'data-header__label')]")
+_X_STATS_TABLE = etree.XPath(
+    "(//div[contains(@class, 'responsive-table')])[1]//table[contains(concat(' ', @class, ' '), ' items ')]"
+)
+_X_ROWS = etree.XPath("./tbody/tr[contains(@class, 'odd') or contains(@class, 'even')]")
+
+_MV_RE = re.compile(r"([€$£]\s*[\d.,]+\s*(?:mill?\.|[MmKk]|bn))")
+_DATE_RE = re.compile(r"(\d{1,2}/\d{1,2}/\d{4}|\d{1,2}\.\d{1,2}\.\d{4}|[A-Za-z]+ \d{1,2}, \d{4})")
+
+
+def _text(el):
+    """Concatenated stripped text of an element (like BeautifulSoup get_text(strip=True))."""
+    return "".join(t.strip() for t in el.itertext())
+
+
+def _parse_profile_html(html):
+    """Header/info-table fields of the profile page."""
+    doc = lxml.html.document_fromstring(html)
+    data = {}
+
+    photos = _X_PHOTO(doc)
+    if photos:
+        data["photo_url"] = photos[0]
+
+    for wrapper in _X_MARKET_VALUE(doc):
+        m = _MV_RE.search(" ".join(wrapper.text_content().split()))
+        if m:
+            data["market_value"] = m.group(1).strip()
+            break
+
+    for label in _X_INFO_LABELS(doc):
+        label_text = label.text_content()
+        if "Contrato hasta" in label_text or "Contract expires" in label_text:
+            value = label.getnext()
+            m = _DATE_RE.search(value.text_content() if value is not None else "")
+            if m:
+                data["contract_until"] = m.group(1)
+            break
+
+    nationalities = _X_NATIONALITY(doc)
+    if nationalities:
+        data["nationality"] = nationalities[0]
+
+    for label in _X_HEADER_LABELS(doc):
+        if "Posici" in label.text_content() or "Position" in label.text_content():
+            content = label.find_class("data-header__content")
+            if not content and label.getnext() is not None:
+                content = [label.getnext()]
+            if content:
+                data["position"] = content[0].text_content().strip()
+            break
+    return data
+
+
+def _parse_int(text):
+    """Parse integer from cell text, handling ., ', -, etc."""
+    text = text.replace(".", "").replace("'", "").replace(",", "").replace("-", "0").strip()
+    return int(text) if text.isdigit() else 0
+
+
+def _parse_stats_html(html, tm_id):
+    """Parse the leistungsdatendetails table (totals row + per-competition rows)."""
+    doc = lxml.html.document_fromstring(html)
+    tables = _X_STATS_TABLE(doc)
+    if not tables:
+        log.warning(f"[transfermarkt] No stats table found for {tm_id}")
+        return None
+    table = tables[0]
+
+    stats = {
+        "appearances": 0, "goals": 0, "assists": 0,
+        "minutes": 0, "yellows": 0, "reds": 0,
+        "season": "", "competitions": [],
+    }
+
+    tfoot = table.find("tfoot")
+    if tfoot is not None:
+        # Footer: blank, "Total:", blank, blank, in_squad, appearances, goals_per_game, goals, assists, -, sub_in, sub_out, yellows, 2nd_yellow, reds, penalty_goals, minutes', total_minutes'
+        cell_texts = [_text(c) for c in tfoot.iter("td")]
+        total_idx = next((i for i, t in enumerate(cell_texts) if "total" in t.lower()), -1)
+
+        if total_idx >= 0 and len(cell_texts) > total_idx + 14:
+            offset = total_idx + 1
+            # Skip blank cells after Total
+            while offset < len(cell_texts) and cell_texts[offset] == "":
+                offset += 1
+            # Now: in_squad, appearances, goals_per_game, goals, assists, ?, sub_in, sub_out, yellows, 2nd_yellow, reds, penalty, minutes_detail, minutes_total
+            remaining = cell_texts[offset:]
+            if len(remaining) >= 10:
+                stats["appearances"] = _parse_int(remaining[1])
+                stats["goals"] = _parse_int(remaining[3])
+                stats["assists"] = _parse_int(remaining[4])
+                stats["yellows"] = _parse_int(remaining[8])
+                stats["reds"] = _parse_int(remaining[10]) if len(remaining) > 10 else 0
+                # Minutes is the last numeric cell
+                for txt in reversed(remaining):
+                    mins = _parse_int(txt)
+                    if mins > 10:
+                        stats["minutes"] = mins
+                        break
+
+    # Current season stats (e.g. "25/26")
+    current_year = datetime.now().year
+    season_str = f"{str(current_year - 1)[2:]}/{str(current_year)[2:]}"
+    current_season = {"appearances": 0, "goals": 0, "assists": 0,
+                      "minutes": 0, "yellows": 0, "reds": 0}
+
+    for row in _X_ROWS(table):
+        # Row: season, blank, competition, blank, in_squad, appearances, goals_per_game, goals
+        cells = [_text(c) for c in row.iter("td")]
+        if len(cells) < 8:
+            continue
+        season, comp_name = cells[0], cells[2]
+        app = int(cells[5]) if cells[5].isdigit() else 0
+        goals = int(cells[7]) if cells[7].isdigit() else 0
+        if comp_name and comp_name != "-":
+            stats["competitions"].append({
+                "name": f"{comp_name} ({season})" if season else comp_name,
+                "appearances": app,
+                "goals": goals,
+            })
+        if season == season_str:
+            current_season["appearances"] += app
+            current_season["goals"] += goals
+
+    stats["season"] = season_str
+    stats["current_season"] = current_season
+
+    # If totals row failed, sum from individual rows
+    if stats["appearances"] == 0 and stats["competitions"]:
+        stats["appearances"] = sum(c["appearances"] for c in stats["competitions"])
+        stats["goals"] = sum(c["goals"] for c in stats["competitions"])
+
+    return stats if stats["appearances"] > 0 else None
+
+
+# ── Shared session + host rate limit ──
+
+_session = None
+_rate_lock = asyncio.Lock()
+_last_request = 0.0
+
+
+def _get_session():
+    global _session
+    if _session is None or _session.closed:
+        _session = http.new_session(headers=TM_HEADERS)
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def _fetch(url, label):
+    """GET a Transfermarkt page, spaced TRANSFERMARKT_MIN_INTERVAL from the previous request."""
+    global _last_request
+    async with _rate_lock:
+        wait = _last_request + TRANSFERMARKT_MIN_INTERVAL - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        _last_request = time.monotonic()
+
+    async with health.track(TM_SOURCE) as probe:
+        async with _get_session().get(url, timeout=aiohttp.ClientTimeout(total=15),
+                                      allow_redirects=True) as resp:
+            if resp.status != 200:
+                log.warning(f"[transfermarkt] {label} HTTP {resp.status}")
+                probe.fail(f"HTTP {resp.status}", health.retry_after_seconds(resp))
+                return None
+            return await resp.text()
+
+
+async def _cached(tm_id, kind, force):
+    """Return (data, changed) from cache if fresh, else fetch, parse and store."""
+    if not force:
+        cached = await db.get_transfermarkt_cache(tm_id, kind, TRANSFERMARKT_CACHE_TTL_HOURS)
+        if cached is not None:
+            return cached, False
+
+    if kind == "profile":
+        html = await _fetch(f"{TM_BASE}/x/profil/spieler/{tm_id}", f"Profile {tm_id}")
+        data = await parsing.in_thread(_parse_profile_html, html) if html else None
+    else:
+        # plus/1 gives extended view with all columns
+        html = await _fetch(f"{TM_BASE}/x/leistungsdatendetails/spieler/{tm_id}/plus/1", f"Stats {tm_id}")
+        data = await parsing.in_thread(_parse_stats_html, html, tm_id) if html else None
+
+    if not data:
+        return None, False
+    changed = await db.save_transfermarkt_cache(tm_id, kind, data)
+    return data, changed
+
+
+async def scrape_transfermarkt_profile(tm_id, force=False):
+    """Basic profile info: photo_url, market_value, contract_until, nationality, position."""
     if not tm_id:
         return None
-
-    url = f"https://www.transfermarkt.com/x/profil/spieler/{tm_id}"
-
     try:
-        async with aiohttp.ClientSession(headers=TM_HEADERS) as session:
-            async with session.get(url, timeout=aiohttp.ClientTimeout(total=15),
-                                   allow_redirects=True) as resp:
-                if resp.status != 200:
-                    log.warning(f"[transfermarkt] HTTP {resp.status} for ID {tm_id}")
-                    return None
-
-                html = await resp.text()
-
-                data = {}
-
-                # Photo URL
-                photo_match = re.search(r'<img[^>]*class="data-header__profile-image"[^>]*src="([^"]+)"', html)
-                if not photo_match:
-                    photo_match = re.search(r'<img[^>]*src="(https://img\.a\.transfermarkt\.technology/portrait/[^"]+)"', html)
-                if photo_match:
-                    data["photo_url"] = photo_match.group(1)
-
-                # Market value
-                mv_match = re.search(r'<a[^>]*class="data-header__market-value-wrapper"[^>]*>.*?([€$£]\s*[\d.,]+\s*(?:mill?\.|[MmKk]|bn))', html, re.DOTALL)
-                if mv_match:
-                    data["market_value"] = mv_match.group(1).strip()
-                else:
-                    mv_match2 = re.search(r'Valor de mercado.*?([€$£]\s*[\d.,]+\s*(?:mill?\.|[MmKk]))', html, re.DOTALL)
-                    if mv_match2:
-                        data["market_value"] = mv_match2.group(1).strip()
-
-                # Contract until
-                contract_match = re.search(r'(?:Contrato hasta|Contract expires).*?(\d{1,2}/\d{1,2}/\d{4}|\d{1,2}\.\d{1,2}\.\d{4}|[A-Za-z]+ \d{1,2}, \d{4})', html)
-                if contract_match:
-                    data["contract_until"] = contract_match.group(1)
-
-                # Nationality
-                nat_match = re.search(r'<span class="info-table__content info-table__content--bold">\s*<img[^>]*title="([^"]+)"[^>]*class="flaggenrahmen"', html)
-                if nat_match:
-                    data["nationality"] = nat_match.group(1)
-
-                # Position
-                pos_match = re.search(r'<li class="data-header__label">.*?(?:Posici|Position).*?</li>\s*<li class="data-header__content">\s*([^<]+)', html, re.DOTALL)
-                if not pos_match:
-                    pos_match = re.search(r'(?:Posici.n|Position).*?<span[^>]*>([^<]+)</span>', html, re.DOTALL)
-                if pos_match:
-                    data["position"] = pos_match.group(1).strip()
-
-                log.info(f"[transfermarkt] Got profile for {tm_id}: {list(data.keys())}")
-                return data if data else None
-
+        data, _ = await _cached(tm_id, "profile", force)
+        return data
+    except health.SourceUnavailable:
+        return None
     except Exception as e:
         log.error(f"[transfermarkt] Error scraping {tm_id}: {e}")
         return None
 
 
-async def scrape_transfermarkt_stats(tm_id):
-    """Scrape current season performance stats from Transfermarkt.
-
-    Returns dict with: appearances, goals, assists, minutes, yellows, reds, season
-    """
+async def scrape_transfermarkt_stats(tm_id, force=False):
+    """Performance stats: appearances, goals, assists, minutes, yellows, reds, season."""
     if not tm_id:
         return None
-
-    # plus/1 gives extended view with all columns
-    url = f"https://www.transfermarkt.com/x/leistungsdatendetails/spieler/{tm_id}/plus/1"
-
     try:
-        async with aiohttp.ClientSession(headers=TM_HEADERS) as session:
-            async with session.get(url, timeout=aiohttp.ClientTimeout(total=15),
-                                   allow_redirects=True) as resp:
-                if resp.status != 200:
-                    log.warning(f"[transfermarkt] Stats HTTP {resp.status} for {tm_id}")
-                    return None
-
-                html = await resp.text()
-                soup = BeautifulSoup(html, "lxml")
-
-                # Find the main stats table
-                tables = soup.find_all("div", class_="responsive-table")
-                if not tables:
-                    log.warning(f"[transfermarkt] No stats tables found for {tm_id}")
-                    return None
-
-                # Parse the footer/totals row which has aggregated stats
-                stats = {
-                    "appearances": 0, "goals": 0, "assists": 0,
-                    "minutes": 0, "yellows": 0, "reds": 0,
-                    "season": "", "competitions": [],
-                }
-
-                # Try to find the totals row (tfoot) in the first table
-                table = tables[0].find("table", class_="items")
-                if not table:
-                    log.warning(f"[transfermarkt] No items table for {tm_id}")
-                    return None
-
-                tfoot = table.find("tfoot")
-                if tfoot:
-                    cells = tfoot.find_all("td")
-                    # Footer: blank, "Total:", blank, blank, in_squad, appearances, goals_per_game, goals, assists, -, sub_in, sub_out, yellows, 2nd_yellow, reds, penalty_goals, minutes', total_minutes'
-                    cell_texts = [c.get_text(strip=True) for c in cells]
-
-                    def parse_int(text):
-                        """Parse integer from cell text, handling ., ', -, etc."""
-                        text = text.replace(".", "").replace("'", "").replace(",", "").replace("-", "0").strip()
-                        return int(text) if text.isdigit() else 0
-
-                    # Find "Total" label position and work from there
-                    total_idx = -1
-                    for i, t in enumerate(cell_texts):
-                        if "total" in t.lower():
-                            total_idx = i
-                            break
-
-                    if total_idx >= 0 and len(cell_texts) > total_idx + 14:
-                        offset = total_idx + 1  # skip blanks after "Total"
-                        # Skip blank cells after Total
-                        while offset < len(cell_texts) and cell_texts[offset] == "":
-                            offset += 1
-                        # Now: in_squad, appearances, goals_per_game, goals, assists, ?, sub_in, sub_out, yellows, 2nd_yellow, reds, penalty, minutes_detail, minutes_total
-                        remaining = cell_texts[offset:]
-                        if len(remaining) >= 10:
-                            stats["appearances"] = parse_int(remaining[1])  # appearances
-                            stats["goals"] = parse_int(remaining[3])        # goals
-                            stats["assists"] = parse_int(remaining[4])      # assists
-                            stats["yellows"] = parse_int(remaining[8])      # yellows
-                            stats["reds"] = parse_int(remaining[10]) if len(remaining) > 10 else 0  # reds
-                            # Minutes is the last numeric cell
-                            for txt in reversed(remaining):
-                                mins = parse_int(txt)
-                                if mins > 10:
-                                    stats["minutes"] = mins
-                                    break
-
-                # Also parse individual rows for competition breakdown
-                tbody = table.find("tbody")
-                if tbody:
-                    rows = tbody.find_all("tr", class_=["odd", "even"])
-                    for row in rows:
-                        cells = row.find_all("td")
-                        cell_texts = [c.get_text(strip=True) for c in cells]
-                        if len(cell_texts) >= 8:
-                            # Row: season, blank, competition, blank, in_squad, appearances, goals_per_game, goals
-                            comp_name = cell_texts[2]
-                            season = cell_texts[0]
-                            if comp_name and comp_name not in ["", "-"]:
-                                app = int(cell_texts[5]) if cell_texts[5].isdigit() else 0
-                                goals = int(cell_texts[7]) if cell_texts[7].isdigit() else 0
-                                stats["competitions"].append({
-                                    "name": f"{comp_name} ({season})" if season else comp_name,
-                                    "appearances": app,
-                                    "goals": goals,
-                                })
-
-                # Calculate current season stats (25/26 or latest)
-                from datetime import datetime
-                current_year = datetime.now().year
-                season_str = f"{str(current_year - 1)[2:]}/{str(current_year)[2:]}"  # e.g. "25/26"
-
-                current_season = {"appearances": 0, "goals": 0, "assists": 0,
-                                  "minutes": 0, "yellows": 0, "reds": 0}
-                # Sum competitions matching current season from row data
-                for row in (tbody.find_all("tr", class_=["odd", "even"]) if tbody else []):
-                    cells_t = [c.get_text(strip=True) for c in row.find_all("td")]
-                    if len(cells_t) >= 8 and cells_t[0] == season_str:
-                        current_season["appearances"] += int(cells_t[5]) if cells_t[5].isdigit() else 0
-                        current_season["goals"] += int(cells_t[7]) if cells_t[7].isdigit() else 0
-
-                stats["season"] = season_str
-                stats["current_season"] = current_season
-
-                # If totals row failed, sum from individual rows
-                if stats["appearances"] == 0 and stats["competitions"]:
-                    stats["appearances"] = sum(c["appearances"] for c in stats["competitions"])
-                    stats["goals"] = sum(c["goals"] for c in stats["competitions"])
-
-                log.info(f"[transfermarkt] Stats for {tm_id}: {stats['appearances']} apps, {stats['goals']} goals, {stats['assists']} assists, {stats['minutes']} min")
-                return stats if stats["appearances"] > 0 else None
-
+        data, _ = await _cached(tm_id, "stats", force)
+        return data
+    except health.SourceUnavailable:
+        return None
     except Exception as e:
         log.error(f"[transfermarkt] Stats error for {tm_id}: {e}")
         return None
+
+
+async def refresh_player(player_id, tm_id, force=False):
+    """Refresh profile + stats for a player and persist only what changed.
+
+    Returns {"profile": dict|None, "stats": dict|None, "changed": [kinds]}.
+    """
+    result = {"profile": None, "stats": None, "changed": []}
+    if not tm_id:
+        return result
+
+    for kind in ("profile", "stats"):
+        try:
+            data, changed = await _cached(tm_id, kind, force)
+        except health.SourceUnavailable:
+            break
+        except Exception as e:
+            log.error(f"[transfermarkt] {kind} error for {tm_id}: {e}")
+            continue
+        result[kind] = data
+        if not changed:
+            continue
+        result["changed"].append(kind)
+        if kind == "profile":
+            await db.update_player_profile(
+                player_id,
+                photo_url=data.get("photo_url"),
+                market_value=data.get("market_value"),
+                contract_until=data.get("contract_until"),
+                nationality=data.get("nationality"),
+                position=data.get("position"),
+            )
+            if data.get("market_value"):
+                await db.save_market_value(player_id, data["market_value"])
+        else:
+            await db.save_player_stats(player_id, data)
+
+    if result["changed"]:
+        log.info(f"[transfermarkt] {tm_id}: {', '.join(result['changed'])} changed")
+    return result
+
+
+async def refresh_roster(players, force=False):
+    """Bulk refresh for every player with a transfermarkt_id (requests serialized by the host rate limit)."""
+    targets = [p for p in players if p.get("transfermarkt_id")]
+    results = await asyncio.gather(
+        *[refresh_player(p["id"], p["transfermarkt_id"], force) for p in targets],
+        return_exceptions=True,
+    )
+    changed = sum(1 for r in results if isinstance(r, dict) and r["changed"])
+    log.info(f"[transfermarkt] Roster refresh: {len(targets)} players, {changed} with changes")
+    return changed
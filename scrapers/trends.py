@@ -1,132 +1,291 @@
-"""Google Trends search interest scraper (direct API, no dependencies)."""
+"""Google Trends search interest scraper (direct API, no dependencies).
+
+All requests go through one shared session that picks up the Trends cookies
+once (explore + multiline per query, no cookie round trip per player).
+
+The roster is fetched in comparisons of TRENDS_BATCH_SIZE players plus a
+mid-volume pivot (the roster's median player by its last relative_interest),
+with players of similar magnitude batched together. Trends scales every
+comparison to its largest series, so each player's timeline is its series
+rescaled to its own peak; series peaking under TRENDS_MIN_PEAK in the
+comparison are too coarse for that and get a single-keyword query instead.
+One more comparison, pivot against TRENDS_ANCHOR_KEYWORD, links the batches:
+relative_interest is a player's mean interest as a % of the anchor's,
+comparable across batches. Results are cached per keyword for the day
+(db.trends_cache).
+"""
 import aiohttp
+import asyncio
 import json
 import logging
 
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import db
+from config import TRENDS_ANCHOR_KEYWORD, TRENDS_BATCH_SIZE, TRENDS_MIN_PEAK
+from scrapers import health, http
+
 log = logging.getLogger("agentradar")
 
+TRENDS_SOURCE = "trends.google.com"
+
 TRENDS_BASE = "https://trends.google.com/trends"
 TRENDS_HEADERS = {
     "accept-language": "es-ES,es;q=0.9,en;q=0.8",
     "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
 }
 
+# ── Shared session ──
 
-async def scrape_google_trends(player_name, geo="ES", time_range="today 1-m"):
-    """Get Google Trends interest over time for a player name.
+_session = None
+_has_cookies = False
+_lock = asyncio.Lock()  # one comparison at a time; Trends rate-limits bursts hard
 
-    Uses Google's internal API (2-step: get token, then get data).
-    Returns dict with: average_interest, peak_interest, trend_direction, timeline
-    """
-    if not player_name:
-        return None
 
+def _get_session():
+    global _session, _has_cookies
+    if _session is None or _session.closed:
+        _session = http.new_session(headers=TRENDS_HEADERS)
+        _has_cookies = False
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def _get_json(session, path, params, label):
+    async with health.track(TRENDS_SOURCE) as probe:
+        async with session.get(f"{TRENDS_BASE}/api/{path}", params=params,
+                               timeout=aiohttp.ClientTimeout(total=10)) as resp:
+            if resp.status != 200:
+                log.warning(f"[trends] {label} returned {resp.status}")
+                probe.fail(f"{label} HTTP {resp.status}", health.retry_after_seconds(resp))
+                return None
+            text = await resp.text()
+    # Response starts with ")]}'" prefix (4-6 chars) - find first '{'
+    return json.loads(text[text.index("{"):])
+
+
+async def _fetch_comparison(keywords, geo, time_range):
+    """Timelines for up to 5 keywords on one shared scale: {keyword: [(timestamp, value)]}."""
+    global _has_cookies
+    session = _get_session()
+
+    if not _has_cookies:
+        # Step 0: Get cookies by visiting main page
+        async with session.get(TRENDS_BASE, timeout=aiohttp.ClientTimeout(total=10), allow_redirects=True):
+            pass
+        _has_cookies = True
+
+    # Step 1: Get widget tokens from /api/explore
     explore_payload = {
-        "comparisonItem": [
-            {"keyword": player_name, "geo": geo, "time": time_range}
-        ],
+        "comparisonItem": [{"keyword": k, "geo": geo, "time": time_range} for k in keywords],
         "category": 0,
         "property": "",
     }
+    data = await _get_json(session, "explore", {"hl": "es", "tz": "-60", "req": json.dumps(explore_payload)},
+                           "Explore")
+    if data is None:
+        _has_cookies = False  # usually a stale/missing NID cookie; refresh on the next call
+        return None
+
+    ts_widget = next((w for w in data.get("widgets", []) if w.get("id") == "TIMESERIES"), None)
+    if not ts_widget:
+        log.warning(f"[trends] No TIMESERIES widget for {keywords}")
+        return None
+
+    # Step 2: Get actual time series data (value[i] belongs to keywords[i])
+    params = {"hl": "es", "tz": "-60", "req": json.dumps(ts_widget["request"]), "token": ts_widget["token"]}
+    data = await _get_json(session, "widgetdata/multiline", params, "Multiline")
+    if data is None:
+        return None
+
+    points = data.get("default", {}).get("timelineData", [])
+    return {
+        keyword: [(int(p["time"]), p["value"][i]) for p in points if len(p.get("value", [])) > i]
+        for i, keyword in enumerate(keywords)
+    }
+
+
+def _summarize(series, relative_interest=None):
+    """Per-player result from a series on the player's own 0-100 scale."""
+    if not series:
+        return {"average_interest": 0, "peak_interest": 0, "trend_direction": "stable",
+                "data_points": 0, "timeline": [], "relative_interest": relative_interest}
+
+    values = [v for _, v in series]
+    avg = round(sum(values) / len(values))
+    peak = max(values)
+
+    # Calculate trend direction: compare first half vs second half
+    mid = len(values) // 2
+    first_half_avg = sum(values[:mid]) / max(mid, 1)
+    second_half_avg = sum(values[mid:]) / max(len(values) - mid, 1)
+    if second_half_avg > first_half_avg * 1.2:
+        direction = "up"
+    elif second_half_avg < first_half_avg * 0.8:
+        direction = "down"
+    else:
+        direction = "stable"
+
+    return {
+        "average_interest": avg,
+        "peak_interest": peak,
+        "trend_direction": direction,
+        "data_points": len(values),
+        "timeline": [{"timestamp": ts, "value": v} for ts, v in series],
+        "relative_interest": relative_interest,
+    }
+
+
+def _peak(series):
+    return max((v for _, v in series or []), default=0)
 
+
+def _mean(series):
+    return sum(v for _, v in series) / len(series) if series else 0
+
+
+async def _fetch(keywords, geo, time_range):
+    async with _lock:
+        return await _fetch_comparison(keywords, geo, time_range)
+
+
+async def _player_result(name, series, relative, geo, time_range, stats):
+    """Result for name from its series in a comparison, rescaled to its own peak;
+    a single-keyword query when that series is too coarse. None if that fails."""
+    peak = _peak(series)
+    if peak >= TRENDS_MIN_PEAK:
+        rescaled = [(ts, round(v * 100 / peak)) for ts, v in series]
+    else:
+        stats["single"] += 1
+        try:
+            single = await _fetch([name], geo, time_range)
+        except health.SourceUnavailable:
+            return None
+        except (ValueError, KeyError, json.JSONDecodeError) as e:
+            log.warning(f"[trends] Parse error for '{name}': {e}")
+            return None
+        if single is None:
+            return None
+        rescaled = single.get(name)
+    r = _summarize(rescaled, relative)
+    log.info(f"[trends] '{name}': avg={r['average_interest']}, trend={r['trend_direction']}, "
+             f"vs {TRENDS_ANCHOR_KEYWORD}={r['relative_interest']} ({r['data_points']} points)")
+    return r
+
+
+async def _compare_roster(names, geo, time_range, magnitude=None):
+    """Trends results for names in pivot-linked batch comparisons (see module docstring).
+
+    magnitude: {name: last known relative_interest}, used to batch similar
+    players together and pick the pivot. Returns ({name: result}, stats);
+    players whose comparison failed are left out.
+    """
+    magnitude = magnitude or {}
+    stats = {"comparisons": 1, "single": 0}
+    order = sorted(names, key=lambda n: (magnitude.get(n) is None, -(magnitude.get(n) or 0)))
+    known = [n for n in order if magnitude.get(n) is not None]
+    pivot = (known or order)[len(known or order) // 2]
+
+    link = await _fetch([pivot, TRENDS_ANCHOR_KEYWORD], geo, time_range)
+    if link is None:
+        return {}, stats
+    anchor_mean = _mean(link.get(TRENDS_ANCHOR_KEYWORD))
+    pivot_relative = round(_mean(link.get(pivot)) * 100 / anchor_mean, 1) if anchor_mean else None
+    pivot_series = link.get(pivot)
+
+    results = {}
+    others = [n for n in order if n != pivot]
+    for i in range(0, len(others), TRENDS_BATCH_SIZE):
+        batch = others[i:i + TRENDS_BATCH_SIZE]
+        stats["comparisons"] += 1
+        try:
+            series = await _fetch(batch + [pivot], geo, time_range)
+        except health.SourceUnavailable:
+            log.warning("[trends] Circuit open, stopping roster comparisons")
+            break
+        except (ValueError, KeyError, json.JSONDecodeError) as e:
+            log.warning(f"[trends] Parse error for {batch}: {e}")
+            continue
+        if series is None:
+            continue
+        pivot_mean = _mean(series.get(pivot))
+        if _peak(series.get(pivot)) > _peak(pivot_series):
+            pivot_series = series.get(pivot)  # the pivot's timeline from its least quantized comparison
+        for name in batch:
+            relative = (round(_mean(series.get(name)) / pivot_mean * pivot_relative, 1)
+                        if pivot_mean and pivot_relative is not None else None)
+            r = await _player_result(name, series.get(name), relative, geo, time_range, stats)
+            if r is not None:
+                results[name] = r
+
+    r = await _player_result(pivot, pivot_series, pivot_relative, geo, time_range, stats)
+    if r is not None:
+        results[pivot] = r
+    return results, stats
+
+
+async def prefetch_roster_trends(players, geo="ES", time_range="today 1-m"):
+    """Fill today's Trends cache for the whole roster in batched comparisons.
+
+    Returns the number of players fetched (cached ones are skipped).
+    """
+    names = list(dict.fromkeys(p["name"] for p in players if p.get("name")))
+    cached = await db.get_trends_cache(names, geo, time_range)
+    missing = [n for n in names if n not in cached]
+    if not missing:
+        return 0
+
+    last = await db.get_latest_relative_interest([p["id"] for p in players if p.get("id")])
+    magnitude = {p["name"]: last.get(p.get("id")) for p in players if p.get("name")}
+    fetched, stats = {}, {"comparisons": 0, "single": 0}
     try:
-        async with aiohttp.ClientSession(headers=TRENDS_HEADERS) as session:
-            # Step 0: Get cookies by visiting main page
-            async with session.get(
-                TRENDS_BASE, timeout=aiohttp.ClientTimeout(total=10),
-                allow_redirects=True,
-            ) as resp:
-                pass  # Just collect cookies
-
-            # Step 1: Get widget tokens from /api/explore
-            params = {
-                "hl": "es",
-                "tz": "-60",
-                "req": json.dumps(explore_payload),
-            }
-            async with session.get(
-                f"{TRENDS_BASE}/api/explore",
-                params=params,
-                timeout=aiohttp.ClientTimeout(total=10),
-            ) as resp:
-                if resp.status != 200:
-                    log.warning(f"[trends] Explore returned {resp.status} for '{player_name}'")
-                    return None
-                text = await resp.text()
-
-            # Response starts with ")]}'" prefix (4-6 chars) - find first '{'
-            json_start = text.index("{")
-            data = json.loads(text[json_start:])
-
-            # Find the TIMESERIES widget
-            ts_widget = None
-            for widget in data.get("widgets", []):
-                if widget.get("id") == "TIMESERIES":
-                    ts_widget = widget
-                    break
-
-            if not ts_widget:
-                log.warning(f"[trends] No TIMESERIES widget for '{player_name}'")
-                return None
+        fetched, stats = await _compare_roster(missing, geo, time_range, magnitude)
+    except health.SourceUnavailable:
+        log.warning("[trends] Circuit open, stopping roster prefetch")
+    except (ValueError, KeyError, json.JSONDecodeError) as e:
+        log.warning(f"[trends] Parse error in roster prefetch: {e}")
+    except Exception as e:
+        log.error(f"[trends] Roster prefetch error: {e}")
+
+    if fetched:
+        await db.save_trends_cache(fetched, geo, time_range)
+    log.info(f"[trends] Roster prefetch: {len(fetched)}/{len(missing)} players "
+             f"({stats['comparisons']} comparisons, {stats['single']} single-keyword fallbacks), {len(cached)} cached")
+    return len(fetched)
+
+
+async def scrape_google_trends(player_name, geo="ES", time_range="today 1-m"):
+    """Get Google Trends interest over time for a player name.
+
+    Served from today's cache when the roster prefetch already ran; otherwise
+    compares the player with the anchor (plus a single-keyword query when
+    that series is too coarse) and caches the result.
+    Returns dict with: average_interest, peak_interest, trend_direction,
+    data_points, timeline, relative_interest
+    """
+    if not player_name:
+        return None
+
+    try:
+        cached = await db.get_trends_cache([player_name], geo, time_range)
+        if player_name in cached:
+            return cached[player_name]
 
-            token = ts_widget["token"]
-            request_obj = ts_widget["request"]
-
-            # Step 2: Get actual time series data
-            params = {
-                "hl": "es",
-                "tz": "-60",
-                "req": json.dumps(request_obj),
-                "token": token,
-            }
-            async with session.get(
-                f"{TRENDS_BASE}/api/widgetdata/multiline",
-                params=params,
-                timeout=aiohttp.ClientTimeout(total=10),
-            ) as resp:
-                if resp.status != 200:
-                    log.warning(f"[trends] Multiline returned {resp.status}")
-                    return None
-                text = await resp.text()
-
-            json_start = text.index("{")
-            data = json.loads(text[json_start:])
-
-            # Parse timeline data
-            points = data.get("default", {}).get("timelineData", [])
-            if not points:
-                log.info(f"[trends] No data points for '{player_name}'")
-                return {"average_interest": 0, "peak_interest": 0, "trend_direction": "stable", "timeline": []}
-
-            values = [p["value"][0] for p in points]
-            avg = round(sum(values) / len(values))
-            peak = max(values)
-
-            # Calculate trend direction: compare first half vs second half
-            mid = len(values) // 2
-            first_half_avg = sum(values[:mid]) / max(mid, 1)
-            second_half_avg = sum(values[mid:]) / max(len(values) - mid, 1)
-            if second_half_avg > first_half_avg * 1.2:
-                direction = "up"
-            elif second_half_avg < first_half_avg * 0.8:
-                direction = "down"
-            else:
-                direction = "stable"
-
-            timeline = [
-                {"timestamp": int(p["time"]), "value": p["value"][0]}
-                for p in points
-            ]
-
-            log.info(f"[trends] '{player_name}': avg={avg}, peak={peak}, trend={direction} ({len(points)} points)")
-            return {
-                "average_interest": avg,
-                "peak_interest": peak,
-                "trend_direction": direction,
-                "data_points": len(points),
-                "timeline": timeline,
-            }
+        results, _ = await _compare_roster([player_name], geo, time_range)
+        if player_name not in results:
+            return None
+        await db.save_trends_cache(results, geo, time_range)
+        return results[player_name]
 
+    except health.SourceUnavailable:
+        return None
     except (ValueError, KeyError, json.JSONDecodeError) as e:
         log.warning(f"[trends] Parse error for '{player_name}': {e}")
         return None
@@ -9,17 +9,37 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from db import normalize_date
-from config import MAX_YOUTUBE_RESULTS
+from config import MAX_YOUTUBE_RESULTS, YOUTUBE_MAX_CONCURRENT, YOUTUBE_MAX_PAGES
+from scrapers import health, http, parsing
 
 log = logging.getLogger("agentradar")
 
+YT_SOURCE = "youtube.com"
+YT_SEARCH_URL = "https://www.youtube.com/results"
+YT_CONTINUATION_URL = "https://www.youtube.com/youtubei/v1/search"
+YT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept-Language": "es-ES,es;q=0.9,en;q=0.8",
+}
 
-async def scrape_youtube(player_name, session=None):
-    """Search YouTube by scraping search results page."""
-    items = []
+# Shared across all scans so parallel player scans don't hammer YouTube
+_yt_limiter = asyncio.Semaphore(YOUTUBE_MAX_CONCURRENT)
+
+_JSON = json.JSONDecoder()
+_INITIAL_DATA_MARKERS = ("var ytInitialData = ", "ytInitialData = ", 'window["ytInitialData"] = ')
+_API_KEY_RE = re.compile(r'"INNERTUBE_API_KEY"\s*:\s*"([^"]+)"')
+_CLIENT_VERSION_RE = re.compile(r'"INNERTUBE_CLIENT_VERSION"\s*:\s*"([^"]+)"')
+
+
+async def scrape_youtube(player_name, session=None, max_pages=1):
+    """Search YouTube by scraping search results page.
+
+    All queries run concurrently under the shared limiter. max_pages > 1 follows
+    continuation tokens for deeper (first) scans.
+    """
     close_session = False
     if not session:
-        session = aiohttp.ClientSession()
+        session = http.new_session()
         close_session = True
 
     queries = [
@@ -30,109 +50,213 @@ async def scrape_youtube(player_name, session=None):
         f'"{player_name}" calcio',
         f'"{player_name}" كرة القدم',
     ]
+    max_pages = max(1, min(max_pages, YOUTUBE_MAX_PAGES))
 
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Accept-Language": "es-ES,es;q=0.9,en;q=0.8",
-    }
-
-    for query in queries:
-        try:
-            url = "https://www.youtube.com/results"
-            params = {"search_query": query}
-            async with session.get(
-                url, params=params, headers=headers,
-                timeout=aiohttp.ClientTimeout(total=15),
-            ) as resp:
-                if resp.status == 200:
-                    html = await resp.text()
-                    videos = _parse_youtube_html(html)
-                    items.extend(videos[:MAX_YOUTUBE_RESULTS])
-                    log.info(f"[youtube] '{query}': {len(videos)} videos found")
-                else:
-                    log.warning(f"[youtube] YouTube returned {resp.status}")
-        except Exception as e:
-            log.error(f"[youtube] Search error for '{query}': {e}")
-        await asyncio.sleep(1)
+    try:
+        results = await asyncio.gather(
+            *[_search_query(session, q, max_pages) for q in queries],
+            return_exceptions=True,
+        )
+    finally:
+        if close_session:
+            await session.close()
 
     # Deduplicate by URL
     seen = set()
     unique = []
-    for item in items:
-        if item["url"] not in seen:
-            seen.add(item["url"])
-            unique.append(item)
+    for result in results:
+        if isinstance(result, Exception):
+            log.error(f"[youtube] Search error: {result}")
+            continue
+        for item in result:
+            if item["url"] not in seen:
+                seen.add(item["url"])
+                unique.append(item)
 
     log.info(f"[youtube] {len(unique)} videos totales")
-    if close_session:
-        await session.close()
     return unique
 
 
-def _parse_youtube_html(html):
-    """Extract video data from YouTube search results page."""
+async def _search_query(session, query, max_pages):
+    """Run one search query, following continuation tokens up to max_pages."""
+    limit = MAX_YOUTUBE_RESULTS * max_pages
     videos = []
     try:
-        # YouTube embeds initial data as JSON in the page
-        match = re.search(r'var ytInitialData = ({.*?});', html)
-        if not match:
-            match = re.search(r'ytInitialData\s*=\s*({.*?});', html)
-        if not match:
-            log.warning("[youtube] Could not find ytInitialData in page")
-            return []
+        async with _yt_limiter, health.track(YT_SOURCE) as probe:
+            async with session.get(
+                YT_SEARCH_URL, params={"search_query": query}, headers=YT_HEADERS,
+                timeout=aiohttp.ClientTimeout(total=15),
+            ) as resp:
+                if resp.status != 200:
+                    log.warning(f"[youtube] YouTube returned {resp.status}")
+                    probe.fail(f"HTTP {resp.status}", health.retry_after_seconds(resp))
+                    return []
+                html = await resp.text()
 
-        data = json.loads(match.group(1))
+        # Videos, token and innertube config in one worker call: the page is never scanned on the loop
+        page_videos, token, api_key, client_version = await parsing.in_process(
+            _parse_youtube_html, html, size=len(html))
+        videos.extend(page_videos)
+
+        page = 1
+        while token and page < max_pages and len(videos) < limit and api_key:
+            async with _yt_limiter, health.track(YT_SOURCE) as probe:
+                body = await _fetch_continuation(session, token, api_key, client_version)
+                if body is None:
+                    probe.fail("Continuation request failed")
+            if not body:
+                break
+            page_videos, token = await parsing.in_process(_parse_continuation, body, size=len(body))
+            if not page_videos:
+                break
+            videos.extend(page_videos)
+            page += 1
+
+        log.info(f"[youtube] '{query}': {len(videos)} videos found ({page} pages)")
+    except health.SourceUnavailable:
+        pass
+    except Exception as e:
+        log.error(f"[youtube] Search error for '{query}': {e}")
+    return videos[:limit]
+
+
+async def _fetch_continuation(session, token, api_key, client_version):
+    """Fetch the next page of search results via the innertube API (raw JSON body)."""
+    payload = {
+        "context": {"client": {"clientName": "WEB", "clientVersion": client_version or "2.20240101.00.00"}},
+        "continuation": token,
+    }
+    async with session.post(
+        YT_CONTINUATION_URL, params={"key": api_key}, json=payload, headers=YT_HEADERS,
+        timeout=aiohttp.ClientTimeout(total=15),
+    ) as resp:
+        if resp.status != 200:
+            log.warning(f"[youtube] Continuation returned {resp.status}")
+            return None
+        return await resp.text()
 
-        # Navigate the nested structure to find video renderers
-        contents = (
-            data.get("contents", {})
-            .get("twoColumnSearchResultsRenderer", {})
-            .get("primaryContents", {})
-            .get("sectionListRenderer", {})
-            .get("contents", [])
-        )
 
-        for section in contents:
-            item_section = section.get("itemSectionRenderer", {}).get("contents", [])
-            for item in item_section:
+def _extract_innertube_config(html):
+    key = _API_KEY_RE.search(html)
+    version = _CLIENT_VERSION_RE.search(html)
+    return (key.group(1) if key else None), (version.group(1) if version else None)
+
+
+def _extract_initial_data(html):
+    """Locate the ytInitialData object by its marker and decode only that object.
+
+    raw_decode stops at the matching closing brace, so the rest of the 1 MB page
+    is never scanned by a regex or copied into a substring.
+    """
+    for marker in _INITIAL_DATA_MARKERS:
+        idx = html.find(marker)
+        if idx == -1:
+            continue
+        start = html.find("{", idx + len(marker))
+        if start == -1:
+            continue
+        try:
+            data, _ = _JSON.raw_decode(html, start)
+            return data
+        except json.JSONDecodeError as e:
+            log.error(f"[youtube] JSON parse error: {e}")
+            return None
+    return None
+
+
+def _primary_sections(data):
+    """Entries of the primary results list: sectionListRenderer contents on the
+    search page, appended continuationItems in an innertube continuation."""
+    primary = (((data.get("contents") or {}).get("twoColumnSearchResultsRenderer") or {})
+               .get("primaryContents") or {}).get("sectionListRenderer")
+    if primary:
+        return primary.get("contents") or []
+    for command in data.get("onResponseReceivedCommands") or []:
+        action = command.get("appendContinuationItemsAction") or command.get("reloadContinuationItemsCommand")
+        if action:
+            return action.get("continuationItems") or []
+    return []
+
+
+def _collect_videos(data):
+    """Videos of the primary itemSectionRenderer results and the continuation
+    token of the list's continuationItemRenderer.
+
+    Only direct videoRenderer items count: shelves, reels and "people also
+    watched" blocks nest their own videos (and continuations) and are skipped.
+    """
+    videos = []
+    token = None
+    for entry in _primary_sections(data):
+        section = entry.get("itemSectionRenderer")
+        if section:
+            for item in section.get("contents") or []:
                 renderer = item.get("videoRenderer")
-                if not renderer:
-                    continue
-
-                vid_id = renderer.get("videoId", "")
-                title = ""
-                title_runs = renderer.get("title", {}).get("runs", [])
-                if title_runs:
-                    title = title_runs[0].get("text", "")
-
-                author = (
-                    renderer.get("ownerText", {}).get("runs", [{}])[0].get("text", "")
-                    if renderer.get("ownerText", {}).get("runs")
-                    else ""
-                )
-
-                view_text = renderer.get("viewCountText", {}).get("simpleText", "0")
-                views = _parse_view_count(view_text)
-
-                published = renderer.get("publishedTimeText", {}).get("simpleText", "")
-
-                videos.append({
-                    "platform": "youtube",
-                    "author": author,
-                    "text": title,
-                    "url": f"https://youtube.com/watch?v={vid_id}",
-                    "likes": views,
-                    "retweets": 0,
-                    "created_at": normalize_date(published),
-                    "views": views,
-                })
-
-    except json.JSONDecodeError as e:
-        log.error(f"[youtube] JSON parse error: {e}")
+                video = _video_from_renderer(renderer) if renderer else None
+                if video:
+                    videos.append(video)
+            continue
+        continuation = entry.get("continuationItemRenderer")
+        if continuation and token is None:
+            command = (continuation.get("continuationEndpoint") or {}).get("continuationCommand") or {}
+            token = command.get("token")
+    return videos, token
+
+
+def _parse_continuation(body):
+    """Extract video data and next continuation token from an innertube response."""
+    try:
+        return _collect_videos(json.loads(body))
+    except Exception as e:
+        log.error(f"[youtube] Continuation parse error: {e}")
+        return [], None
+
+
+def _parse_youtube_html(html):
+    """Extract video data, continuation token and innertube config (api key,
+    client version) from a YouTube search results page."""
+    try:
+        data = _extract_initial_data(html)
+        if data is None:
+            log.warning("[youtube] Could not find ytInitialData in page")
+            return [], None, None, None
+        videos, token = _collect_videos(data)
+        # The config is only needed to follow the token
+        api_key, client_version = _extract_innertube_config(html) if token else (None, None)
+        return videos, token, api_key, client_version
     except Exception as e:
         log.error(f"[youtube] Parse error: {e}")
+        return [], None, None, None
+
 
-    return videos
+def _video_from_renderer(renderer):
+    vid_id = renderer.get("videoId", "")
+    if not vid_id:
+        return None
+
+    title = ""
+    title_runs = renderer.get("title", {}).get("runs", [])
+    if title_runs:
+        title = title_runs[0].get("text", "")
+
+    owner_runs = renderer.get("ownerText", {}).get("runs")
+    author = owner_runs[0].get("text", "") if owner_runs else ""
+
+    view_text = renderer.get("viewCountText", {}).get("simpleText", "0")
+    views = _parse_view_count(view_text)
+
+    published = renderer.get("publishedTimeText", {}).get("simpleText", "")
+
+    return {
+        "platform": "youtube",
+        "author": author,
+        "text": title,
+        "url": f"https://youtube.com/watch?v={vid_id}",
+        "likes": views,
+        "retweets": 0,
+        "created_at": normalize_date(published),
+        "views": views,
+    }
 
 
 def _parse_view_count(text):
@@ -346,8 +346,9 @@ async function loadCosts() {
         const costs = await fetch('/api/costs').then(r => r.json());
         const el = document.getElementById('cost-indicator');
         if (el && costs) {
-            el.textContent = `$${costs.estimated_month_usd.toFixed(2)} este mes`;
-            el.title = `Total: $${costs.estimated_total_usd.toFixed(2)} | ${costs.total_scans} escaneos | ${costs.total_items} items`;
+            el.textContent = `$${costs.month_usd.toFixed(2)} este mes`;
+            el.title = `Hoy: $${costs.today_usd.toFixed(2)} | Total: $${costs.total_usd.toFixed(2)} | ${costs.total_scans} escaneos | ${costs.total_items} items`
+                + (costs.budget && costs.budget.state !== 'ok' ? ` | Presupuesto: ${Math.round(costs.budget.usage_ratio * 100)}%` : '');
             el.classList.remove('hidden');
         }
     } catch (e) {}
@@ -1013,6 +1014,7 @@ function renderAlerts(items) {
                                 ${sourcesHtml}
                                 <div class="flex items-center gap-3 mt-2 flex-wrap">
                                     <span class="text-[10px] text-gray-600">Detectado: ${formatDate(item.created_at)}</span>
+                                    ${item.occurrences > 1 ? `<span class="text-[10px] text-gray-600">Visto ${item.occurrences} veces, ultima ${formatDate(item.last_seen_at)}</span>` : ''}
                                     ${articleDatesHtml}
                                     ${!item.read ? `<button onclick="markAlertRead(${item.id})" class="text-xs text-accent hover:underline touch-target">Marcar leida</button>` : ''}
                                     <button onclick="dismissAlert(${item.id})" class="text-xs text-red-400 hover:underline touch-target">Descartar</button>
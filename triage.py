@@ -0,0 +1,309 @@
+"""Local relevance/sentiment triage in front of GPT.
+
+Two logistic regressions over hashed features (word 1-2 grams and character
+4-grams of the analyzer prompt line, with the player's name, surname and
+club replaced by placeholder tokens so one model serves the whole roster):
+
+- relevance: P(item is about the player)
+- neutral:   P(sentiment_label == "neutro"), trained on relevant items
+
+They are trained on the GPT verdicts stored in analysis_cache (the only place
+irrelevant items are kept) and saved to TRIAGE_MODEL_PATH. analyze_batch
+calls classify(): items with P(irrelevant) >= TRIAGE_DROP_THRESHOLD are
+dropped, relevant items with P(neutral) >= TRIAGE_NEUTRAL_THRESHOLD are
+labelled neutral locally (no topics/brands), everything else goes to GPT.
+
+    python triage.py train                      # train + save from the DB
+    python triage.py eval [--drop 0.95 --neutral 0.9]   # holdout report
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import re
+import unicodedata
+import zlib
+from datetime import datetime
+
+import db
+from config import (
+    TRIAGE_ENABLED, TRIAGE_MODEL_PATH, TRIAGE_DROP_THRESHOLD, TRIAGE_NEUTRAL_THRESHOLD,
+    TRIAGE_MIN_SAMPLES,
+)
+
+log = logging.getLogger("agentradar")
+
+N_FEATURES = 1 << 18
+EPOCHS = 6
+L2 = 1e-6
+
+triage_stats = {"items": 0, "dropped": 0, "neutral": 0, "escalated": 0}
+
+_URL_RE = re.compile(r"https?://\S+")
+_WORD_RE = re.compile(r"\w+")
+
+
+def _fold(text):
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def features(line, player_name, club):
+    """Sorted hashed feature indexes of a prompt line (index 0 is the bias)."""
+    text = " " + " ".join(_URL_RE.sub(" ", _fold(line)).split()) + " "
+    name = _fold(player_name or "").strip()
+    if name:
+        text = text.replace(name, " __player__ ")
+        surname = name.split()[-1]
+        if len(surname) > 3:
+            text = re.sub(rf"\b{re.escape(surname)}\b", " __surname__ ", text)
+    club = _fold(club or "").strip()
+    if club:
+        text = text.replace(club, " __club__ ")
+
+    words = _WORD_RE.findall(text)
+    grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    compact = " ".join(words)[:400]
+    grams += ["#" + compact[i:i + 4] for i in range(len(compact) - 3)]
+    return sorted({0} | {zlib.crc32(g.encode("utf-8")) % (N_FEATURES - 1) + 1 for g in grams})
+
+
+def _sigmoid(z):
+    if z < -30:
+        return 0.0
+    if z > 30:
+        return 1.0
+    return 1.0 / (1.0 + math.exp(-z))
+
+
+class LogisticModel:
+    def __init__(self, weights=None):
+        self.w = weights or {}
+
+    def predict(self, feats):
+        w = self.w
+        return _sigmoid(sum(w.get(f, 0.0) for f in feats))
+
+    def fit(self, samples, epochs=EPOCHS, seed=7):
+        """SGD with a decaying learning rate and class-balanced sample weights."""
+        samples = list(samples)
+        positives = sum(y for _, y in samples) or 1
+        negatives = (len(samples) - positives) or 1
+        weight = {1: len(samples) / (2 * positives), 0: len(samples) / (2 * negatives)}
+        rnd = random.Random(seed)
+        w = self.w
+        step = 0
+        for _ in range(epochs):
+            rnd.shuffle(samples)
+            for feats, y in samples:
+                step += 1
+                lr = 0.5 / (1 + step * 1e-4)
+                grad = (_sigmoid(sum(w.get(f, 0.0) for f in feats)) - y) * weight[y]
+                scale = lr / math.sqrt(len(feats))
+                for f in feats:
+                    w[f] = w.get(f, 0.0) * (1 - lr * L2) - scale * grad
+        self.w = {f: v for f, v in w.items() if abs(v) > 1e-4}
+        return self
+
+
+class TriageModel:
+    def __init__(self, relevance, neutral, meta=None):
+        self.relevance = relevance
+        self.neutral = neutral
+        self.meta = meta or {}
+
+    def scores(self, line, player_name, club):
+        """(P(relevant), P(neutral))."""
+        feats = features(line, player_name, club)
+        return self.relevance.predict(feats), self.neutral.predict(feats)
+
+    def save(self, path=TRIAGE_MODEL_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({
+                "meta": self.meta,
+                "relevance": {str(k): round(v, 5) for k, v in self.relevance.w.items()},
+                "neutral": {str(k): round(v, 5) for k, v in self.neutral.w.items()},
+            }, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=TRIAGE_MODEL_PATH):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(
+            LogisticModel({int(k): v for k, v in data["relevance"].items()}),
+            LogisticModel({int(k): v for k, v in data["neutral"].items()}),
+            data.get("meta"),
+        )
+
+
+def decide(p_relevant, p_neutral, drop_threshold=TRIAGE_DROP_THRESHOLD,
+           neutral_threshold=TRIAGE_NEUTRAL_THRESHOLD):
+    """"drop", "neutral" or None (escalate to GPT)."""
+    if 1 - p_relevant >= drop_threshold:
+        return "drop"
+    if p_relevant >= neutral_threshold and p_neutral >= neutral_threshold:
+        return "neutral"
+    return None
+
+
+# ── Training data ──
+
+def _samples(rows):
+    """[(feats, relevant, neutral|None)] from get_triage_training_rows() output."""
+    out = []
+    for player, text, result in rows:
+        name, _, club = player.partition("|")
+        relevant = bool(result.get("relevant", True))
+        neutral = (result.get("sentiment_label") == "neutro") if relevant else None
+        out.append((features(text, name, club), int(relevant), neutral))
+    return out
+
+
+def _split(rows, holdout=0.2):
+    """Deterministic train/holdout split on the item text."""
+    train, test = [], []
+    for row in rows:
+        (test if zlib.crc32(row[1].encode("utf-8")) % 100 < holdout * 100 else train).append(row)
+    return train, test
+
+
+def train_model(rows):
+    """Fit both models on rows; module-level so it can run in the process pool."""
+    samples = _samples(rows)
+    relevance = LogisticModel().fit([(f, r) for f, r, _ in samples])
+    neutral = LogisticModel().fit([(f, int(n)) for f, r, n in samples if r])
+    return TriageModel(relevance, neutral, {
+        "trained_at": datetime.now().isoformat(),
+        "samples": len(samples),
+        "irrelevant": sum(1 for _, r, _ in samples if not r),
+    })
+
+
+def evaluate(rows, thresholds=((0.9, 0.85), (0.95, 0.9), (0.98, 0.95))):
+    """Train on 80% of rows and report triage outcomes on the other 20%."""
+    train, test = _split(rows)
+    model = train_model(train)
+    test_samples = _samples(test)
+    scored = [(model.relevance.predict(f), model.neutral.predict(f), r, n) for f, r, n in test_samples]
+
+    report = {"train": len(train), "test": len(test), "thresholds": []}
+    for drop_t, neutral_t in thresholds:
+        dropped = lost = labelled = mislabelled = 0
+        for p_rel, p_neu, relevant, neutral in scored:
+            action = decide(p_rel, p_neu, drop_t, neutral_t)
+            if action == "drop":
+                dropped += 1
+                lost += relevant  # GPT would have kept it
+            elif action == "neutral":
+                labelled += 1
+                mislabelled += (not relevant) or (not neutral)
+        n = len(scored) or 1
+        report["thresholds"].append({
+            "drop": drop_t,
+            "neutral": neutral_t,
+            "handled_locally": round((dropped + labelled) / n, 3),
+            "dropped": dropped,
+            "dropped_but_relevant": lost,
+            "drop_precision": round(1 - lost / dropped, 3) if dropped else None,
+            "labelled_neutral": labelled,
+            "neutral_precision": round(1 - mislabelled / labelled, 3) if labelled else None,
+        })
+    return report
+
+
+# ── Runtime ──
+
+_model = None
+_model_mtime = None
+
+
+def get_model():
+    """The saved model, reloaded when the file changes; None if not trained yet."""
+    global _model, _model_mtime
+    try:
+        mtime = os.path.getmtime(TRIAGE_MODEL_PATH)
+    except OSError:
+        return None
+    if mtime != _model_mtime:
+        try:
+            _model = TriageModel.load(TRIAGE_MODEL_PATH)
+            _model_mtime = mtime
+        except Exception as e:
+            log.error(f"[triage] Could not load model: {e}")
+            return None
+    return _model
+
+
+def classify(lines, player_name, club):
+    """Local verdicts for {content_hash: prompt line}: {content_hash: analysis} for
+    the items triage is confident about; the rest are left for GPT."""
+    model = get_model() if TRIAGE_ENABLED else None
+    if model is None or not lines:
+        return {}
+
+    local = {}
+    for h, line in lines.items():
+        action = decide(*model.scores(line, player_name, club))
+        if action == "drop":
+            local[h] = {"relevant": False, "sentiment": 0, "sentiment_label": "neutro", "topics": [], "brands": []}
+        elif action == "neutral":
+            local[h] = {"relevant": True, "sentiment": 0, "sentiment_label": "neutro", "topics": [], "brands": []}
+
+    dropped = sum(1 for a in local.values() if not a["relevant"])
+    triage_stats["items"] += len(lines)
+    triage_stats["dropped"] += dropped
+    triage_stats["neutral"] += len(local) - dropped
+    triage_stats["escalated"] += len(lines) - len(local)
+    if local:
+        log.info(f"[triage] {player_name}: {dropped} dropped, {len(local) - dropped} neutral, "
+                 f"{len(lines) - len(local)} to GPT")
+    return local
+
+
+async def retrain():
+    """Retrain from the DB and save (skipped below TRIAGE_MIN_SAMPLES). Returns meta or None."""
+    from scrapers import parsing
+    rows = await db.get_triage_training_rows()
+    if len(rows) < TRIAGE_MIN_SAMPLES:
+        log.info(f"[triage] {len(rows)} labelled items, need {TRIAGE_MIN_SAMPLES} to train")
+        return None
+    model = await parsing.in_process(train_model, rows)
+    model.save()
+    log.info(f"[triage] Model trained on {model.meta['samples']} items ({model.meta['irrelevant']} irrelevant)")
+    return model.meta
+
+
+async def _main(args):
+    await db.init_db()
+    if args.command == "train":
+        meta = await retrain()
+        print(json.dumps(meta, indent=2) if meta else "Not enough labelled items yet")
+        return
+
+    rows = await db.get_triage_training_rows()
+    if len(rows) < 50:
+        print(f"Only {len(rows)} labelled items in analysis_cache")
+        return
+    thresholds = ((args.drop, args.neutral),) if args.drop else ((0.9, 0.85), (0.95, 0.9), (0.98, 0.95))
+    report = evaluate(rows, thresholds)
+    print(f"train {report['train']}  holdout {report['test']}")
+    print(f"{'drop':>5} {'neutral':>7} {'local':>6} {'dropped':>8} {'lost':>5} {'drop prec':>9} "
+          f"{'neutral':>8} {'neu prec':>8}")
+    for t in report["thresholds"]:
+        print(f"{t['drop']:>5} {t['neutral']:>7} {t['handled_locally']:>6.1%} {t['dropped']:>8} "
+              f"{t['dropped_but_relevant']:>5} {t['drop_precision'] if t['drop_precision'] is not None else '-':>9} "
+              f"{t['labelled_neutral']:>8} {t['neutral_precision'] if t['neutral_precision'] is not None else '-':>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local triage model for analyze_batch")
+    parser.add_argument("command", choices=["train", "eval"])
+    parser.add_argument("--drop", type=float, help="P(irrelevant) threshold to evaluate")
+    parser.add_argument("--neutral", type=float, default=TRIAGE_NEUTRAL_THRESHOLD)
+    asyncio.run(_main(parser.parse_args()))